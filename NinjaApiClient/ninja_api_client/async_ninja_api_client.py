@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import struct
+
+from abc import ABC, abstractmethod
+from typing import Optional
+
+import NinjaApiMessages_pb2
+from ninja_api_client import HEARTBEAT_FRAME, MessageDispatcher, frame_msg
+from frame_buffer import peek_header
+
+
+class AsyncNinjaApiClient(MessageDispatcher, ABC):
+    """
+    asyncio counterpart of NinjaApiClient. Any number of these can share one
+    event loop: receiving, heartbeats and order sending are coroutines/tasks
+    instead of a thread per connection.
+    """
+
+    def __init__(self, host: str, port: int):
+        super().__init__()
+        self.connected = False
+        self.host = host
+        self.port = port
+        self.heartbeat_interval = 5  # seconds
+        self.disconnected_at = None  # only set by transports that reconnect
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def connect(self):
+        try:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        except:
+            logging.exception(
+                f"Failed to connect Ninja API endpoint at {self.host}:{self.port}"
+            )
+            return
+        self.connected = True
+        self.hb_task = asyncio.create_task(self.send_heartbeats())
+
+    async def disconnect(self):
+        # Also reached when the server or a send drops the connection, and the
+        # asyncio clients do not reconnect
+        if not self.connected:
+            return
+        self.connected = False
+        self.hb_task.cancel()
+        self.writer.close()
+        self.on_connection_lost()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+
+    def on_connection_lost(self):
+        # Invalidate state that is stale once the connection is gone
+        pass
+
+    def send_msg(self, container: NinjaApiMessages_pb2.MsgContainer):
+        # Buffers the frame on the transport without blocking; await drain()
+        # to wait until the transport has flushed below its high-water mark.
+        if not self.connected:
+            logging.error("Not connected. Cannot send messages.")
+            return
+        self.writer.write(frame_msg(container))
+        self.last_send_time = asyncio.get_running_loop().time()
+
+    async def drain(self):
+        if not self.connected:
+            return
+        try:
+            await self.writer.drain()
+        except:
+            logging.exception("Failed sending message. Disconnecting client.")
+            await self.disconnect()
+
+    def transport_summary(self) -> str:
+        queued = self.writer.transport.get_write_buffer_size() if self.writer else 0
+        return f"{queued} bytes queued on the transport"
+
+    async def recv_msg(self) -> Optional[NinjaApiMessages_pb2.MsgContainer]:
+        frame = await self.recv_frame()
+        if frame is None:
+            return None
+        container = NinjaApiMessages_pb2.MsgContainer()
+        container.header.msgType = frame[0]
+        container.payload = bytes(frame[1])
+        return container
+
+    async def recv_frame(self):
+        # Next (msg_type, payload) for which a handler is registered, decoding
+        # only the header; other frames are counted and dropped
+        if not self.connected:
+            logging.error("Not connected. Cannot receive messages.")
+            return None
+        frame_size = struct.calcsize("i")
+        while True:
+            try:
+                frame = await self.reader.readexactly(frame_size)
+                msg_size = struct.unpack("i", frame)[0]
+                msg = await self.reader.readexactly(msg_size)
+            except asyncio.IncompleteReadError:
+                if self.connected:
+                    logging.info("Server disconnected")
+                    await self.disconnect()
+                return None
+            except asyncio.CancelledError:
+                raise
+            except:
+                logging.exception("Receive error. Disconnecting client.")
+                await self.disconnect()
+                return None
+            msg_type, payload = peek_header(memoryview(msg))
+            if self.wants(msg_type):
+                return msg_type, payload
+
+    async def receive_loop(self):
+        # Handlers run inline on the event loop, so they must not block
+        while self.connected:
+            frame = await self.recv_frame()
+            if frame is None:
+                break
+            self.dispatch(*frame)
+
+    async def send_heartbeats(self):
+        # Only idle sessions need a heartbeat; any other frame resets the clock
+        loop = asyncio.get_running_loop()
+        self.last_send_time = loop.time()
+        while self.connected:
+            idle = loop.time() - self.last_send_time
+            if idle < self.heartbeat_interval:
+                await asyncio.sleep(self.heartbeat_interval - idle)
+                continue
+            self.writer.write(HEARTBEAT_FRAME)
+            self.last_send_time = loop.time()
+            await self.drain()
+
+    @abstractmethod
+    async def run(self):
+        pass
@@ -0,0 +1,68 @@
+import asyncio
+import inspect
+
+import clients
+
+from async_ninja_api_client import AsyncNinjaApiClient
+from positions_client import PositionsSession
+from config import settings
+from datetime import datetime, timedelta
+
+
+class AsyncPositionsClient(PositionsSession, AsyncNinjaApiClient):
+    def __init__(self):
+        AsyncNinjaApiClient.__init__(
+            self, settings.positions_host, settings.positions_port
+        )
+        self.init_session()
+
+    def flatten_on_boot(self, positions):
+        # Handlers run on the event loop, so the flatten runs as its own task
+        asyncio.create_task(self.async_flatten_on_boot(list(positions)))
+
+    async def async_flatten_on_boot(self, positions):
+        for position in positions:
+            if position.totalPos == 0:
+                continue
+            product = position.contract.secDesc
+            quote = clients.tradingClient.snapshot(product)
+            while (quote.ask if position.totalPos < 0 else quote.bid) is None:
+                quote = await clients.tradingClient.wait_for_update(product, quote.seq)
+            price = quote.ask if position.totalPos < 0 else quote.bid
+            sent = clients.tradingClient.order(
+                account=position.account,
+                product=product,
+                price=price,
+                qty=-1 * position.totalPos,
+                worker="w",
+                exchange=position.contract.exchange,
+                tag="FLATTEN_PROGRAMSTART",
+            )
+            if inspect.isawaitable(sent):
+                await sent
+            await asyncio.sleep(0.1)
+
+    async def run(self):
+        await self.connect()
+        if not self.connected:
+            return
+        self.send_msg(self.login_msg())
+        await self.drain()
+
+        receiver = asyncio.create_task(self.receive_loop())
+        while self.connected:
+            if (
+                datetime.now() > self.lastTime + timedelta(milliseconds=25)
+                and len(self.products) > 0
+                and len(self.accounts) > 0
+            ):
+                self.get_all_positions()
+                await self.drain()
+                self.lastTime = datetime.now()
+            timeout = (
+                self.lastTime + timedelta(milliseconds=25) - datetime.now()
+            ).total_seconds()
+            await asyncio.sleep(max(timeout, 0))
+
+        receiver.cancel()
+        await self.disconnect()
@@ -0,0 +1,171 @@
+from async_ninja_api_client import AsyncNinjaApiClient
+from trading_client import TradingSession
+from config import settings
+
+import NinjaApiCommon_pb2
+
+from datetime import datetime, timedelta
+import asyncio
+
+
+class AsyncTradingClient(TradingSession, AsyncNinjaApiClient):
+
+    def __init__(self):
+        AsyncNinjaApiClient.__init__(self, settings.trading_host, settings.trading_port)
+        self.init_session()
+
+    """
+    Get latest market values without waiting, None until the first update
+    arrives. The threaded client's wait for data would stall the event loop.
+    Parameters:
+        product (str): The symbol or product name being traded (e.g., 'ESU5').
+    """
+
+    def get_bid(self, product, timeout=None):
+        return self.market_data.state(product).bid
+
+    def get_ask(self, product, timeout=None):
+        return self.market_data.state(product).ask
+
+    def get_high(self, product, timeout=None):
+        return self.market_data.state(product).high
+
+    def get_low(self, product, timeout=None):
+        return self.market_data.state(product).low
+
+    def get_trade_price(self, product, timeout=None):
+        return self.market_data.state(product).trade_price
+
+    def get_volume(self, product, timeout=None):
+        return self.market_data.state(product).volume
+
+    """
+    Wait without blocking the event loop until a market update newer than
+    after_seq arrives.
+    Parameters: same as TradingClient.wait_for_update
+    Returns:
+        MarketSnapshot, its seq is still after_seq if the wait timed out
+    """
+
+    async def wait_for_update(self, product, after_seq=None, timeout=None):
+        return await self.market_data.wait_for_update_async(product, after_seq, timeout)
+
+    """
+    Submit an order to the specified exchange. Awaiting it waits until the
+    order has been handed to the transport; await the returned handle for the
+    server's answer.
+    Parameters: same as TradingClient.order
+    Returns:
+        OrderHandle
+    """
+
+    async def order(
+        self,
+        account,
+        product,
+        price,
+        qty,
+        worker="w",
+        exchange=NinjaApiCommon_pb2.Exchange.CME,
+        tag="",
+        ticks=None,
+        urgent=False,
+    ):
+        await self.throttle.acquire_async(urgent)
+        handle = self.send_order(
+            account, product, price, qty, worker, exchange, tag, ticks, urgent
+        )
+        await self.drain()
+        return handle
+
+    """
+    Cancels ALL working orders and submits market order to flatten at the specifed price.
+    Parameters: same as TradingClient.flatten
+    Returns:
+        OrderHandle of the flattening order
+    """
+
+    async def flatten(
+        self,
+        account,
+        product,
+        price,
+        qty,
+        worker="w",
+        exchange=NinjaApiCommon_pb2.Exchange.CME,
+        tag="",
+        ticks=None,
+    ):
+        await self.throttle.acquire_async(urgent=True)
+        await self.throttle.acquire_async(urgent=True)
+        self.send_msg(self.cancel_all_msg(cancelGTCs=True))
+        handle = self.send_order(
+            account, product, price, qty, worker, exchange, tag, ticks, True
+        )
+        await self.drain()
+        return handle
+
+    """
+    Change order according to given parameters
+    Parameters: same as TradingClient.change_order
+    Returns:
+        None
+    """
+
+    async def change_order(
+        self,
+        orderNo,
+        price,
+        qty,
+        worker="w",
+        account="",
+        product="",
+        exchange=1,
+        ticks=None,
+    ):
+        # The token is taken first, the message is built in the shared template
+        # and another coroutine may build its own there while this one waits
+        await self.throttle.acquire_async()
+        msg = self.change_order_msg(orderNo, price, qty, worker, product, ticks)
+        if msg is None:
+            self.throttle.refund()
+            return
+        self.send_msg(msg)
+        await self.drain()
+
+    async def cancel_order(self, orderNo):
+        await self.throttle.acquire_async(urgent=True)
+        self.send_msg(self.cancel_order_msg(orderNo))
+        await self.drain()
+
+    async def mass_cancel(self):
+        await self.throttle.acquire_async(urgent=True)
+        self.send_msg(self.cancel_all_msg())
+        await self.drain()
+
+    async def check_orders(self):
+        self.send_msg(self.active_orders_msg())
+        await self.drain()
+
+    async def run(self):
+        await self.connect()
+        if not self.connected:
+            return
+        self.send_msg(self.login_msg())
+        for container in self.session_msgs():
+            self.send_msg(container)
+        await self.drain()
+
+        receiver = asyncio.create_task(self.receive_loop())
+        while self.connected:
+            if datetime.now() > self.lastPrintTime + timedelta(seconds=60):
+                self.log_summary()
+            reconcile = timedelta(seconds=settings.order_reconcile_interval)
+            if datetime.now() > self.lastOrderCheck + reconcile:
+                await self.check_orders()
+                self.lastOrderCheck = datetime.now()
+            timeout = (self.lastOrderCheck + reconcile - datetime.now()).total_seconds()
+            await asyncio.sleep(max(timeout, 0))
+
+        receiver.cancel()
+        await self.disconnect()
@@ -0,0 +1,259 @@
+import logging
+import threading
+import time
+
+from collections import deque
+from typing import NamedTuple
+
+import numpy as np
+
+from timer_scheduler import timers
+
+
+class Bar(NamedTuple):
+    product: str
+    interval: int  # seconds
+    start: int  # epoch nanoseconds, a multiple of the interval
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: int
+    trades: int  # 0 for a bar without trades, priced at the previous close
+
+
+class OhlcArrays(NamedTuple):
+    start: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+    trades: np.ndarray
+
+
+def ohlc(times, prices, interval, qtys=None) -> OhlcArrays:
+    # Vectorized bars of interval seconds from a non-empty array of trades
+    # sorted by time, one row per interval that has trades
+    times = np.asarray(times, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    qtys = np.zeros(len(times), np.int64) if qtys is None else np.asarray(qtys)
+    span = int(interval * 1e9)
+    buckets = times - times % span
+    firsts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    lasts = np.r_[firsts[1:], len(times)] - 1
+    return OhlcArrays(
+        buckets[firsts],
+        prices[firsts],
+        np.maximum.reduceat(prices, firsts),
+        np.minimum.reduceat(prices, firsts),
+        prices[lasts],
+        np.add.reduceat(qtys, firsts),
+        lasts - firsts + 1,
+    )
+
+
+class OpenBar:
+    __slots__ = ("start", "end", "open", "high", "low", "close", "volume", "trades")
+
+    def __init__(self, start, end, price):
+        self.start = start
+        self.end = end
+        self.open = price
+        self.high = price
+        self.low = price
+        self.close = price
+        self.volume = 0
+        self.trades = 0
+
+
+class BarBuilder:
+    """
+    Streaming OHLCV bars of one product for several intervals, updated in O(1)
+    per trade per interval. Bars are aligned to multiples of the interval
+    since the epoch (a 600 second bar starts on every tenth minute). A timer
+    closes each bar on its boundary by the local clock, so bar-close events
+    are on time even when no trade follows; an interval without trades closes
+    as a flat bar at the previous close. Trades stamped before the open bar
+    (late or clock skewed) are folded into it rather than reopening a bar.
+
+    on_bar listeners run on the market data or timer thread and must be short.
+    """
+
+    def __init__(self, product, intervals=(1, 60, 600), history=1440):
+        self.product = product
+        self.intervals = tuple(sorted(intervals))
+        self.spans = tuple(int(interval * 1e9) for interval in self.intervals)
+        self.current = [None] * len(self.intervals)
+        self.last_start = [None] * len(self.intervals)  # of the last closed bar
+        self.closed = {interval: deque(maxlen=history) for interval in self.intervals}
+        self.last_close = None
+        self.listeners = []
+        self.timers = {}  # interval index -> Timer of its next boundary
+        self.running = False
+        self.lock = threading.Lock()
+
+    def on_bar(self, listener):
+        self.listeners.append(listener)
+
+    def start(self):
+        self.running = True
+        now = time.time_ns()
+        for i, span in enumerate(self.spans):
+            self.arm(i, now - now % span + span)
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            for timer in self.timers.values():
+                timer.cancel()
+
+    def arm(self, i, boundary):
+        delay = max(0.0, (boundary - time.time_ns()) / 1e9)
+        with self.lock:
+            if self.running:
+                self.timers[i] = timers.call_later(
+                    delay, lambda: self.on_boundary(i, boundary)
+                )
+
+    def add_trade(self, time_ns, price, qty):
+        closed = []
+        with self.lock:
+            for i, span in enumerate(self.spans):
+                bar = self.current[i]
+                if bar is None or time_ns >= bar.end:
+                    if bar is not None:
+                        closed.append(self.close(i))
+                    start = time_ns - time_ns % span
+                    if self.last_start[i] is not None:
+                        start = max(start, self.last_start[i] + span)
+                    bar = self.current[i] = OpenBar(start, start + span, price)
+                if price > bar.high:
+                    bar.high = price
+                elif price < bar.low:
+                    bar.low = price
+                bar.close = price
+                bar.volume += qty
+                bar.trades += 1
+            self.last_close = price
+        self.emit(closed)
+
+    def on_boundary(self, i, boundary):
+        # Timer callback: close the bar that ends at boundary, or a flat one
+        closed = []
+        with self.lock:
+            if not self.running:
+                return
+            span = self.spans[i]
+            bar = self.current[i]
+            if bar is not None and bar.end <= boundary:
+                closed.append(self.close(i))
+            elif bar is None and self.last_close is not None:
+                last_start = self.last_start[i]
+                if last_start is None or last_start < boundary - span:
+                    closed.append(self.flat(i, boundary - span))
+        self.emit(closed)
+        self.arm(i, boundary + span)
+
+    def close(self, i) -> Bar:
+        bar = self.current[i]
+        self.current[i] = None
+        self.last_start[i] = bar.start
+        closed = Bar(
+            self.product,
+            self.intervals[i],
+            bar.start,
+            bar.open,
+            bar.high,
+            bar.low,
+            bar.close,
+            bar.volume,
+            bar.trades,
+        )
+        self.closed[closed.interval].append(closed)
+        return closed
+
+    def flat(self, i, start) -> Bar:
+        price = self.last_close
+        self.last_start[i] = start
+        bar = Bar(
+            self.product, self.intervals[i], start, price, price, price, price, 0, 0
+        )
+        self.closed[bar.interval].append(bar)
+        return bar
+
+    def emit(self, bars):
+        for bar in bars:
+            for listener in self.listeners:
+                try:
+                    listener(bar)
+                except:
+                    logging.exception(f"Bar listener {listener} failed")
+
+    """
+    Seed the bars from historical trades, e.g. in an algo warmup before any
+    live trade. Gaps in the history are not filled with flat bars.
+    Parameters:
+        times (array): Trade times in epoch nanoseconds, ascending.
+        prices (array): Trade prices.
+        qtys (array, optional): Trade quantities, volume is 0 without them.
+    """
+
+    def seed(self, times, prices, qtys=None):
+        if len(times) == 0:
+            return
+        now = time.time_ns()
+        with self.lock:
+            for i, (interval, span) in enumerate(zip(self.intervals, self.spans)):
+                columns = ohlc(times, prices, interval, qtys)
+                bars = [
+                    Bar(self.product, interval, *row)
+                    for row in zip(*(column.tolist() for column in columns))
+                ]
+                last = bars[-1]
+                if last.start + span > now:
+                    # still in progress, trades from the feed continue it
+                    bars.pop()
+                    bar = OpenBar(last.start, last.start + span, last.open)
+                    bar.high, bar.low, bar.close = last.high, last.low, last.close
+                    bar.volume, bar.trades = last.volume, last.trades
+                    self.current[i] = bar
+                self.closed[interval].extend(bars)
+                if bars:
+                    self.last_start[i] = bars[-1].start
+            self.last_close = last.close
+
+    """
+    Get the closed bars of an interval
+    Parameters:
+        interval (int): Bar length in seconds, one of the builder's intervals.
+    Returns:
+        list of Bar, oldest first
+    """
+
+    def bars(self, interval):
+        with self.lock:
+            return list(self.closed[interval])
+
+    def last_bar(self, interval):
+        # Latest closed bar of the interval, None before the first one
+        closed = self.closed[interval]
+        return closed[-1] if closed else None
+
+    def current_bar(self, interval):
+        # The bar still in progress, None if it has no trades yet
+        with self.lock:
+            bar = self.current[self.intervals.index(interval)]
+            if bar is None:
+                return None
+            return Bar(
+                self.product,
+                interval,
+                bar.start,
+                bar.open,
+                bar.high,
+                bar.low,
+                bar.close,
+                bar.volume,
+                bar.trades,
+            )
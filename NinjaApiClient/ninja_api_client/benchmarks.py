@@ -0,0 +1,777 @@
+"""
+Microbenchmarks for the client hot paths. They run against local socket pairs
+and synthetic messages, so no Ninja connection or .env is needed:
+
+    python benchmarks.py
+"""
+
+import socket
+import struct
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+import NinjaApiCommon_pb2
+import NinjaApiMarketData_pb2
+import NinjaApiMessages_pb2
+import NinjaApiOrderHandling_pb2
+from bar_builder import BarBuilder
+from contracts import ContractSpec
+from frame_buffer import FrameBuffer, peek_header
+from market_data import MarketData
+from message_pool import MessagePool, OutboundTemplates
+from order_manager import Order, OrderManager, OrderView, index_keys
+from order_throttle import TokenBucket
+from risk_engine import RiskEngine, RiskLimits
+from tick_store import TickStore
+from volatility import RollingVolatility, garman_klass_terms
+from ninja_api_client import NinjaApiClient, frame_msg
+
+
+def sample_market_updates(product="NQU5", trades=3):
+    resp = NinjaApiMarketData_pb2.MarketUpdates()
+    update = resp.marketUpdates.add()
+    update.contract.exchange = NinjaApiCommon_pb2.Exchange.CME
+    update.contract.secDesc = product
+    update.contract.whName = product
+    update.tobUpdate.bidPrice = 2345000
+    update.tobUpdate.askPrice = 2345025
+    update.tobUpdate.bidQty = 3
+    update.tobUpdate.askQty = 4
+    for i in range(trades):
+        trade = update.tradeUpdates.add()
+        trade.tradePrice = 2345000 + 25 * i
+        trade.tradeQty = 1 + i
+        trade.transactTime.timestamp = time.time_ns()
+        trade.sqn = i
+    container = NinjaApiMessages_pb2.MsgContainer()
+    container.header.msgType = NinjaApiMessages_pb2.Header.MARKET_UPDATES
+    container.payload = resp.SerializeToString()
+    return container
+
+
+def framed(container):
+    serialized = container.SerializeToString()
+    return struct.pack("i", len(serialized)) + serialized
+
+
+def feed(frames):
+    # Returns the read end of a socket pair that a background thread fills
+    reader, writer = socket.socketpair()
+
+    def write():
+        writer.sendall(frames)
+        writer.close()
+
+    threading.Thread(target=write, daemon=True).start()
+    return reader
+
+
+def legacy_read(sock, count):
+    # The original recv_msg: two or more recv() calls per frame and bytes
+    # concatenation for the header and body
+    frame_size = struct.calcsize("i")
+    received = 0
+    while received < count:
+        frame = b""
+        msg = b""
+        while len(frame) < frame_size:
+            frame += sock.recv(frame_size - len(frame))
+        msg_size = struct.unpack("i", frame)[0]
+        while len(msg) < msg_size:
+            msg += sock.recv(msg_size - len(msg))
+        container = NinjaApiMessages_pb2.MsgContainer()
+        container.ParseFromString(msg)
+        received += 1
+
+
+def buffered_read(sock, count):
+    rx = FrameBuffer()
+    received = 0
+    while received < count:
+        rx.recv_into(sock)
+        for frame in rx.frames():
+            container = NinjaApiMessages_pb2.MsgContainer()
+            container.ParseFromString(frame)
+            received += 1
+
+
+def bench_framing(count=200_000):
+    frames = framed(sample_market_updates()) * count
+    for name, read in (("legacy recv", legacy_read), ("FrameBuffer", buffered_read)):
+        sock = feed(frames)
+        start = time.perf_counter()
+        read(sock, count)
+        elapsed = time.perf_counter() - start
+        sock.close()
+        print(f"{name:>24}: {count / elapsed:>12,.0f} frames/s")
+
+
+def bench_decode(count=100_000):
+    # Per-frame decode cost of a MARKET_UPDATES frame (handled) and of a frame
+    # nobody handles: full MsgContainer parse versus the header peek
+    frame = memoryview(bytearray(framed(sample_market_updates())[4:]))
+
+    def container_parse():
+        container = NinjaApiMessages_pb2.MsgContainer()
+        container.ParseFromString(frame)
+        resp = NinjaApiMarketData_pb2.MarketUpdates()
+        resp.ParseFromString(container.payload)
+
+    def peek_parse():
+        msg_type, payload = peek_header(frame)
+        resp = NinjaApiMarketData_pb2.MarketUpdates()
+        resp.ParseFromString(payload)
+
+    def container_skip():
+        container = NinjaApiMessages_pb2.MsgContainer()
+        container.ParseFromString(frame)
+        container.header.msgType
+
+    def peek_skip():
+        peek_header(frame)
+
+    for name, decode in (
+        ("container + payload", container_parse),
+        ("peek + payload", peek_parse),
+        ("container, unhandled", container_skip),
+        ("peek, unhandled", peek_skip),
+    ):
+        start = time.perf_counter()
+        for _ in range(count):
+            decode()
+        elapsed = time.perf_counter() - start
+        print(f"{name:>24}: {elapsed / count * 1e6:>9.2f} us/frame")
+
+
+def fresh_order_msg(account, product, price, qty):
+    # TradingSession.order_msg before the outbound templates
+    container = NinjaApiMessages_pb2.MsgContainer()
+    orderadd = NinjaApiOrderHandling_pb2.OrderAdd()
+    orderadd.account = account
+    orderadd.contract.exchange = NinjaApiCommon_pb2.Exchange.CME
+    orderadd.contract.secDesc = product
+    orderadd.contract.whName = product
+    orderadd.timeInForce.type = NinjaApiOrderHandling_pb2.TimeInForce.Type.GTC
+    orderadd.side = NinjaApiCommon_pb2.Side.BUY
+    orderadd.qty = qty
+    orderadd.price = price
+    orderadd.prefix = "w"
+    container.header.msgType = NinjaApiMessages_pb2.Header.ORDER_ADD_REQUEST
+    container.payload = orderadd.SerializeToString()
+    return container
+
+
+def template_order_msg(templates, account, product, price, qty):
+    # TradingSession.order_msg with the per-thread templates
+    orderadd = templates.order_add
+    orderadd.account = account
+    orderadd.contract.exchange = NinjaApiCommon_pb2.Exchange.CME
+    orderadd.contract.secDesc = product
+    orderadd.contract.whName = product
+    orderadd.side = NinjaApiCommon_pb2.Side.BUY
+    orderadd.qty = qty
+    orderadd.price = price
+    orderadd.prefix = "w"
+    return templates.wrap(NinjaApiMessages_pb2.Header.ORDER_ADD_REQUEST, orderadd)
+
+
+def bench_allocations(count=50_000):
+    # Time per message, and tracemalloc peak while building/decoding, with
+    # fresh messages versus pooled/templated ones
+    payload = memoryview(sample_market_updates().payload)
+    pool = MessagePool()
+    templates = OutboundTemplates()
+
+    def fresh_decode():
+        resp = NinjaApiMarketData_pb2.MarketUpdates()
+        resp.ParseFromString(payload)
+
+    def pooled_decode():
+        resp = pool.parse(NinjaApiMarketData_pb2.MarketUpdates, payload)
+        pool.release(resp)
+
+    def fresh_order():
+        frame_msg(fresh_order_msg("FW077", "NQU5", 2345000, 1))
+
+    def template_order():
+        frame_msg(template_order_msg(templates, "FW077", "NQU5", 2345000, 1))
+
+    for name, run in (
+        ("fresh MarketUpdates", fresh_decode),
+        ("pooled MarketUpdates", pooled_decode),
+        ("fresh OrderAdd", fresh_order),
+        ("template OrderAdd", template_order),
+    ):
+        start = time.perf_counter()
+        for _ in range(count):
+            run()
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        for _ in range(count // 10):
+            run()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"{name:>24}: {elapsed / count * 1e6:>8.2f} us/msg, "
+            f"{peak:>8,} bytes peak, {current:>6,} bytes retained"
+        )
+
+
+def bench_market_wait(updates=20_000, consumers=3):
+    # Market data handler throughput while algo threads read the feed, either
+    # polling snapshot() in a loop (the old getters spun the same way) or
+    # parked in wait_for_update(). Reports reader loop counts and CPU time.
+    payload = memoryview(sample_market_updates().payload)
+    for name, blocking in (("polling readers", False), ("wait_for_update", True)):
+        market_data = MarketData({"NQU5": NinjaApiCommon_pb2.Exchange.CME})
+        done = threading.Event()
+        loops = [0] * consumers
+        cpu = [0.0] * consumers
+
+        def read(i):
+            seq = 0
+            while not done.is_set():
+                if blocking:
+                    seq = market_data.wait_for_update("NQU5", seq, timeout=0.1).seq
+                else:
+                    seq = market_data.snapshot("NQU5").seq
+                loops[i] += 1
+            cpu[i] = time.thread_time()
+
+        threads = [
+            threading.Thread(target=read, args=(i,), daemon=True)
+            for i in range(consumers)
+        ]
+        for thread in threads:
+            thread.start()
+        start = time.perf_counter()
+        for _ in range(updates):
+            market_data.on_market_updates(payload)
+        elapsed = time.perf_counter() - start
+        done.set()
+        market_data.notify()
+        for thread in threads:
+            thread.join()
+        print(
+            f"{name:>24}: {updates / elapsed:>9,.0f} updates/s, "
+            f"{sum(loops):>10,} reader loops, {sum(cpu):>6.2f} s reader CPU"
+        )
+
+
+def bench_bus(updates=1_000, interval=0.002):
+    # How long after a market update an algo reacts: polling snapshot() with
+    # the old sleep(0.1) loop versus a bus subscription callback. Then feed
+    # throughput with a consumer that is slower than the feed.
+    payload = memoryview(sample_market_updates().payload)
+    market_data = MarketData({"NQU5": NinjaApiCommon_pb2.Exchange.CME})
+    published = []
+    done = threading.Event()
+    polled = []
+    pushed = []
+
+    def poll():
+        seen = 0
+        while not done.is_set():
+            seq = market_data.snapshot("NQU5").seq
+            now = time.perf_counter()
+            while seen < seq // 2:
+                polled.append(now - published[seen])
+                seen += 1
+            time.sleep(0.1)
+
+    def on_tob(tob):
+        pushed.append(time.perf_counter() - published[len(pushed)])
+
+    threading.Thread(target=poll, daemon=True).start()
+    subscription = market_data.bus.subscribe("NQU5", on_tob, maxsize=updates)
+    for _ in range(updates):
+        published.append(time.perf_counter())
+        market_data.on_market_updates(payload)
+        time.sleep(interval)
+    time.sleep(0.2)
+    done.set()
+    market_data.bus.unsubscribe(subscription)
+    for name, latencies in (("sleep(0.1) polling", polled), ("bus callback", pushed)):
+        latencies = sorted(latencies)
+        print(
+            f"{name:>24}: median {latencies[len(latencies) // 2] * 1e3:>8.3f} ms, "
+            f"max {latencies[-1] * 1e3:>8.3f} ms to react to {len(latencies)} updates"
+        )
+
+    for name, options in (
+        ("no slow consumer", None),
+        ("slow, bounded queue", {"maxsize": 256}),
+        ("slow, conflated", {"conflate": True}),
+    ):
+        market_data = MarketData({"NQU5": NinjaApiCommon_pb2.Exchange.CME})
+        if options is not None:
+            subscription = market_data.bus.subscribe(
+                "NQU5", lambda tob: time.sleep(0.001), **options
+            )
+        start = time.perf_counter()
+        for _ in range(updates * 10):
+            market_data.on_market_updates(payload)
+        elapsed = time.perf_counter() - start
+        summary = ""
+        if options is not None:
+            market_data.bus.unsubscribe(subscription)
+            summary = f", {subscription.summary()}"
+        print(f"{name:>24}: {updates * 10 / elapsed:>9,.0f} updates/s{summary}")
+
+
+def bench_tick_store(rows=500_000, window=100_000):
+    # Append cost per trade, then a windowed query over the latest rows from
+    # the ring (views) versus copying the same rows out of a python list
+    ring = TickStore(max_capacity=rows).trades("NQU5")
+    start = time.perf_counter()
+    for i in range(rows):
+        ring.append(i * 1000, 2345000.0 + i % 40, 1, 1, i, 2345000.0, 2345025.0)
+    elapsed = time.perf_counter() - start
+    print(f"{'ring append':>24}: {elapsed / rows * 1e9:>9.0f} ns/trade")
+    prices = [2345000.0 + i % 40 for i in range(rows)]
+    since = (rows - window) * 1000
+    for name, query in (
+        ("list slice copy", lambda: np.asarray(prices[-window:]).max()),
+        ("ring since() view", lambda: ring.since(since).price.max()),
+    ):
+        start = time.perf_counter()
+        for _ in range(100):
+            query()
+        elapsed = time.perf_counter() - start
+        print(f"{name:>24}: {elapsed / 100 * 1e6:>9.1f} us per {window:,} row max")
+
+
+def bench_bars(trades=400_000):
+    # Per trade cost of keeping 1s/1m/10m bars incrementally (spread over the
+    # feed thread), versus the delay of rebuilding the last hour of minute bars
+    # from ticks on the algo thread at every new minute
+    times = np.arange(trades, dtype=np.int64) * 10_000_000  # 100 trades/s
+    prices = 2345000.0 + np.arange(trades) % 40 * 25
+    builder = BarBuilder("NQU5", (1, 60, 600))
+    start = time.perf_counter()
+    for time_ns, price in zip(times.tolist(), prices.tolist()):
+        builder.add_trade(time_ns, price, 1)
+    elapsed = time.perf_counter() - start
+    print(f"{'incremental bars':>24}: {elapsed / trades * 1e9:>9.0f} ns/trade")
+    start = time.perf_counter()
+    for _ in range(10):
+        BarBuilder("NQU5", (60,)).seed(times[-360_000:], prices[-360_000:])
+    elapsed = time.perf_counter() - start
+    print(f"{'hourly rebuild':>24}: {elapsed / 10 * 1e3:>9.2f} ms at each minute")
+
+
+def bench_volatility(trades=500_000, window=60):
+    # Vectorized warmup from raw trades, then the cost of a rolling 60 bar
+    # Garman-Klass value per new bar: O(1) update versus recomputing the window
+    rng = np.random.default_rng(1)
+    times = np.arange(trades, dtype=np.int64) * 100_000_000  # 10 trades/s
+    prices = 2345000.0 * np.exp(np.cumsum(rng.normal(0, 1e-4, trades)))
+    start = time.perf_counter()
+    volatility = RollingVolatility.from_trades(times, prices, 60, window)
+    elapsed = time.perf_counter() - start
+    print(f"{'from_trades warmup':>24}: {elapsed * 1e3:>9.2f} ms for {trades:,} trades")
+    bars = [
+        (o, h, l, c) for o, h, l, c in zip(*rng.uniform(99, 101, (4, 10_000)).tolist())
+    ]
+    bars = [(o, max(o, h, l, c), min(o, h, l, c), c) for o, h, l, c in bars]
+    start = time.perf_counter()
+    for bar in bars:
+        volatility.add(*bar)
+        volatility.garman_klass_vol
+    incremental = time.perf_counter() - start
+    history = np.array(bars)
+    start = time.perf_counter()
+    for i in range(len(bars)):
+        o, h, l, c = history[max(0, i - window + 1) : i + 1].T
+        np.sqrt(garman_klass_terms(o, h, l, c).mean())
+    recompute = time.perf_counter() - start
+    for name, elapsed in (
+        ("incremental", incremental),
+        ("window recompute", recompute),
+    ):
+        print(f"{name:>24}: {elapsed / len(bars) * 1e6:>9.2f} us per bar")
+
+
+def bench_cadence(updates=20_000, work=0.0005):
+    # A consumer needing 0.5 ms per callback behind a burst of updates, 0.2 s
+    # after the burst: per tick it is still working through its queue, which
+    # dropped events (and volume), with a 50 ms cadence it has seen it all
+    market_data = MarketData({"NQU5": NinjaApiCommon_pb2.Exchange.CME})
+    payload = sample_market_updates().payload
+    for name, cadence in (("every tick", 0.0), ("50 ms cadence", 0.05)):
+        volume = [0]
+
+        def on_trade(trade, volume=volume):
+            volume[0] += trade.qty
+            time.sleep(work)
+
+        subscription = market_data.bus.subscribe(
+            "NQU5", lambda tob: time.sleep(work), on_trade, cadence=cadence
+        )
+        start = time.perf_counter()
+        for _ in range(updates):
+            market_data.on_market_updates(payload)
+        feed = time.perf_counter() - start
+        time.sleep(0.2)
+        market_data.bus.unsubscribe(subscription)
+        seen = volume[0]
+        print(
+            f"{name:>24}: feed {feed / updates * 1e6:>6.2f} us per update, "
+            f"{subscription.delivered:>6,} callbacks ({subscription.ratio():.0f}:1), "
+            f"volume {seen:,} of {updates * 6:,}"
+        )
+
+
+def bench_orders(events=50_000, working=20, poll=0.05, reconcile=1.0):
+    # Order state freshness: applying each order event as it arrives against
+    # waiting for the next ACTIVE_ORDERS poll, which is half a poll interval
+    # old on average, plus the requests it costs per second
+    manager = OrderManager()
+    changes = []
+    for i in range(events):
+        change = NinjaApiOrderHandling_pb2.OrderChangeEvent()
+        change.orderNo = str(i % working)
+        change.contract.secDesc = "NQU5"
+        change.side = NinjaApiCommon_pb2.Side.BUY
+        change.qty = 1
+        change.price = 2345000 + 25 * (i % 7)
+        changes.append(change)
+    start = time.perf_counter()
+    for change in changes:
+        manager.on_change(change)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{'event sourced':>24}: {elapsed / events * 1e6:>9.2f} us to apply an event, "
+        f"{1 / reconcile:.0f} ACTIVE_ORDERS requests per second"
+    )
+    print(
+        f"{'polled':>24}: {poll / 2 * 1e6:>9.0f} us old on average, "
+        f"{1 / poll:.0f} ACTIVE_ORDERS requests per second"
+    )
+
+
+def bench_order_acks(orders=20_000, acks=100, answer=0.002, sleep=0.6):
+    # Time before an algo can act on an order it placed: waiting on the
+    # OrderHandle for a server that answers after answer seconds, against the
+    # fixed sleep RB used, plus what tracking and matching cost per order
+    # (each order is canceled again, so few orders are working)
+    manager = OrderManager()
+    orderadd = OutboundTemplates().order_add
+    orderadd.account = "FW078"
+    orderadd.contract.secDesc = "NQU5"
+    orderadd.side = NinjaApiCommon_pb2.Side.BUY
+    orderadd.qty = 1
+    events = []
+    for i in range(orders):
+        event = NinjaApiOrderHandling_pb2.OrderAddEvent()
+        event.orderNo = str(i)
+        event.account = orderadd.account
+        event.contract.secDesc = orderadd.contract.secDesc
+        event.side = orderadd.side
+        event.qty = orderadd.qty
+        event.price = 2345000 + 25 * (i % 5)
+        events.append(event)
+    cancel = NinjaApiOrderHandling_pb2.OrderCancelEvent()
+    start = time.perf_counter()
+    for event in events:
+        orderadd.price = event.price
+        manager.track(orderadd)
+        manager.on_add(event)
+        cancel.orderNo = event.orderNo
+        manager.on_cancel(cancel)
+    elapsed = time.perf_counter() - start
+    waited = 0.0
+    for event in events[:acks]:
+        orderadd.price = event.price
+        handle = manager.track(orderadd)
+        threading.Timer(answer, manager.on_add, (event,)).start()
+        start = time.perf_counter()
+        handle.wait(1)
+        waited += time.perf_counter() - start
+    print(
+        f"{'order handle':>24}: {waited / acks * 1e3:>9.3f} ms to act on an ack "
+        f"sent after {answer * 1e3:g} ms, {elapsed / orders * 1e6:.2f} us to track, match and cancel"
+    )
+    print(f"{'fixed sleep':>24}: {sleep * 1e3:>9.3f} ms to act on any order")
+
+
+def bench_order_lookup(working=2_000, accounts=100, lookups=20_000):
+    # An algo finding its orders in a shared book: the linear scan over a copy
+    # of activeOrders the algos did on every pass, against the indexes
+    manager = OrderManager()
+    sides = (NinjaApiCommon_pb2.Side.BUY, NinjaApiCommon_pb2.Side.SELL)
+    for i in range(working):
+        order = Order(
+            str(i),
+            "NQU5",
+            1,
+            sides[i % 2],
+            1,
+            2345000.0,
+            "GD"[i % 3 % 2],
+            f"A{i % accounts}",
+            "",
+        )
+        manager.put(order)
+    account = "A7"
+    start = time.perf_counter()
+    for _ in range(lookups):
+        for order in list(manager.active.values()):
+            if order.account == account and order.side == sides[0]:
+                found = order
+    scan = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(lookups):
+        for order in manager.for_contract(account, "NQU5", sides[0]).values():
+            found = order
+    indexed = time.perf_counter() - start
+    print(
+        f"{'indexed':>24}: {indexed / lookups * 1e6:>9.2f} us per lookup "
+        f"in {working} working orders"
+    )
+    print(f"{'scan':>24}: {scan / lookups * 1e6:>9.2f} us per lookup")
+
+
+def bench_order_events(books=(100, 2_000, 20_000), accounts=300, events=2_000):
+    # What one order event costs the view as the book grows: apply copies the
+    # shards and buckets the order is in, against copying the orders and
+    # their indexes in full as every event used to
+    for working in books:
+        active = {
+            str(i): Order(
+                str(i),
+                "NQU5",
+                1,
+                1 + i % 2,
+                1,
+                2345000.0,
+                f"w{i % 50}",
+                f"A{i % accounts}",
+                "",
+            )
+            for i in range(working)
+        }
+        view = OrderView.build(active)
+        indexes = [
+            dict.fromkeys(keys) for keys in zip(*map(index_keys, active.values()))
+        ]
+        full = [active, *indexes, indexes[1]]  # and working_qty, keyed as by_contract
+        order = Order("x", "NQU5", 1, 1, 1, 2345000.0, "w0", "A0", "")
+        start = time.perf_counter()
+        for _ in range(events // 2):
+            view = view.apply({order.orderNo: order}).apply({order.orderNo: None})
+        applied = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(events):
+            copies = [dict(index) for index in full]
+        copied = time.perf_counter() - start
+        print(
+            f"{working:>17} orders: {applied / events * 1e6:>9.2f} us per event, "
+            f"{copied / events * 1e6:.2f} us to copy the book and its indexes"
+        )
+
+
+def bench_order_throttle(orders=60, rate=40.0, burst=10, server_rate=50.0):
+    # A burst of order adds against a server that allows server_rate per
+    # second: requests it rejects (a wasted round trip each) with and without
+    # the client side bucket, and how long a cancel sent in the middle of the
+    # burst waits behind the adds
+    for name, throttle in (
+        ("unthrottled", None),
+        ("token bucket", TokenBucket(rate, burst)),
+    ):
+        server = TokenBucket(server_rate, burst, urgent_reserve=0)
+        rejected, cancel_wait = 0, None
+        start = time.perf_counter()
+        for i in range(orders):
+            urgent = i == orders // 2
+            if throttle is not None:
+                sent = time.perf_counter()
+                throttle.acquire(urgent)
+                if urgent:
+                    cancel_wait = time.perf_counter() - sent
+            rejected += server.reserve() > 0
+        elapsed = time.perf_counter() - start
+        wait = "-" if cancel_wait is None else f"{cancel_wait * 1e3:.2f} ms"
+        print(
+            f"{name:>24}: {rejected:>6} of {orders} rejected, "
+            f"sent in {elapsed:.2f} s, cancel waited {wait}"
+        )
+
+
+def bench_risk(count=100_000, working=2_000):
+    # Pre-trade checks of an order add with every limit set, next to a book of
+    # working orders, per check as counted by the engine and per order in all
+    manager = OrderManager()
+    for i in range(working):
+        manager.put(
+            Order(str(i), "NQU5", 1, 1 + i % 2, 1, 2345000.0, "D", f"A{i % 50}", "")
+        )
+    spec = ContractSpec("NQU5", 1, 25.0, high_limit=2500000.0, low_limit=2200000.0)
+    market_data = MarketData({"NQU5": 1})
+    market_data.state("NQU5").trade_price = 2345000.0
+    risk = RiskEngine(manager, {"NQU5": spec}, market_data, RiskLimits(100, 10, 400))
+    orderadd = OutboundTemplates().order_add
+    orderadd.account = "A7"
+    orderadd.contract.secDesc = "NQU5"
+    orderadd.side = NinjaApiCommon_pb2.Side.BUY
+    orderadd.qty = 1
+    orderadd.price = 2344000.0
+    start = time.perf_counter()
+    for _ in range(count):
+        risk.check_add(orderadd)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{'pre-trade risk':>24}: {elapsed / count * 1e6:>9.2f} us per order, "
+        + risk.summary()
+    )
+
+
+def bench_subscriptions(algos=8, contracts=300):
+    # Algos subscribing to overlapping slices of a large sheet at runtime:
+    # messages sent and bytes written with reference counting, against one
+    # StartMarketData per algo per contract
+    cme = NinjaApiCommon_pb2.Exchange.CME
+    sheet = {f"C{i:04d}": cme for i in range(contracts)}
+    names = list(sheet)
+    slices = [
+        {name: cme for name in names[i * 25 : i * 25 + contracts // 2]}
+        for i in range(algos)
+    ]
+    market_data = MarketData({})
+    sent = []
+    market_data.sender = sent.append
+    start = time.perf_counter()
+    for products in slices:
+        market_data.subscribe(products)
+    for products in slices:
+        market_data.unsubscribe(products)
+    elapsed = time.perf_counter() - start
+    counted = sum(len(msg.SerializeToString()) for msg in sent)
+    naive = [
+        market_data.start_market_data_msg({product: exchange})
+        for products in slices
+        for product, exchange in products.items()
+    ]
+    naive_bytes = sum(len(msg.SerializeToString()) for msg in naive)
+    print(
+        f"{'reference counted':>24}: {len(sent):>6} messages, {counted:>7,} bytes, "
+        f"{elapsed * 1e3:.2f} ms for {algos} algos"
+    )
+    print(f"{'per contract':>24}: {len(naive):>6} messages, {naive_bytes:>7,} bytes")
+
+
+def bench_ticks(count=200_000):
+    # A trailing stop following a falling level: the old float path compares
+    # the raw level with the resting price / productDiv and snaps only when
+    # building the change, the tick path compares whole ticks. A change whose
+    # snapped price equals the resting one is answered with ORDER_CHANGE_FAILURE
+    spec = ContractSpec("NQU5", NinjaApiCommon_pb2.Exchange.CME, 25.0)
+    rng = np.random.default_rng(2)
+    levels = (23450 - np.cumsum(rng.exponential(0.02, count))).tolist()
+    scale = spec.price_scale
+    start = time.perf_counter()
+    resting, changes, redundant = spec.round_price(levels[0] * scale), 0, 0
+    for level in levels:
+        if level < resting / scale:
+            price = spec.round_price(level * scale)
+            changes += 1
+            redundant += price == resting
+            resting = price
+    legacy = time.perf_counter() - start
+    start = time.perf_counter()
+    resting, tick_changes = spec.display_to_ticks(levels[0]), 0
+    for level in levels:
+        ticks = spec.display_to_ticks(level)
+        if ticks < resting:
+            spec.from_ticks(ticks)
+            tick_changes += 1
+            resting = ticks
+    ticked = time.perf_counter() - start
+    for name, elapsed, sent, wasted in (
+        ("float prices", legacy, changes, redundant),
+        ("tick prices", ticked, tick_changes, 0),
+    ):
+        print(
+            f"{name:>24}: {elapsed / count * 1e9:>9.1f} ns per level, "
+            f"{sent:,} changes, {wasted:,} to the resting price"
+        )
+
+
+class BenchClient(NinjaApiClient):
+    def run(self):
+        while self.running:
+            self.poll(0.05)
+
+
+def bench_fill_latency(updates=20_000):
+    # Time from a FILL_NOTICE being written until its handler runs, when it
+    # follows a burst of market updates on the same connection (TradingClient
+    # receiving the feed) versus on its own connection (MarketDataClient)
+    header = NinjaApiMessages_pb2.Header
+    burst = framed(sample_market_updates()) * updates
+    fill = NinjaApiMessages_pb2.MsgContainer()
+    fill.header.msgType = header.FILL_NOTICE
+    fill = framed(fill)
+    for name, separate in (
+        ("shared connection", False),
+        ("separate connections", True),
+    ):
+        listener = socket.create_server(("127.0.0.1", 0))
+        port = listener.getsockname()[1]
+        market_data = MarketData({"NQU5": NinjaApiCommon_pb2.Exchange.CME})
+        md_client = BenchClient("127.0.0.1", port)
+        md_conn, _ = listener.accept()
+        md_client.register_handler(header.MARKET_UPDATES, market_data.on_market_updates)
+        programs = [md_client]
+        trading, trading_conn = md_client, md_conn
+        if separate:
+            trading = BenchClient("127.0.0.1", port)
+            trading_conn, _ = listener.accept()
+            programs.append(trading)
+        filled = threading.Event()
+        handled = []
+
+        def on_fill(msg):
+            handled.append(time.perf_counter())
+            filled.set()
+
+        trading.register_handler(header.FILL_NOTICE, on_fill)
+        for client in programs:
+            threading.Thread(target=client.run, daemon=True).start()
+        md_conn.sendall(burst)
+        sent = time.perf_counter()
+        trading_conn.sendall(fill)
+        filled.wait(30)
+        print(
+            f"{name:>24}: fill handled {(handled[0] - sent) * 1e3:>9.3f} ms after send"
+        )
+        for client in programs:
+            client.disconnect()
+        for conn in {md_conn, trading_conn}:
+            conn.close()
+        listener.close()
+
+
+if __name__ == "__main__":
+    bench_framing()
+    bench_decode()
+    bench_allocations()
+    bench_market_wait()
+    bench_bus()
+    bench_tick_store()
+    bench_bars()
+    bench_volatility()
+    bench_cadence()
+    bench_subscriptions()
+    bench_orders()
+    bench_order_acks()
+    bench_order_lookup()
+    bench_order_events()
+    bench_order_throttle()
+    bench_risk()
+    bench_ticks()
+    bench_fill_latency()
@@ -1,5 +1,6 @@
 tradingClient = None
 positionsClient = None
+marketDataClient = None
 algoMonkey = None
 algoRB = None
 algoMT = None
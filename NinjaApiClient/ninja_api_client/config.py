@@ -13,5 +13,16 @@ class Settings(BaseSettings):
     positions_host: str = Field(default="127.0.0.1")
     positions_port: int = Field(default=58001)
     positions_access_token: Optional[str] = None
+    market_data_host: str = Field(default="127.0.0.1")
+    market_data_port: int = Field(default=58000)
+    market_data_access_token: Optional[str] = None
+    contract_cache: str = Field(default="contract_cache.json")
+    order_reconcile_interval: float = Field(default=1.0)
+    order_rate: float = Field(default=20.0)
+    order_burst: int = Field(default=10)
+    order_add_reserve: int = Field(default=5)
+    risk_max_position: Optional[int] = None
+    risk_max_order_qty: Optional[int] = None
+    risk_max_ticks_from_market: Optional[int] = None
 
 settings = Settings()
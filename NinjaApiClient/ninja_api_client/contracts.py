@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+import threading
+
+from typing import Optional
+
+import NinjaApiContracts_pb2
+import NinjaApiMessages_pb2
+
+DEFAULT_PRICE_SCALE = 100  # Ninja prices carry two implied decimals
+
+Ticks = int  # a price as a whole number of tick sizes, exact to compare and add
+
+
+class ContractSpec:
+    """
+    Tick size and price scaling of one contract. ContractInfo, market data and
+    orders all quote prices in the same units (feed units); the algos work in
+    display units, which are feed units divided by price_scale (the productDiv
+    they used to hardcode).
+
+    Ticks are the exact form of a price: market data is converted to ticks once
+    when it is decoded and orders can be priced in ticks, so comparing and
+    offsetting prices never goes through float rounding.
+    """
+
+    __slots__ = (
+        "product",
+        "exchange",
+        "tick_size",
+        "tick_value",
+        "currency",
+        "high_limit",
+        "low_limit",
+        "price_scale",
+        "ticks_per_unit",
+        "display_tick",
+    )
+
+    def __init__(
+        self,
+        product,
+        exchange,
+        tick_size,
+        tick_value=0.0,
+        currency="",
+        high_limit=None,
+        low_limit=None,
+        price_scale=DEFAULT_PRICE_SCALE,
+    ):
+        self.product = product
+        self.exchange = exchange
+        self.tick_size = tick_size
+        self.tick_value = tick_value
+        self.currency = currency
+        self.high_limit = high_limit
+        self.low_limit = low_limit
+        self.price_scale = price_scale
+        self.ticks_per_unit = 1 / tick_size
+        self.display_tick = tick_size / price_scale
+
+    def to_ticks(self, price) -> Ticks:
+        # Nearest whole number of ticks for a price in feed units
+        return round(price * self.ticks_per_unit)
+
+    def from_ticks(self, ticks: Ticks) -> float:
+        return ticks * self.tick_size
+
+    def display_to_ticks(self, price) -> Ticks:
+        return round(price / self.display_tick)
+
+    def ticks_to_display(self, ticks: Ticks) -> float:
+        return ticks * self.display_tick
+
+    def round_price(self, price) -> float:
+        return round(price * self.ticks_per_unit) * self.tick_size
+
+    def to_display(self, price) -> float:
+        return price / self.price_scale
+
+    def from_display(self, price) -> float:
+        return price * self.price_scale
+
+    def round_display(self, price) -> float:
+        # Display price snapped to the nearest tick, replaces tickRound(div=4)
+        return round(price / self.display_tick) * self.display_tick
+
+    def as_dict(self) -> dict:
+        return {
+            name: getattr(self, name)
+            for name in self.__slots__
+            if name not in ("ticks_per_unit", "display_tick")
+        }
+
+
+class ContractRegistry:
+    """
+    ContractSpec per product, filled from CONTRACT_INFO_RESPONSE and kept in a
+    JSON cache file, so a restart has tick sizes before the server answers.
+    price_scale is not part of ContractInfo; it defaults to DEFAULT_PRICE_SCALE
+    and can be overridden per product in the cache file.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.specs = {}
+        self.updated = threading.Condition()
+        if path:
+            self.load()
+
+    def load(self):
+        # A cache that cannot be used is ignored as a whole, the session then
+        # requests the contract info of every product
+        try:
+            with open(self.path) as f:
+                cached = json.load(f)
+            specs = [ContractSpec(**fields) for fields in cached.values()]
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, TypeError, AttributeError):
+            # TypeError and AttributeError: written with another ContractSpec
+            logging.exception(f"Ignoring unreadable contract cache {self.path}")
+            return
+        for spec in specs:
+            self.specs[spec.product] = spec
+        logging.info(f"Loaded {len(specs)} contracts from {self.path}")
+
+    def save(self):
+        if not self.path:
+            return
+        cached = {product: spec.as_dict() for product, spec in self.specs.items()}
+        temp = f"{self.path}.tmp"
+        try:
+            with open(temp, "w") as f:
+                json.dump(cached, f, indent=2, sort_keys=True)
+            os.replace(temp, self.path)
+        except OSError:
+            logging.exception(f"Failed writing contract cache {self.path}")
+
+    def update(self, infos):
+        # Called with the ContractInfo messages of a CONTRACT_INFO_RESPONSE
+        with self.updated:
+            for info in infos:
+                product = info.contract.secDesc
+                if info.tickSize <= 0:
+                    logging.warning(f"Contract {product} has no tick size, skipped")
+                    continue
+                cached = self.specs.get(product)
+                self.specs[product] = ContractSpec(
+                    product,
+                    info.contract.exchange,
+                    info.tickSize,
+                    info.tickAmt,
+                    info.currency,
+                    info.highLimitPrice or None,
+                    info.lowLimitPrice or None,
+                    cached.price_scale if cached else DEFAULT_PRICE_SCALE,
+                )
+            self.save()
+            self.updated.notify_all()
+
+    def get(self, product) -> Optional[ContractSpec]:
+        return self.specs.get(product)
+
+    """
+    Get the spec of a product, waiting for the contract info if it is not known yet
+    Parameters:
+        product (str): The symbol or product name being traded (e.g., 'ESU5').
+        timeout (float, optional): Seconds to wait, None waits until available.
+    Returns:
+        ContractSpec, raises LookupError if it did not arrive in time
+    """
+
+    def wait(self, product, timeout=None) -> ContractSpec:
+        with self.updated:
+            if not self.updated.wait_for(lambda: product in self.specs, timeout):
+                raise LookupError(f"No contract info for {product}")
+            return self.specs[product]
+
+    def request_msg(self, products) -> NinjaApiMessages_pb2.MsgContainer:
+        # CONTRACT_INFO_REQUEST for a {product: exchange} dict
+        getcontractinfo = NinjaApiContracts_pb2.GetContractInfo()
+        for product, exchange in products.items():
+            contract = getcontractinfo.contracts.add()
+            contract.exchange = exchange
+            contract.secDesc = product
+            contract.whName = product
+        container = NinjaApiMessages_pb2.MsgContainer()
+        container.header.msgType = NinjaApiMessages_pb2.Header.CONTRACT_INFO_REQUEST
+        container.payload = getcontractinfo.SerializeToString()
+        return container
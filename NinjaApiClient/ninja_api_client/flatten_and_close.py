@@ -25,33 +25,36 @@ def run():
             logging.info(
                 f"All active orders: {clients.tradingClient.activeOrders.keys()}"
             )
-            for orderNo in clients.tradingClient.activeOrders.keys():
-                clients.tradingClient.cancel_order(orderNo)
-            positions = clients.positionsClient.positions
-            for entry in positions.keys():
-                account = entry[0]
-                exchange = entry[1]
-                product = entry[2]
-                if positions.get(entry) > 0:
-                    clients.tradingClient.order(
-                        account=account,
-                        product=product,
-                        price=clients.tradingClient.latest_bid.get(product),
-                        qty=-positions.get(entry),
-                        worker="w",
-                        exchange=exchange,
-                        tag="FLATTEN_PROGRAMCLOSE",
-                    )
-                elif positions.get(entry) < 0:
-                    clients.tradingClient.order(
-                        account=account,
-                        product=product,
-                        price=clients.tradingClient.latest_ask.get(product),
-                        qty=-positions.get(entry),
-                        worker="w",
-                        exchange=exchange,
-                        tag="FLATTEN_PROGRAMCLOSE",
-                    )
+            # queue every cancel and flatten order, then write them in one burst
+            with clients.tradingClient.batch():
+                for orderNo in clients.tradingClient.activeOrders.keys():
+                    clients.tradingClient.cancel_order(orderNo)
+                positions = clients.positionsClient.positions
+                for entry in positions.keys():
+                    account = entry[0]
+                    exchange = entry[1]
+                    product = entry[2]
+                    quote = clients.tradingClient.snapshot(product)
+                    if positions.get(entry) > 0:
+                        clients.tradingClient.order(
+                            account=account,
+                            product=product,
+                            price=quote.bid,
+                            qty=-positions.get(entry),
+                            worker="w",
+                            exchange=exchange,
+                            tag="FLATTEN_PROGRAMCLOSE",
+                        )
+                    elif positions.get(entry) < 0:
+                        clients.tradingClient.order(
+                            account=account,
+                            product=product,
+                            price=quote.ask,
+                            qty=-positions.get(entry),
+                            worker="w",
+                            exchange=exchange,
+                            tag="FLATTEN_PROGRAMCLOSE",
+                        )
 
             while len(clients.tradingClient.activeOrders.values()) > 0:
                 time.sleep(0.1)
@@ -0,0 +1,132 @@
+import socket
+import struct
+
+FRAME_HEADER = struct.Struct("i")
+
+# Protobuf wire types used by MsgContainer and Header
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH_DELIMITED = 2
+WIRE_FIXED32 = 5
+
+
+def read_varint(buf, pos: int):
+    # Decodes the base 128 varint at pos, returns (value, next position)
+    byte = buf[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    value = byte & 0x7F
+    shift = 7
+    while True:
+        pos += 1
+        byte = buf[pos]
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos + 1
+        shift += 7
+
+
+def skip_field(buf, pos: int, wire_type: int) -> int:
+    if wire_type == WIRE_VARINT:
+        return read_varint(buf, pos)[1]
+    if wire_type == WIRE_LENGTH_DELIMITED:
+        size, pos = read_varint(buf, pos)
+        return pos + size
+    if wire_type == WIRE_FIXED64:
+        return pos + 8
+    if wire_type == WIRE_FIXED32:
+        return pos + 4
+    raise ValueError(f"Unsupported wire type {wire_type}")
+
+
+def peek_header(frame: memoryview):
+    """
+    Reads MsgContainer.header.msgType and the payload straight from the wire
+    format without building a MsgContainer. Returns (msg_type, payload) where
+    payload is a slice of frame, so nothing is copied until the typed message
+    is parsed from it.
+    """
+    msg_type = 0  # proto3 omits the default, Header.ERROR
+    payload = frame[0:0]
+    pos = 0
+    end = len(frame)
+    while pos < end:
+        key, pos = read_varint(frame, pos)
+        field = key >> 3
+        if key & 7 != WIRE_LENGTH_DELIMITED or field > 2:
+            pos = skip_field(frame, pos, key & 7)
+            continue
+        size, pos = read_varint(frame, pos)
+        if field == 2:
+            payload = frame[pos : pos + size]
+        else:
+            msg_type = read_msg_type(frame, pos, pos + size)
+        pos += size
+    return msg_type, payload
+
+
+def read_msg_type(buf, pos: int, end: int) -> int:
+    # Header.msgType (field 1, varint) from an encoded Header at buf[pos:end]
+    msg_type = 0
+    while pos < end:
+        key, pos = read_varint(buf, pos)
+        if key == 0x08:
+            msg_type, pos = read_varint(buf, pos)
+        else:
+            pos = skip_field(buf, pos, key & 7)
+    return msg_type
+
+
+class FrameBuffer:
+    """
+    Preallocated receive buffer for length-prefixed Ninja API frames.
+
+    One recv_into() pulls as many bytes as the kernel has ready, and frames()
+    then slices out every complete frame in place. A trailing partial frame is
+    moved back to the front of the buffer before the next read, so frames are
+    always contiguous and never need to be reassembled.
+    """
+
+    def __init__(self, size: int = 1 << 20):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # first unconsumed byte
+        self.end = 0  # one past the last received byte
+
+    def __len__(self):
+        return self.end - self.start
+
+    def recv_into(self, sock: socket.socket) -> int:
+        if self.end == len(self.buffer):
+            self._make_room()
+        received = sock.recv_into(self.view[self.end :])
+        self.end += received
+        return received
+
+    def frames(self):
+        # Yields a memoryview of each complete frame body. The views point into
+        # the shared buffer and are only valid until the next recv_into().
+        header_size = FRAME_HEADER.size
+        while self.end - self.start >= header_size:
+            (size,) = FRAME_HEADER.unpack_from(self.buffer, self.start)
+            body = self.start + header_size
+            if self.end - body < size:
+                break
+            self.start = body + size
+            yield self.view[body : self.start]
+        if self.start == self.end:
+            self.start = self.end = 0
+
+    def _make_room(self):
+        unread = self.end - self.start
+        if self.start > 0:
+            # Compact the partial frame to the front
+            self.buffer[:unread] = bytes(self.view[self.start : self.end])
+        else:
+            # A single frame is larger than the buffer
+            buffer = bytearray(2 * len(self.buffer))
+            buffer[:unread] = self.view[: self.end]
+            self.buffer = buffer
+            self.view = memoryview(buffer)
+        self.start = 0
+        self.end = unread
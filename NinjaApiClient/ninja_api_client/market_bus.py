@@ -0,0 +1,329 @@
+import logging
+import threading
+import time
+
+from collections import deque
+from typing import NamedTuple, Optional
+
+
+class Tob(NamedTuple):
+    product: str
+    bid: Optional[float]  # None after the market data connection dropped
+    ask: Optional[float]
+    bid_qty: int
+    ask_qty: int
+    bid_ticks: Optional[int] = None  # None until the contract info is known
+    ask_ticks: Optional[int] = None
+
+
+class Trade(NamedTuple):
+    product: str
+    price: float
+    qty: int
+    aggressor: int  # NinjaApiCommon_pb2.Aggressor
+    time: int  # exchange transact time, epoch nanoseconds
+    ticks: Optional[int] = None  # None until the contract info is known
+
+
+class TradeSummary(NamedTuple):
+    # Trades merged by a subscription with a cadence, in place of each Trade
+    product: str
+    price: float  # last trade
+    qty: int  # volume of all merged trades
+    high: float
+    low: float
+    trades: int
+    time: int  # of the last trade, epoch nanoseconds
+    ticks: Optional[int] = None
+    high_ticks: Optional[int] = None
+    low_ticks: Optional[int] = None
+
+
+class TradeMerge:
+    __slots__ = ("last", "qty", "high", "low", "trades")
+
+    def __init__(self, trade):
+        self.last = self.high = self.low = trade
+        self.qty = trade.qty
+        self.trades = 1
+
+    def add(self, trade):
+        self.last = trade
+        self.qty += trade.qty
+        self.trades += 1
+        if trade.price > self.high.price:
+            self.high = trade
+        elif trade.price < self.low.price:
+            self.low = trade
+
+    def summary(self) -> TradeSummary:
+        last, high, low = self.last, self.high, self.low
+        return TradeSummary(
+            last.product,
+            last.price,
+            self.qty,
+            high.price,
+            low.price,
+            self.trades,
+            last.time,
+            last.ticks,
+            high.ticks,
+            low.ticks,
+        )
+
+
+class Subscription:
+    """
+    One consumer of a product's market data. The feed thread only appends
+    events to this bounded queue; on_tob and on_trade run on the consumer side,
+    either on the subscription's own thread or on whichever thread calls
+    dispatch(). A full queue drops its oldest event instead of blocking the
+    feed. With conflate, queued top of book events collapse into the latest
+    one, trades are always delivered in order.
+
+    With a cadence (seconds) the subscription is a mailbox instead of a queue:
+    it holds the latest top of book and one TradeMerge of the trades since the
+    last delivery, and hands them over at most once per cadence, the trades as
+    a TradeSummary that keeps their high, low and volume. A consumer that only
+    needs a few updates a second then costs the feed the same however fast
+    the market moves.
+    """
+
+    def __init__(
+        self,
+        product,
+        on_tob=None,
+        on_trade=None,
+        maxsize=1024,
+        conflate=False,
+        cadence=0.0,
+    ):
+        self.product = product
+        self.on_tob = on_tob
+        self.on_trade = on_trade
+        self.maxsize = maxsize
+        self.conflate = conflate
+        self.cadence = cadence
+        self.events = deque()
+        self.latest_tob = None  # queued as None when conflating
+        self.merged = None  # TradeMerge waiting for the next cadence
+        self.due = 0.0  # monotonic time of the next cadence delivery
+        self.ready = threading.Condition()
+        self.waiting = False
+        self.active = True
+        self.thread = None
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.conflated = 0
+
+    def put(self, tob, trades):
+        # Called on the feed thread once per MarketUpdate
+        if self.cadence:
+            self.merge(tob, trades)
+            return
+        with self.ready:
+            if tob is not None and self.on_tob is not None:
+                self.received += 1
+                if not self.conflate:
+                    self.append(tob)
+                elif self.latest_tob is None:
+                    self.latest_tob = tob
+                    self.append(None)
+                else:
+                    self.latest_tob = tob
+                    self.conflated += 1
+            if trades and self.on_trade is not None:
+                self.received += len(trades)
+                for trade in trades:
+                    self.append(trade)
+            if self.waiting:
+                self.ready.notify()
+
+    def merge(self, tob, trades):
+        with self.ready:
+            idle = self.latest_tob is None and self.merged is None
+            if tob is not None and self.on_tob is not None:
+                self.received += 1
+                if self.latest_tob is not None:
+                    self.conflated += 1
+                self.latest_tob = tob
+            if trades and self.on_trade is not None:
+                self.received += len(trades)
+                merged = self.merged
+                for trade in trades:
+                    if merged is None:
+                        merged = self.merged = TradeMerge(trade)
+                    else:
+                        merged.add(trade)
+                        self.conflated += 1
+            # a consumer with something pending already sleeps until it is due
+            if idle and self.waiting:
+                self.ready.notify()
+
+    def append(self, event):
+        if len(self.events) >= self.maxsize:
+            if self.events.popleft() is None:
+                self.latest_tob = None
+            self.dropped += 1
+        self.events.append(event)
+
+    """
+    Run the callbacks for queued events on the calling thread
+    Parameters:
+        timeout (float, optional): Seconds to wait for the first event, None waits forever.
+    Returns:
+        int: number of events handled, 0 if the wait timed out
+    """
+
+    def dispatch(self, timeout=None) -> int:
+        if self.cadence:
+            return self.dispatch_merged(timeout)
+        with self.ready:
+            if not self.events and self.active:
+                self.waiting = True
+                try:
+                    self.ready.wait(timeout)
+                finally:
+                    self.waiting = False
+            if not self.events:
+                return 0
+            events, self.events = self.events, deque()
+            latest_tob, self.latest_tob = self.latest_tob, None
+        for event in events:
+            if event is None:
+                self.on_tob(latest_tob)
+            elif type(event) is Tob:
+                self.on_tob(event)
+            else:
+                self.on_trade(event)
+        self.delivered += len(events)
+        return len(events)
+
+    def dispatch_merged(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.ready:
+            while self.active:
+                now = time.monotonic()
+                pending = self.latest_tob is not None or self.merged is not None
+                if pending and now >= self.due:
+                    break
+                wait = self.due - now if pending else None
+                if deadline is not None:
+                    if now >= deadline:
+                        break
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self.waiting = True
+                try:
+                    self.ready.wait(wait)
+                finally:
+                    self.waiting = False
+            tob, self.latest_tob = self.latest_tob, None
+            merged, self.merged = self.merged, None
+            if tob is None and merged is None:
+                return 0
+            self.due = time.monotonic() + self.cadence
+        handled = 0
+        if merged is not None:
+            self.on_trade(merged.summary())
+            handled += 1
+        if tob is not None:
+            self.on_tob(tob)
+            handled += 1
+        self.delivered += handled
+        return handled
+
+    def start(self, name):
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while self.active:
+            try:
+                self.dispatch(1.0)
+            except:
+                logging.exception(f"Market data callback for {self.product} failed")
+
+    def close(self):
+        with self.ready:
+            self.active = False
+            self.ready.notify_all()
+
+    def ratio(self) -> float:
+        # Events received per event delivered, 1.0 when nothing is merged
+        return self.received / self.delivered if self.delivered else 1.0
+
+    def summary(self) -> str:
+        cadence = f" every {self.cadence:g}s" if self.cadence else ""
+        return (
+            f"{self.product}{cadence}: {self.received} received, "
+            f"{self.delivered} delivered ({self.ratio():.1f}:1), "
+            f"{len(self.events)} queued, {self.conflated} conflated, "
+            f"{self.dropped} dropped"
+        )
+
+
+class MarketDataBus:
+    """
+    Fans every MarketUpdate out to the subscriptions for its product. The
+    market data handler publishes to a per-product tuple that subscribe() and
+    unsubscribe() replace rather than mutate, so publishing takes no bus lock.
+    """
+
+    def __init__(self):
+        self.subscriptions = {}
+        self.lock = threading.Lock()
+
+    """
+    Subscribe to top of book and trade events for a product
+    Parameters:
+        product (str): The symbol or product name being traded (e.g., 'ESU5').
+        on_tob (callable, optional): Called with a Tob on every top of book change.
+        on_trade (callable, optional): Called with a Trade for every trade.
+        maxsize (int, optional): Queued events before the oldest are dropped.
+        conflate (bool, optional): Only deliver the latest top of book when the consumer falls behind.
+        threaded (bool, optional): Run callbacks on a thread of their own, otherwise the caller runs them with dispatch().
+        cadence (float, optional): Deliver at most once per cadence seconds, the latest top of book and a TradeSummary of the trades in between. 0 delivers every event.
+    Returns:
+        Subscription
+    """
+
+    def subscribe(
+        self,
+        product,
+        on_tob=None,
+        on_trade=None,
+        maxsize=1024,
+        conflate=False,
+        threaded=True,
+        cadence=0.0,
+    ) -> Subscription:
+        subscription = Subscription(
+            product, on_tob, on_trade, maxsize, conflate, cadence
+        )
+        with self.lock:
+            current = self.subscriptions.get(product, ())
+            self.subscriptions[product] = current + (subscription,)
+        if threaded:
+            subscription.start(f"market-bus-{product}")
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            current = self.subscriptions.get(subscription.product, ())
+            remaining = tuple(s for s in current if s is not subscription)
+            if remaining:
+                self.subscriptions[subscription.product] = remaining
+            else:
+                self.subscriptions.pop(subscription.product, None)
+        subscription.close()
+
+    def publish(self, subscriptions, tob, trades):
+        for subscription in subscriptions:
+            subscription.put(tob, trades)
+
+    def summary(self) -> str:
+        subscriptions = [s for subs in self.subscriptions.values() for s in subs]
+        return "Market data bus: " + (
+            "; ".join(s.summary() for s in subscriptions) or "no subscriptions"
+        )
@@ -0,0 +1,574 @@
+import asyncio
+import logging
+import threading
+import time
+
+from collections import Counter
+from typing import NamedTuple, Optional
+
+import NinjaApiCommon_pb2
+import NinjaApiMarketData_pb2
+import NinjaApiMessages_pb2
+from market_bus import MarketDataBus, Tob, Trade
+from message_pool import MessagePool
+from tick_store import TickStore
+
+
+def contract_map(contracts) -> dict:
+    # {product: exchange} from a dict, Contract messages (e.g. sheet
+    # contracts) or product names, which default to CME
+    if isinstance(contracts, dict):
+        return dict(contracts)
+    if isinstance(contracts, str):
+        contracts = (contracts,)
+    products = {}
+    for contract in contracts:
+        if isinstance(contract, str):
+            products[contract] = NinjaApiCommon_pb2.Exchange.CME
+        elif contract.secDesc and contract.secDesc != "-----":
+            products[contract.secDesc] = contract.exchange
+    return products
+
+
+def add_contracts(request, products):
+    for product, exchange in products.items():
+        contract = request.contracts.add()
+        contract.exchange = exchange
+        contract.secDesc = product
+        contract.whName = product
+
+
+class MarketSnapshot(NamedTuple):
+    seq: int
+    bid: Optional[float]
+    ask: Optional[float]
+    bid_qty: int
+    ask_qty: int
+    trade_price: Optional[float]
+    low: Optional[float]  # lowest trade in the latest update with trades
+    high: Optional[float]  # highest trade in the latest update with trades
+    volume: int  # traded since the connection started
+
+
+SNAPSHOT_SPINS = 100  # optimistic reads of a MarketState before taking its lock
+
+
+class MarketState:
+    """
+    Latest top of book and trades for one product, updated in place once per
+    MarketUpdate. seq is odd while an update is being written and grows by two
+    per update, so snapshot() can tell a torn read apart from a consistent one.
+
+    Updates come from the feed thread, but invalidate() and unsubscribe()
+    clear states from other threads, so every writer holds lock around its
+    update. Readers do not take it unless SNAPSHOT_SPINS reads in a row were
+    torn.
+    """
+
+    __slots__ = (
+        "product",
+        "seq",
+        "bid",
+        "ask",
+        "bid_qty",
+        "ask_qty",
+        "trade_price",
+        "low",
+        "high",
+        "volume",
+        "lock",
+    )
+
+    def __init__(self, product, lock=None):
+        self.product = product
+        self.seq = 0
+        self.bid = None
+        self.ask = None
+        self.bid_qty = 0
+        self.ask_qty = 0
+        self.trade_price = None
+        self.low = None
+        self.high = None
+        self.volume = 0
+        self.lock = lock or threading.Lock()
+
+    def snapshot(self) -> MarketSnapshot:
+        for _ in range(SNAPSHOT_SPINS):
+            seq = self.seq
+            if not seq & 1:
+                snapshot = self.read(seq)
+                if self.seq == seq:
+                    return snapshot
+            time.sleep(0)  # let the writer finish the update
+        with self.lock:
+            return self.read(self.seq)
+
+    def read(self, seq) -> MarketSnapshot:
+        return MarketSnapshot(
+            seq,
+            self.bid,
+            self.ask,
+            self.bid_qty,
+            self.ask_qty,
+            self.trade_price,
+            self.low,
+            self.high,
+            self.volume,
+        )
+
+
+def wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class MarketData:
+    """
+    MarketState per product, updated from MARKET_UPDATES. Owned by whichever
+    connection receives the feed (MarketDataClient, or TradingClient when no
+    market data connection is configured) and read by the algos through the
+    client getters, snapshot() and wait_for_update(), or pushed to them through
+    the bus subscriptions. Every trade and top of book change is also kept in
+    the ticks store for windowed history queries. With a contract registry,
+    bus events also carry their prices in whole ticks, converted here once.
+
+    The feed covers products, the configured ones plus whatever subscribe()
+    added at runtime. Interest is reference counted per product, so several
+    algos can subscribe to the same contract and only the last unsubscribe
+    stops it; the configured products hold one reference that is never
+    released. Each call sends at most one StartMarketData or StopMarketData
+    per cadence for all its contracts through sender, the send_msg of the
+    connection that receives the feed. A reconnect resubscribes every product.
+
+    Every reference also carries the server side cadence it can live with. A
+    product is requested at the smallest one, so it is only conflated by the
+    server when every holder asked for it; the configured products ask for
+    none, which keeps the tick store and bars complete. Per consumer
+    conflation of the bus is the Subscription cadence.
+    """
+
+    def __init__(self, products, contracts=None):
+        self.products = dict(products)  # subscribed, replaced on change
+        # product -> Counter of references per cadence in milliseconds
+        self.interest = {product: Counter({0: 1}) for product in products}
+        self.configured = frozenset(products)
+        self.interest_lock = threading.Lock()
+        self.sender = None
+        self.contracts = contracts  # ContractRegistry, shared with the session
+        self.pool = MessagePool()
+        self.write_lock = threading.Lock()  # held by every MarketState writer
+        self.states = {
+            product: MarketState(product, self.write_lock) for product in products
+        }
+        self.updated = threading.Condition()
+        self.waiters = 0  # threads parked in wait_for_update
+        self.async_waiters = []  # (loop, future) of parked coroutines
+        self.bus = MarketDataBus()
+        self.ticks = TickStore()
+        self.bar_builders = {}  # product -> tuple of BarBuilder, replaced on change
+        self.builders_lock = threading.Lock()
+
+    def state(self, product) -> MarketState:
+        state = self.states.get(product)
+        if state is None:
+            state = self.states.setdefault(
+                product, MarketState(product, self.write_lock)
+            )
+        return state
+
+    """
+    Get a consistent view of the latest market state
+    Parameters:
+        product (str): The symbol or product name being traded (e.g., 'ESU5').
+    Returns:
+        MarketSnapshot with seq, bid, ask, bid_qty, ask_qty, trade_price, low, high and volume
+    """
+
+    def snapshot(self, product) -> MarketSnapshot:
+        return self.state(product).snapshot()
+
+    """
+    Get latest bid, waiting for market data if there is none yet
+    Parameters:
+        product (str): The symbol or product name being traded (e.g., 'ESU5').
+        timeout (float, optional): Seconds to wait, None waits until available.
+    """
+
+    def get_bid(self, product, timeout=None):
+        return self.wait_for_value(product, lambda quote: quote.bid, timeout)
+
+    """
+    Get latest ask, waiting for market data if there is none yet
+    Parameters:
+        product (str): The symbol or product name being traded (e.g., 'ESU5').
+        timeout (float, optional): Seconds to wait, None waits until available.
+    """
+
+    def get_ask(self, product, timeout=None):
+        return self.wait_for_value(product, lambda quote: quote.ask, timeout)
+
+    """
+    Get latest high, waiting for market data if there is none yet
+    Parameters:
+        product (str): The symbol or product name being traded (e.g., 'ESU5').
+        timeout (float, optional): Seconds to wait, None waits until available.
+    """
+
+    def get_high(self, product, timeout=None):
+        return self.wait_for_value(product, lambda quote: quote.high, timeout)
+
+    """
+    Get latest low, waiting for market data if there is none yet
+    Parameters:
+        product (str): The symbol or product name being traded (e.g., 'ESU5').
+        timeout (float, optional): Seconds to wait, None waits until available.
+    """
+
+    def get_low(self, product, timeout=None):
+        return self.wait_for_value(product, lambda quote: quote.low, timeout)
+
+    """
+    Get latest traded price, waiting for market data if there is none yet
+    Parameters:
+        product (str): The symbol or product name being traded (e.g., 'ESU5').
+        timeout (float, optional): Seconds to wait, None waits until available.
+    """
+
+    def get_trade_price(self, product, timeout=None):
+        return self.wait_for_value(product, lambda quote: quote.trade_price, timeout)
+
+    """
+    Get volume of this trade update (since turninig on the connection, warmup for day will have to be done on algo side)
+    Parameters:
+        product (str): The symbol or product name being traded (e.g., 'ESU5').
+        timeout (float, optional): Seconds to wait, None waits until available.
+    """
+
+    def get_volume(self, product, timeout=None):
+        return self.wait_for_value(product, lambda quote: quote.volume or None, timeout)
+
+    """
+    Block until a market update newer than after_seq arrives for product
+    Parameters:
+        product (str): The symbol or product name being traded (e.g., 'ESU5').
+        after_seq (int, optional): seq of the last snapshot seen, None waits for the next update.
+        timeout (float, optional): Seconds to wait, None waits forever.
+    Returns:
+        MarketSnapshot, its seq is still after_seq if the wait timed out
+    """
+
+    def wait_for_update(self, product, after_seq=None, timeout=None):
+        state = self.state(product)
+        if after_seq is None:
+            after_seq = state.seq | 1
+        if state.seq <= after_seq:
+            with self.updated:
+                self.waiters += 1
+                try:
+                    self.updated.wait_for(lambda: state.seq > after_seq, timeout)
+                finally:
+                    self.waiters -= 1
+        return state.snapshot()
+
+    async def wait_for_update_async(self, product, after_seq=None, timeout=None):
+        # asyncio version of wait_for_update, safe to await on any event loop
+        state = self.state(product)
+        if after_seq is None:
+            after_seq = state.seq | 1
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while state.seq <= after_seq:
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                break
+            future = loop.create_future()
+            waiter = (loop, future)
+            self.async_waiters.append(waiter)
+            try:
+                if state.seq > after_seq:
+                    break  # updated while registering
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                break
+            finally:
+                # a timed out or cancelled wait must not stay registered
+                # until the product's next update
+                self.forget(waiter)
+        return state.snapshot()
+
+    def forget(self, waiter):
+        try:
+            self.async_waiters.remove(waiter)
+        except ValueError:
+            pass  # taken by notify() meanwhile
+
+    """
+    Feed a bar builder from this market data and start its boundary timers
+    Parameters:
+        builder (BarBuilder): Seed it from history first if needed.
+    """
+
+    def add_bar_builder(self, builder):
+        with self.builders_lock:
+            current = self.bar_builders.get(builder.product, ())
+            self.bar_builders[builder.product] = current + (builder,)
+        builder.start()
+
+    def remove_bar_builder(self, builder):
+        with self.builders_lock:
+            current = self.bar_builders.get(builder.product, ())
+            remaining = tuple(b for b in current if b is not builder)
+            if remaining:
+                self.bar_builders[builder.product] = remaining
+            else:
+                self.bar_builders.pop(builder.product, None)
+        builder.stop()
+
+    def wait_for_value(self, product, read, timeout=None):
+        # Returns read(snapshot) once it is not None, or None after timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        quote = self.snapshot(product)
+        while read(quote) is None:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            quote = self.wait_for_update(product, quote.seq, remaining)
+        return read(quote)
+
+    def notify(self):
+        # Wakes parked readers; a no-op unless someone is waiting
+        if self.waiters:
+            with self.updated:
+                self.updated.notify_all()
+        if self.async_waiters:
+            waiters, self.async_waiters = self.async_waiters, []
+            for loop, future in waiters:
+                loop.call_soon_threadsafe(wake, future)
+
+    def invalidate(self):
+        # Prices from before a connection drop must not be traded on; the
+        # getters wait again until fresh market updates arrive
+        for state in list(self.states.values()):
+            self.clear(state)
+        self.notify()
+
+    def clear(self, state):
+        # Runs on whichever thread lost the connection or unsubscribed, while
+        # the feed thread may still be updating the same state
+        with state.lock:
+            state.seq += 1
+            state.bid = None
+            state.ask = None
+            state.trade_price = None
+            state.low = None
+            state.high = None
+            state.seq += 1
+        subscriptions = self.bus.subscriptions.get(state.product)
+        if subscriptions:
+            tob = Tob(state.product, None, None, 0, 0)
+            self.bus.publish(subscriptions, tob, None)
+
+    def cadence(self, product) -> int:
+        # Server cadence of a subscribed product in milliseconds
+        return min(self.interest[product])
+
+    """
+    Add interest in products, starting market data for those nobody had yet
+    Parameters:
+        contracts (dict, list or str): {product: exchange}, Contract messages or product names.
+        cadence (float, optional): Server side conflation in seconds this holder accepts, 0 for every tick.
+    Returns:
+        dict: {product: exchange} of the products that were started or sped up
+    """
+
+    def subscribe(self, contracts, cadence=0.0) -> dict:
+        milliseconds = round(cadence * 1000)
+        started = {}
+        with self.interest_lock:
+            for product, exchange in contract_map(contracts).items():
+                cadences = self.interest.get(product)
+                if cadences is None:
+                    cadences = self.interest[product] = Counter()
+                elif milliseconds >= min(cadences):
+                    cadences[milliseconds] += 1
+                    continue
+                cadences[milliseconds] += 1
+                started[product] = self.products.get(product, exchange)
+            if started:
+                self.products = {**self.products, **started}
+                # sent under the lock so a start and stop of the same product
+                # reach the server in the order their references changed
+                self.send(self.start_market_data_msgs(started))
+        return started
+
+    """
+    Drop interest in products, stopping market data for those nobody needs anymore
+    Parameters:
+        contracts (dict, list or str): {product: exchange}, Contract messages or product names.
+        cadence (float, optional): The cadence the interest was added with.
+    Returns:
+        dict: {product: exchange} of the products that were stopped
+    """
+
+    def unsubscribe(self, contracts, cadence=0.0) -> dict:
+        milliseconds = round(cadence * 1000)
+        stopped = {}
+        slowed = {}
+        with self.interest_lock:
+            for product in contract_map(contracts):
+                cadences = self.interest.get(product)
+                if not cadences or not cadences[milliseconds]:
+                    logging.warning(f"Unsubscribe from {product} without interest")
+                    continue
+                if product in self.configured and sum(cadences.values()) == 1:
+                    logging.warning(f"Unsubscribe from {product} without interest")
+                    continue
+                fastest = min(cadences)
+                cadences[milliseconds] -= 1
+                if not cadences[milliseconds]:
+                    del cadences[milliseconds]
+                if not cadences:
+                    del self.interest[product]
+                    stopped[product] = self.products[product]
+                elif min(cadences) != fastest:
+                    slowed[product] = self.products[product]
+            if stopped:
+                self.products = {
+                    product: exchange
+                    for product, exchange in self.products.items()
+                    if product not in stopped
+                }
+                self.send([self.stop_market_data_msg(stopped)])
+            if slowed:
+                self.send(self.start_market_data_msgs(slowed))
+        for product in stopped:
+            self.clear(self.state(product))
+        if stopped:
+            self.notify()
+        return stopped
+
+    def send(self, msgs):
+        if self.sender is not None:
+            for msg in msgs:
+                self.sender(msg)
+
+    def start_market_data_msgs(self, products=None) -> list:
+        # One StartMarketData per server cadence, for every subscribed product
+        # unless given a {product: exchange} dict (with interest_lock held)
+        if products is None:
+            with self.interest_lock:
+                return self.start_market_data_msgs(self.products)
+        by_cadence = {}
+        for product, exchange in products.items():
+            by_cadence.setdefault(self.cadence(product), {})[product] = exchange
+        return [
+            self.start_market_data_msg(group, cadence)
+            for cadence, group in sorted(by_cadence.items())
+        ]
+
+    def start_market_data_msg(self, products, cadence=0):
+        startmd = NinjaApiMarketData_pb2.StartMarketData()
+        add_contracts(startmd, products)
+        startmd.cadence.duration = cadence  # in milliseconds
+        startmd.includeImplieds = True
+        startmd.includeTradeUpdates = True
+        container = NinjaApiMessages_pb2.MsgContainer()
+        container.header.msgType = NinjaApiMessages_pb2.Header.START_MARKET_DATA_REQUEST
+        container.payload = startmd.SerializeToString()
+        return container
+
+    def stop_market_data_msg(self, products):
+        stopmd = NinjaApiMarketData_pb2.StopMarketData()
+        add_contracts(stopmd, products)
+        container = NinjaApiMessages_pb2.MsgContainer()
+        container.header.msgType = NinjaApiMessages_pb2.Header.STOP_MARKET_DATA_REQUEST
+        container.payload = stopmd.SerializeToString()
+        return container
+
+    # ________________________________________________________________________________
+    # region ON EVERY MARKET UPDATE
+    def on_market_updates(self, payload):
+        resp = self.pool.parse(NinjaApiMarketData_pb2.MarketUpdates, payload)
+        subscribed = self.bus.subscriptions
+        for update in resp.marketUpdates:
+            product = update.contract.secDesc
+            state = self.state(product)
+            trades = update.tradeUpdates
+            has_tob = update.HasField("tobUpdate")
+            prices = [trade.tradePrice for trade in trades]
+            with state.lock:
+                state.seq += 1
+                if has_tob:
+                    tob = update.tobUpdate
+                    state.bid = tob.bidPrice
+                    state.ask = tob.askPrice
+                    state.bid_qty = tob.bidQty
+                    state.ask_qty = tob.askQty
+                if prices:
+                    state.trade_price = prices[-1]
+                    state.high = max(prices)
+                    state.low = min(prices)
+                    state.volume += sum(trade.tradeQty for trade in trades)
+                state.seq += 1
+            self.record(state, update, has_tob, trades)
+            subscriptions = subscribed.get(product)
+            if subscriptions:
+                self.publish(subscriptions, state, has_tob, trades)
+        self.pool.release(resp)
+        self.notify()
+
+    def record(self, state, update, has_tob, trades):
+        if has_tob:
+            tob = update.tobUpdate
+            self.ticks.tob(state.product).append(
+                tob.lastChange.timestamp,
+                state.bid,
+                state.ask,
+                state.bid_qty,
+                state.ask_qty,
+            )
+        if len(trades) > 0:
+            ring = self.ticks.trades(state.product)
+            builders = self.bar_builders.get(state.product, ())
+            for trade in trades:
+                time_ns = trade.transactTime.timestamp
+                price = trade.tradePrice
+                qty = trade.tradeQty
+                ring.append(
+                    time_ns,
+                    price,
+                    qty,
+                    trade.aggressor,
+                    trade.sqn,
+                    state.bid,
+                    state.ask,
+                )
+                for builder in builders:
+                    builder.add_trade(time_ns, price, qty)
+
+    def publish(self, subscriptions, state, has_tob, trades):
+        spec = self.contracts.get(state.product) if self.contracts else None
+        to_ticks = spec.to_ticks if spec else lambda price: None
+        tob = None
+        if has_tob:
+            tob = Tob(
+                state.product,
+                state.bid,
+                state.ask,
+                state.bid_qty,
+                state.ask_qty,
+                to_ticks(state.bid),
+                to_ticks(state.ask),
+            )
+        events = [
+            Trade(
+                state.product,
+                trade.tradePrice,
+                trade.tradeQty,
+                trade.aggressor,
+                trade.transactTime.timestamp,
+                to_ticks(trade.tradePrice),
+            )
+            for trade in trades
+        ]
+        self.bus.publish(subscriptions, tob, events)
@@ -0,0 +1,96 @@
+import logging
+
+import NinjaApiCommon_pb2
+import NinjaApiMessages_pb2
+
+from ninja_api_client import NinjaApiClient
+from market_data import MarketData
+from contracts import ContractRegistry
+from config import settings
+from datetime import datetime, timedelta
+
+
+class MarketDataClient(NinjaApiClient):
+    """
+    Receives MARKET_UPDATES on a MARKET_DATA_CONNECTION with its own socket and
+    I/O thread, so book floods never queue in front of order events and fills on
+    the trading connection. Pass its market_data to TradingClient to share it.
+    """
+
+    def __init__(self, products=None):
+        NinjaApiClient.__init__(
+            self, settings.market_data_host, settings.market_data_port
+        )
+        cme = NinjaApiCommon_pb2.Exchange.CME
+        self.products = products or {"NQU5": cme}
+        self.market_data = MarketData(
+            self.products, ContractRegistry(settings.contract_cache)
+        )
+        self.market_data.sender = self.send_msg
+        self.bus = self.market_data.bus
+        self.ticks = self.market_data.ticks
+        self.lastPrintTime = datetime.now().replace(second=0)
+        self.register_handlers()
+
+    def subscribe(self, contracts, cadence=0.0):
+        # See TradingClient.subscribe, which also requests the contract info
+        return self.market_data.subscribe(contracts, cadence)
+
+    def unsubscribe(self, contracts, cadence=0.0):
+        return self.market_data.unsubscribe(contracts, cadence)
+
+    def login_msg(self):
+        login = NinjaApiMessages_pb2.Login()
+        login.user = settings.trading_user
+        login.password = settings.trading_password
+        login.connectionType = (
+            NinjaApiMessages_pb2.ConnectionType.MARKET_DATA_CONNECTION
+        )
+        login.accessToken = settings.market_data_access_token
+        container = NinjaApiMessages_pb2.MsgContainer()
+        container.header.msgType = NinjaApiMessages_pb2.Header.LOGIN_REQUEST
+        container.header.version = "v1.0.0"
+        container.payload = login.SerializeToString()
+        return container
+
+    def register_handlers(self):
+        header = NinjaApiMessages_pb2.Header
+        self.register_handler(header.MARKET_UPDATES, self.on_market_updates)
+        self.register_handler(header.ERROR, self.on_error)
+
+    def on_market_updates(self, payload):
+        if self.disconnected_at is not None:
+            self.mark_recovered()
+        self.market_data.on_market_updates(payload)
+
+    def on_error(self, payload):
+        error = NinjaApiMessages_pb2.Error()
+        error.ParseFromString(payload)
+        logging.info(error.msg)
+
+    def start_session(self):
+        with self.batch():
+            self.send_msg(self.login_msg())
+            for container in self.market_data.start_market_data_msgs():
+                self.send_msg(container)
+
+    def on_connection_lost(self):
+        logging.warning("Market data connection lost. Market data invalidated.")
+        self.market_data.invalidate()
+
+    def run(self):
+        if self.connected:
+            self.start_session()
+        while self.running:
+            if not self.connected:
+                self.reconnect()
+                continue
+            if datetime.now() > self.lastPrintTime + timedelta(seconds=60):
+                logging.info(self.stats.summary())
+                logging.info(self.transport_summary())
+                logging.info(self.bus.summary())
+                logging.info(self.ticks.summary())
+                self.lastPrintTime = datetime.now().replace(second=0)
+            self.poll(1.0)
+
+        self.disconnect()
@@ -0,0 +1,67 @@
+import threading
+
+import NinjaApiMessages_pb2
+import NinjaApiOrderHandling_pb2
+
+
+class MessagePool:
+    """
+    Free lists of protobuf messages per message class, so hot handlers reuse
+    instances instead of allocating one per frame. Only release messages whose
+    fields nobody keeps a reference to (e.g. not ActiveOrders, whose orders are
+    stored in activeOrders).
+    """
+
+    def __init__(self, size: int = 16):
+        self.size = size  # instances kept per message class
+        self.free = {}
+        self.created = 0
+        self.reused = 0
+
+    def take(self, cls):
+        try:
+            msg = self.free[cls].pop()
+        except (KeyError, IndexError):
+            self.created += 1
+            return cls()
+        self.reused += 1
+        return msg
+
+    def acquire(self, cls):
+        msg = self.take(cls)
+        msg.Clear()
+        return msg
+
+    def parse(self, cls, payload):
+        # ParseFromString clears the message first, so no extra Clear() here
+        msg = self.take(cls)
+        msg.ParseFromString(payload)
+        return msg
+
+    def release(self, msg):
+        free = self.free.setdefault(type(msg), [])
+        if len(free) < self.size:
+            free.append(msg)
+
+
+class OutboundTemplates(threading.local):
+    """
+    Per-thread MsgContainer and order request messages that the order builders
+    refill on every call. A returned container is overwritten by the next build
+    on the same thread, so send it before building another.
+    """
+
+    def __init__(self):
+        self.container = NinjaApiMessages_pb2.MsgContainer()
+        self.order_add = NinjaApiOrderHandling_pb2.OrderAdd()
+        self.order_add.timeInForce.type = NinjaApiOrderHandling_pb2.TimeInForce.Type.GTC
+        self.order_change = NinjaApiOrderHandling_pb2.OrderChange()
+        self.order_cancel = NinjaApiOrderHandling_pb2.OrderCancel()
+        self.cancel_all = NinjaApiOrderHandling_pb2.CancelAllOrders()
+        self.active_orders = NinjaApiOrderHandling_pb2.GetActiveOrders()
+        self.active_orders.showOnlyApiOrders = True
+
+    def wrap(self, msg_type, body) -> NinjaApiMessages_pb2.MsgContainer:
+        self.container.header.msgType = msg_type
+        self.container.payload = body.SerializeToString()
+        return self.container
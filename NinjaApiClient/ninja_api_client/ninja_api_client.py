@@ -1,139 +1,423 @@
 import logging
+import selectors
 import socket
 import struct
 import threading
 import time
-import select
+import os
 
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from collections import Counter, deque
+from itertools import islice
 from typing import Optional
 
 import NinjaApiMessages_pb2
+from frame_buffer import FrameBuffer, peek_header
+from message_pool import MessagePool
+from timer_scheduler import timers
 
 
-class NinjaApiClient(ABC):
+def frame_msg(container: NinjaApiMessages_pb2.MsgContainer) -> bytes:
+    serialized_container = container.SerializeToString()
+    return struct.pack("i", len(serialized_container)) + serialized_container
+
+
+def heartbeat_frame() -> bytes:
+    container = NinjaApiMessages_pb2.MsgContainer()
+    container.header.msgType = NinjaApiMessages_pb2.Header.HEARTBEAT
+    return frame_msg(container)
+
+
+HEARTBEAT_FRAME = heartbeat_frame()
+HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+try:
+    IOV_MAX = min(os.sysconf("SC_IOV_MAX"), 1024)
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 16
+
+
+class DispatchStats:
+    # Inbound message counters, reset into a new window on every summary()
+    def __init__(self):
+        self.received = 0
+        self.unhandled = 0
+        self.by_type = Counter()
+        self.window_start = time.monotonic()
+        self.window_received = 0
+
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.window_start
+        if elapsed <= 0:
+            return 0.0
+        return (self.received - self.window_received) / elapsed
+
+    def summary(self) -> str:
+        rate = self.rate()
+        self.window_start = time.monotonic()
+        self.window_received = self.received
+        top = ", ".join(
+            f"{NinjaApiMessages_pb2.Header.MsgType.Name(msg_type)}: {count}"
+            for msg_type, count in self.by_type.most_common(5)
+        )
+        return (
+            f"Received {self.received} msgs ({self.unhandled} unhandled), "
+            f"{rate:,.0f} msgs/s since last summary. Top: {top}"
+        )
+
+
+class MessageDispatcher:
+    # Routes inbound payloads to handlers by Header.MsgType. Shared by the
+    # threaded NinjaApiClient and the asyncio AsyncNinjaApiClient.
+    def __init__(self):
+        self.handlers = {}
+        self.stats = DispatchStats()
+        self.pool = MessagePool()  # reusable inbound messages for the handlers
+
+    def register_handler(self, msg_type, handler):
+        # handler(payload) gets the serialized typed message; a memoryview
+        # that is only valid during the call, so parse or copy it there
+        self.handlers[msg_type] = handler
+
+    def wants(self, msg_type) -> bool:
+        # Counts every inbound frame; False means its payload can be skipped
+        self.stats.received += 1
+        self.stats.by_type[msg_type] += 1
+        if msg_type in self.handlers:
+            return True
+        self.stats.unhandled += 1
+        return False
+
+    def dispatch(self, msg_type, payload):
+        self.handlers[msg_type](payload)
+
+
+class NinjaApiClient(MessageDispatcher, ABC):
     def __init__(self, host: str, port: int):
+        super().__init__()
         self.connected = False
         self.host = host
         self.port = port
-        self.frame = b""
-        self.msg = b""
-        self.send_lock = threading.Lock()  # Guards self.sock.sendall
+        self.send_lock = threading.Lock()  # Guards self.outbound and socket sends
+        self.send_ready = threading.Condition(self.send_lock)
+        self.max_drain = 1_000  # messages handled per poll before yielding
+        self.heartbeat_interval = 5  # seconds without outbound traffic
+        self.high_water = 4 << 20  # bytes queued before senders are paused
+        self.low_water = 1 << 20  # bytes queued before paused senders resume
+        self.send_timeout = 30.0  # seconds a paused sender waits before giving up
+        self.frames_sent = 0
+        self.send_calls = 0
+        self.io_thread = None  # thread running poll(), never paused by backpressure
+        self.cork = 0  # nesting depth of batch() blocks
+        self.running = True  # False once disconnect() is called, stops reconnects
+        self.stopping = threading.Event()  # interrupts reconnect backoff waits
+        self.reconnect_delay = 0.5  # first backoff in seconds, doubled per failure
+        self.reconnect_max_delay = 30.0
+        self.reconnects = 0
+        self.disconnected_at = None  # monotonic time the connection was lost
+        self.recovery_times = deque(maxlen=100)  # seconds from drop to first data
         self.connect()
 
     def connect(self):
+        # self.sock is only replaced once the new socket is connected, it may
+        # still be the one close_transport() closed
+        sock = None
         try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.connect((self.host, self.port))
-            self.sock.setblocking(False)
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.connect((self.host, self.port))
+            sock.setblocking(False)
+            selector = selectors.DefaultSelector()
+            selector.register(sock, selectors.EVENT_READ)
         except:
             logging.exception(
                 f"Failed to connect Ninja API endpoint at {self.host}:{self.port}"
             )
-            return
+            if sock is not None:
+                sock.close()
+            return False
+        self.sock = sock
+        self.selector = selector
+        self.rx = FrameBuffer()
+        self.pending = deque()
+        self.outbound = deque()  # serialized frames not yet accepted by the kernel
+        self.outbound_bytes = 0
+        self.send_paused = False
+        self.write_interest = False
         self.connected = True
-        self.hb_thread = threading.Thread(target=self.send_heartbeats)
-        self.hb_thread.start()
+        self.last_send_time = time.monotonic()
+        self.hb_timer = timers.call_later(self.heartbeat_interval, self.send_heartbeat)
+        return True
 
     def disconnect(self):
+        # Closes the session for good: run loops exit instead of reconnecting
+        self.running = False
+        self.stopping.set()
+        self.close_transport()
+
+    def connection_lost(self):
+        # Called on send/receive failures. The run loop notices connected is
+        # False and rebuilds the session through reconnect().
+        if self.close_transport():
+            self.disconnected_at = time.monotonic()
+            self.on_connection_lost()
+
+    def close_transport(self) -> bool:
+        with self.send_lock:
+            if not self.connected:
+                return False
+            self.connected = False
+            self.send_ready.notify_all()
+        self.hb_timer.cancel()
+        self.selector.close()
+        self.sock.close()
+        return True
+
+    def reconnect(self) -> bool:
+        # Retries with exponential backoff until connected or disconnect() is
+        # called, then re-runs the login handshake through start_session().
+        if self.disconnected_at is None:
+            self.disconnected_at = time.monotonic()
+        delay = self.reconnect_delay
+        while self.running and not self.connected:
+            if self.stopping.wait(delay):
+                return False
+            logging.info(f"Reconnecting to {self.host}:{self.port}")
+            if not self.connect():
+                delay = min(delay * 2, self.reconnect_max_delay)
         if not self.connected:
+            return False
+        self.reconnects += 1
+        self.start_session()
+        return True
+
+    def mark_recovered(self):
+        # Called by the session on the first live data after a reconnect
+        if self.disconnected_at is None:
             return
-        self.connected = False
-        self.hb_thread.join()
-        self.sock.close()
+        elapsed = time.monotonic() - self.disconnected_at
+        self.disconnected_at = None
+        self.recovery_times.append(elapsed)
+        logging.info(f"Session recovered {elapsed:.3f}s after connection loss")
+
+    def start_session(self):
+        # Sends the login handshake and any subscriptions on a fresh connection
+        pass
+
+    def on_connection_lost(self):
+        # Invalidate state that is stale while the connection is down
+        pass
 
     def send_msg(self, container: NinjaApiMessages_pb2.MsgContainer):
         if not self.connected:
             logging.error("Not connected. Cannot send messages.")
             return
-        serialized_container = container.SerializeToString()
-        framing = struct.pack("i", len(serialized_container))
+        self.send_frame(frame_msg(container))
+
+    def send_frame(self, frame: bytes, block: bool = True):
+        # Queues an already framed message. With block=False a paused queue
+        # drops the frame instead of waiting (used for heartbeats).
         with self.send_lock:
+            drained = True
+            if self.send_paused and threading.current_thread() is not self.io_thread:
+                if not block:
+                    return
+                # Backpressure: hold producers until the I/O thread drains the
+                # queue below low_water. The I/O thread itself never waits here.
+                drained = self.send_ready.wait_for(
+                    lambda: not self.send_paused or not self.connected,
+                    self.send_timeout,
+                )
+                if not self.connected:
+                    return
+            if drained:
+                self.outbound.append(frame)
+                self.outbound_bytes += len(frame)
+                self.last_send_time = time.monotonic()
+                ok = self.cork > 0 or self.flush_locked()
+            else:
+                logging.error("Send queue did not drain. Reconnecting client.")
+                ok = False
+        if not ok:
+            self.connection_lost()
+
+    @contextmanager
+    def batch(self):
+        # Frames sent inside the block are only queued, then written together
+        # with as few sendmsg() calls as possible when the block exits.
+        with self.send_lock:
+            self.cork += 1
+        try:
+            yield
+        finally:
+            with self.send_lock:
+                self.cork -= 1
+                flush = self.cork == 0
+            if flush and self.connected:
+                self.flush()
+
+    def flush(self) -> bool:
+        with self.send_lock:
+            ok = self.flush_locked()
+        if not ok:
+            self.connection_lost()
+        return ok
+
+    def flush_locked(self) -> bool:
+        # Writes as many queued frames as the socket accepts, gathering up to
+        # IOV_MAX of them into one sendmsg() call. Returns False on a fatal error.
+        while self.outbound:
             try:
-                self.sock.sendall(framing + serialized_container)
+                if HAS_SENDMSG:
+                    sent = self.sock.sendmsg(islice(self.outbound, IOV_MAX))
+                else:
+                    sent = self.sock.send(b"".join(islice(self.outbound, IOV_MAX)))
+            except BlockingIOError:
+                self.set_write_interest(True)
+                break
             except:
-                logging.exception("Failed sending message. Disconnecting client.")
-                self.disconnect()
-
-    # def send_msg(self, container: NinjaApiMessages_pb2.MsgContainer):
-    #     if not self.connected:
-    #         logging.error("Not connected. Cannot send messages.")
-    #         return
-
-    #     serialized_container = container.SerializeToString()
-    #     framing = struct.pack("i", len(serialized_container))
-    #     data = framing + serialized_container
-
-    #     with self.send_lock:
-    #         total_sent = 0
-
-    #         try:
-    #             while total_sent < len(data):
-    #                 try:
-    #                     sent = self.sock.send(data[total_sent:])
-    #                     if sent == 0:
-    #                         raise RuntimeError("Socket connection broken")
-    #                     total_sent += sent
-
-    #                 except BlockingIOError:
-    #                     # Wait until the socket is writable before trying again
-    #                     ready_to_write, _, _ = select.select(
-    #                         [], [self.sock], [], 30.0
-    #                     )  # 30s timeout
-    #                     if not ready_to_write:
-    #                         raise TimeoutError("Socket not writable within timeout")
-
-    #         except Exception:
-    #             logging.exception("Failed sending message. Disconnecting client.")
-    #             self.disconnect()
+                logging.exception("Failed sending message. Reconnecting client.")
+                return False
+            self.send_calls += 1
+            self.outbound_bytes -= sent
+            while sent:
+                head = self.outbound[0]
+                if sent >= len(head):
+                    sent -= len(head)
+                    self.outbound.popleft()
+                    self.frames_sent += 1
+                else:
+                    self.outbound[0] = memoryview(head)[sent:]
+                    sent = 0
+        if not self.outbound:
+            self.set_write_interest(False)
+        if not self.send_paused and self.outbound_bytes > self.high_water:
+            self.send_paused = True
+            logging.warning(
+                f"Send queue above high water ({self.outbound_bytes} bytes). Pausing senders."
+            )
+        elif self.send_paused and self.outbound_bytes <= self.low_water:
+            self.send_paused = False
+            self.send_ready.notify_all()
+        return True
+
+    def set_write_interest(self, enabled: bool):
+        # Ask the selector to wake the I/O thread once the socket is writable
+        if enabled == self.write_interest:
+            return
+        events = selectors.EVENT_READ
+        if enabled:
+            events |= selectors.EVENT_WRITE
+        try:
+            self.selector.modify(self.sock, events)
+            self.write_interest = enabled
+        except (KeyError, OSError, ValueError):
+            pass
+
+    @property
+    def outbound_depth(self) -> int:
+        return len(self.outbound)
+
+    def transport_summary(self) -> str:
+        frames_per_call = self.frames_sent / self.send_calls if self.send_calls else 0
+        return (
+            f"Sent {self.frames_sent} frames in {self.send_calls} syscalls "
+            f"({frames_per_call:.2f} frames/call), "
+            f"{self.outbound_depth} frames ({self.outbound_bytes} bytes) queued, "
+            f"{self.reconnects} reconnects"
+            + (
+                f", last recovery {self.recovery_times[-1]:.3f}s"
+                if self.recovery_times
+                else ""
+            )
+        )
 
     def recv_msg(self) -> Optional[NinjaApiMessages_pb2.MsgContainer]:
+        # Copying wrapper around recv_frame() for callers that want containers
+        frame = self.recv_frame()
+        if frame is None:
+            return None
+        container = NinjaApiMessages_pb2.MsgContainer()
+        container.header.msgType = frame[0]
+        container.payload = bytes(frame[1])
+        return container
+
+    def recv_frame(self):
+        # Returns the next (msg_type, payload) with a registered handler. Only
+        # the header is decoded here; payload is a memoryview into the receive
+        # buffer that stays valid until the pending frames are used up.
         if not self.connected:
             print("Not connected. Cannot receive messages.")
             return None
-        frame_size = struct.calcsize("i")
-        try:
-            while len(self.frame) < frame_size:
-                buffer = self.sock.recv(frame_size - len(self.frame))
-                if not buffer:
-                    logging.info("Server disconnected")
-                    self.disconnect()
-                    return None
-                self.frame += buffer
-            msg_size = struct.unpack("i", self.frame)[0]
-            while len(self.msg) < msg_size:
-                buffer = self.sock.recv(msg_size - len(self.msg))
-                if not buffer:
+        if not self.pending:
+            try:
+                if not self.rx.recv_into(self.sock):
                     logging.info("Server disconnected")
-                    self.disconnect()
+                    self.connection_lost()
                     return None
-                self.msg += buffer
-            container = NinjaApiMessages_pb2.MsgContainer()
-            container.ParseFromString(self.msg)
-            self.frame = b""
-            self.msg = b""
-            return container
-        except BlockingIOError:
-            return None
-        except:
-            logging.exception("Receive error. Disconnecting client.")
-            self.disconnect()
-            return None
-
-    def send_heartbeats(self):
-        container = NinjaApiMessages_pb2.MsgContainer()
-        container.header.msgType = NinjaApiMessages_pb2.Header.HEARTBEAT
-        last_send_time = time.time()
-        sleep_time = 0.001  # 1 millisecond
-        while self.connected:
-            while (time.time() - last_send_time) + sleep_time < 5:
+                for frame in self.rx.frames():
+                    msg_type, payload = peek_header(frame)
+                    if self.wants(msg_type):
+                        self.pending.append((msg_type, payload))
+            except BlockingIOError:
+                return None
+            except:
                 if not self.connected:
-                    return
-                else:
-                    time.sleep(sleep_time)
-            # logging.info("Sending HEARTBEAT")
-            self.send_msg(container)
-            last_send_time = time.time()
+                    return None  # socket closed by another thread
+                logging.exception("Receive error. Reconnecting client.")
+                self.connection_lost()
+                return None
+        if self.pending:
+            return self.pending.popleft()
+        return None
+
+    def wait_for_data(self, timeout: Optional[float] = None) -> bool:
+        # Blocks (epoll/kqueue/select) until the socket is readable or the
+        # timeout in seconds expires, so idle run loops do not spin. Queued
+        # outbound frames are flushed whenever the socket turns writable.
+        if not self.connected:
+            return False
+        try:
+            events = self.selector.select(timeout)
+        except (OSError, ValueError):
+            return False
+        readable = False
+        for _, mask in events:
+            if mask & selectors.EVENT_WRITE:
+                self.flush()
+            if mask & selectors.EVENT_READ:
+                readable = True
+        return readable
+
+    def poll(self, timeout: Optional[float] = None) -> int:
+        # Dispatches every message that is already available (up to max_drain)
+        # and only blocks for up to timeout seconds when there was nothing to do.
+        self.io_thread = threading.current_thread()
+        if not self.connected:
+            return 0
+        handled = 0
+        while handled < self.max_drain:
+            frame = self.recv_frame()
+            if frame is None:
+                break
+            self.dispatch(*frame)
+            handled += 1
+        if handled == 0:
+            self.wait_for_data(timeout)
+        return handled
+
+    def send_heartbeat(self):
+        # Runs on the shared timer thread. Any frame sent within the interval
+        # already proves the connection is alive, so only idle sessions get one.
+        if not self.connected:
+            return
+        idle = time.monotonic() - self.last_send_time
+        if idle >= self.heartbeat_interval:
+            self.send_frame(HEARTBEAT_FRAME, block=False)
+            idle = 0
+        if self.connected:
+            self.hb_timer = timers.call_later(
+                self.heartbeat_interval - idle, self.send_heartbeat
+            )
 
     @abstractmethod
     def run(self):
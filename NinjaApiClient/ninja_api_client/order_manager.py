@@ -0,0 +1,564 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+
+from collections import Counter, deque
+from collections.abc import ItemsView, Mapping, ValuesView
+from typing import NamedTuple, Optional
+
+import NinjaApiOrderHandling_pb2
+
+
+class Order(NamedTuple):
+    # A working order, field names follow ActiveOrder
+    orderNo: str
+    product: str
+    exchange: int
+    side: int  # NinjaApiCommon_pb2.Side
+    qty: int  # still working
+    price: float
+    prefix: str
+    account: str
+    sheet: str
+    filled: int = 0  # filled so far, as far as this session saw
+    tag: str = ""  # given to order() by this session
+
+
+PENDING_TIMEOUT = 10.0  # seconds an order add may go unanswered before it is given up
+
+
+def order_from(msg, filled=0, tag="") -> Order:
+    # From an ActiveOrder, OrderAddEvent or OrderChangeEvent
+    return Order(
+        msg.orderNo,
+        msg.contract.secDesc,
+        msg.contract.exchange,
+        msg.side,
+        msg.qty,
+        msg.price,
+        msg.prefix,
+        msg.account,
+        msg.sheet,
+        filled,
+        tag,
+    )
+
+
+def index_keys(order):
+    # The keys of an order in OrderView.by_account, by_contract and by_prefix
+    return (
+        order.account,
+        (order.account, order.product, order.side),
+        (order.account, order.prefix),
+    )
+
+
+SHARDS = 64  # of a ShardedMap
+
+
+class ShardedMap(Mapping):
+    """
+    A read-only mapping split by key hash into SHARDS dicts. with_changes()
+    returns a new map sharing every shard it does not touch, so a change
+    copies one shard, not the whole map.
+    """
+
+    __slots__ = ("shards", "size")
+
+    def __init__(self, shards=({},) * SHARDS, size=0):
+        self.shards = shards  # never mutated once the map is built
+        self.size = size
+
+    @classmethod
+    def from_items(cls, items) -> "ShardedMap":
+        shards = tuple({} for _ in range(SHARDS))
+        for key, value in items:
+            shards[hash(key) % SHARDS][key] = value
+        return cls(shards, sum(map(len, shards)))
+
+    def with_changes(self, changes) -> "ShardedMap":
+        # changes is {key: value, or None to remove}
+        shards = list(self.shards)
+        size = self.size
+        for key, value in changes.items():
+            i = hash(key) % SHARDS
+            shard = shards[i]
+            if shard is self.shards[i]:
+                shard = shards[i] = dict(shard)
+            if value is None:
+                if shard.pop(key, None) is not None:
+                    size -= 1
+            else:
+                size += key not in shard
+                shard[key] = value
+        return ShardedMap(tuple(shards), size)
+
+    def __getitem__(self, key):
+        return self.shards[hash(key) % SHARDS][key]
+
+    def get(self, key, default=None):
+        return self.shards[hash(key) % SHARDS].get(key, default)
+
+    def __contains__(self, key):
+        return key in self.shards[hash(key) % SHARDS]
+
+    def __iter__(self):
+        for shard in self.shards:
+            yield from shard
+
+    def __len__(self):
+        return self.size
+
+    def values(self):
+        return ShardedValues(self)
+
+    def items(self):
+        return ShardedItems(self)
+
+    def __repr__(self):
+        return f"ShardedMap({dict(self.items())})"
+
+
+class ShardedValues(ValuesView):
+    def __iter__(self):
+        for shard in self._mapping.shards:
+            yield from shard.values()
+
+
+class ShardedItems(ItemsView):
+    def __iter__(self):
+        for shard in self._mapping.shards:
+            yield from shard.items()
+
+
+def copied_bucket(index, changed, key) -> dict:
+    # The bucket of key in changed, copied from index the first time
+    bucket = changed.get(key)
+    if bucket is None:
+        bucket = changed[key] = dict(index.get(key, {}))
+    return bucket
+
+
+class OrderView(NamedTuple):
+    # One consistent state of the working orders and its indexes, every
+    # index maps a key to {orderNo: Order}
+    active: ShardedMap  # orderNo -> Order
+    by_account: ShardedMap  # account
+    by_contract: ShardedMap  # (account, product, side)
+    by_prefix: ShardedMap  # (account, worker prefix)
+    working_qty: ShardedMap  # (account, product, side) -> qty still working, no zeros
+
+    @classmethod
+    def build(cls, active) -> "OrderView":
+        indexes = ({}, {}, {})
+        working_qty = {}
+        for orderNo, order in active.items():
+            for index, key in zip(indexes, index_keys(order)):
+                index.setdefault(key, {})[orderNo] = order
+            key = (order.account, order.product, order.side)
+            working_qty[key] = working_qty.get(key, 0) + order.qty
+        return cls(
+            *(
+                ShardedMap.from_items(items.items())
+                for items in (active, *indexes, working_qty)
+            )
+        )
+
+    def apply(self, changes) -> "OrderView":
+        # A new view with changes {orderNo: Order, or None to remove} applied.
+        # Only the shards and index buckets of the changed orders are copied
+        indexes = (self.by_account, self.by_contract, self.by_prefix)
+        buckets = ({}, {}, {})  # per index, key -> its new bucket, empty to remove
+        working_qty = {}  # key -> its new qty, 0 to remove
+        for orderNo, order in changes.items():
+            previous = self.active.get(orderNo)
+            old_keys = (None,) * 3 if previous is None else index_keys(previous)
+            new_keys = (None,) * 3 if order is None else index_keys(order)
+            for key, qty in ((old_keys[1], -1), (new_keys[1], 1)):
+                if key is not None:
+                    qty *= (previous if qty < 0 else order).qty
+                    total = working_qty.get(key, self.working_qty.get(key, 0))
+                    working_qty[key] = total + qty
+            for index, changed, old, new in zip(indexes, buckets, old_keys, new_keys):
+                if old is not None and old != new:
+                    del copied_bucket(index, changed, old)[orderNo]
+                if new is not None:
+                    copied_bucket(index, changed, new)[orderNo] = order
+        return OrderView(
+            self.active.with_changes(changes),
+            *(
+                index.with_changes(
+                    {key: bucket or None for key, bucket in changed.items()}
+                )
+                for index, changed in zip(indexes, buckets)
+            ),
+            self.working_qty.with_changes(
+                {key: total or None for key, total in working_qty.items()}
+            ),
+        )
+
+
+def settle(future, value):
+    if not future.done():  # the awaiting task may have been cancelled
+        future.set_result(value)
+
+
+class OrderHandle:
+    """
+    An order add sent by order() or flatten(), resolved by the server's answer:
+    ORDER_ADD_EVENT gives it its orderNo, ORDER_ADD_FAILURE a reason. OrderAdd
+    carries no client order id, so an answer goes to the oldest pending handle
+    with the same account, product, side, qty and price.
+
+    Poll it with done(), block with wait() or await it from a coroutine; all
+    of them give the orderNo, None if the add failed. By the time it resolves
+    the order is already in OrderManager.active. A failure that still names
+    an orderNo keeps it as failed_orderNo.
+    """
+
+    PENDING = "PENDING"
+    ACKED = "ACKED"
+    FAILED = "FAILED"
+
+    def __init__(self, orderadd, tag=""):
+        # Copies the fields of the OrderAdd, it is a template reused by the next order
+        self.tag = tag
+        self.account = orderadd.account
+        self.product = orderadd.contract.secDesc
+        self.side = orderadd.side
+        self.qty = orderadd.qty
+        self.price = orderadd.price
+        self.prefix = orderadd.prefix
+        self.status = self.PENDING
+        self.orderNo = None
+        self.reason = ""
+        self.failed_orderNo = (
+            None  # the exchange's orderNo of a failed add, if it gave one
+        )
+        self.sent_at = time.time_ns()
+        self.answered_at = None  # epoch nanoseconds
+        self.resolved = threading.Event()
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def matches(self, msg) -> bool:
+        # msg is an OrderAddEvent or OrderAddFailure
+        return (
+            msg.contract.secDesc == self.product
+            and msg.account == self.account
+            and msg.side == self.side
+            and msg.qty == self.qty
+            and math.isclose(msg.price, self.price)
+        )
+
+    def resolve(self, status, orderNo=None, reason=""):
+        with self.lock:
+            if self.status != self.PENDING:
+                return
+            self.status = status
+            self.orderNo = orderNo
+            self.reason = reason
+            self.answered_at = time.time_ns()
+            callbacks, self.callbacks = self.callbacks, []
+        self.resolved.set()
+        for callback in callbacks:
+            try:
+                callback(self)
+            except:
+                logging.exception(f"Order handle callback {callback} failed")
+
+    def done(self) -> bool:
+        return self.status != self.PENDING
+
+    """
+    Wait for the server's answer
+    Parameters:
+        timeout (float, optional): Seconds to wait, None waits until answered.
+    Returns:
+        str: the orderNo, None if the add failed or the wait timed out (see status)
+    """
+
+    def wait(self, timeout=None) -> Optional[str]:
+        self.resolved.wait(timeout)
+        return self.orderNo
+
+    def add_done_callback(self, callback):
+        # Called with the handle once it resolves, on the connection's I/O thread
+        with self.lock:
+            if self.status == self.PENDING:
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    def __await__(self):
+        # Resolves on another thread with the threaded client, hand it to this loop
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.add_done_callback(
+            lambda handle: loop.call_soon_threadsafe(settle, future, handle.orderNo)
+        )
+        return future.__await__()
+
+    def latency(self) -> Optional[float]:
+        # Seconds from sending to the answer, None while pending
+        if self.answered_at is None:
+            return None
+        return (self.answered_at - self.sent_at) / 1e9
+
+    def __repr__(self):
+        return (
+            f"OrderHandle({self.tag or self.prefix} {self.product} {self.qty} "
+            f"at {self.price}: {self.status} {self.orderNo or self.reason})"
+        )
+
+
+class OrderManager:
+    """
+    Working orders of the trading connection, kept current from the order
+    events as they arrive (add, change, cancel, mass cancel, reject and
+    fill). ACTIVE_ORDERS is only a periodic reconciliation that replaces the
+    state with the server's and counts what the events had missed.
+
+    view (the active orders and their indexes by account, contract and
+    worker prefix) is replaced, never mutated, so a reader holding it (or an
+    Order from it) has a consistent snapshot and never sees a half applied
+    update. version grows with every event and reconciliation. Only the
+    connection's I/O thread writes.
+    """
+
+    def __init__(self):
+        self.view = OrderView.build({})
+        self.version = 0
+        self.changed = threading.Condition()
+        self.events = 0
+        self.reconciles = 0
+        self.corrections = 0  # orders a reconciliation added, dropped or fixed
+        self.last_update = None  # time.monotonic() of the latest change
+        self.pending = deque()  # OrderHandle waiting for an answer, oldest first
+        self.pending_qty = Counter()  # (account, product, side) -> qty of pending adds
+        self.lock = threading.Lock()  # guards pending, orders are sent on any thread
+        self.acks = 0
+        self.failures = 0
+        self.ack_time = 0.0  # seconds, summed over acked handles
+
+    @property
+    def active(self):
+        return self.view.active  # orderNo -> Order
+
+    def publish(self, view):
+        with self.changed:
+            self.view = view
+            self.version += 1
+            self.last_update = time.monotonic()
+            self.changed.notify_all()
+
+    def put(self, order: Order):
+        self.events += 1
+        self.publish(self.view.apply({order.orderNo: order}))
+
+    def remove(self, orderNos):
+        self.events += 1
+        self.publish(self.view.apply(dict.fromkeys(orderNos)))
+
+    """
+    Get the working orders of an account
+    Parameters:
+        account (str): The account identifier the orders were placed from.
+    Returns:
+        dict: {orderNo: Order}, empty if there are none, do not modify it
+    """
+
+    def for_account(self, account) -> dict:
+        return self.view.by_account.get(account, {})
+
+    """
+    Get the working orders of an account on one side of a contract
+    Parameters:
+        account (str): The account identifier the orders were placed from.
+        product (str): The symbol or product name being traded (e.g., 'ESU5').
+        side (Side Enum): NinjaApiCommon_pb2.Side.BUY or SELL.
+    Returns:
+        dict: {orderNo: Order}, empty if there are none, do not modify it
+    """
+
+    def for_contract(self, account, product, side) -> dict:
+        return self.view.by_contract.get((account, product, side), {})
+
+    """
+    Get the working orders of an account with a worker prefix
+    Parameters:
+        account (str): The account identifier the orders were placed from.
+        prefix (str): The worker prefix the orders were sent with (e.g., 'G').
+    Returns:
+        dict: {orderNo: Order}, empty if there are none, do not modify it
+    """
+
+    def for_prefix(self, account, prefix) -> dict:
+        return self.view.by_prefix.get((account, prefix), {})
+
+    def track(self, orderadd, tag="") -> OrderHandle:
+        # Before the OrderAdd is sent, its answer may arrive before send returns
+        handle = OrderHandle(orderadd, tag)
+        with self.lock:
+            self.pending.append(handle)
+            self.pending_qty[handle.account, handle.product, handle.side] += handle.qty
+        return handle
+
+    def unpend(self, handle):
+        # Under self.lock
+        self.pending.remove(handle)
+        key = handle.account, handle.product, handle.side
+        self.pending_qty[key] -= handle.qty
+        if self.pending_qty[key] <= 0:
+            del self.pending_qty[key]
+
+    def match(self, msg) -> Optional[OrderHandle]:
+        with self.lock:
+            for handle in self.pending:
+                if handle.matches(msg):
+                    self.unpend(handle)
+                    return handle
+        return None
+
+    def match_reject(self, event) -> Optional[OrderHandle]:
+        # An OrderRejectEvent has no side, qty or price, it goes to the oldest
+        # pending add on its account and product
+        with self.lock:
+            for handle in self.pending:
+                if (
+                    handle.product == event.contract.secDesc
+                    and handle.account == event.account
+                ):
+                    self.unpend(handle)
+                    return handle
+        return None
+
+    def fail(self, handle, reason):
+        with self.lock:
+            if handle in self.pending:
+                self.unpend(handle)
+        self.failures += 1
+        handle.resolve(OrderHandle.FAILED, reason=reason)
+
+    def fail_pending(self, reason, older_than=None):
+        # Give up on unanswered order adds, all of them or those sent before
+        # older_than (epoch nanoseconds)
+        with self.lock:
+            expired = [
+                handle
+                for handle in self.pending
+                if older_than is None or handle.sent_at < older_than
+            ]
+            for handle in expired:
+                self.unpend(handle)
+        for handle in expired:
+            logging.warning(f"Order add {handle} given up: {reason}")
+            self.failures += 1
+            handle.resolve(OrderHandle.FAILED, reason=reason)
+
+    def on_add(self, event):
+        # An add triggered by another order (triggerOrderNo) was not sent by order()
+        handle = None if event.triggerOrderNo else self.match(event)
+        self.put(order_from(event, tag=handle.tag if handle else ""))
+        if handle is not None:
+            handle.resolve(OrderHandle.ACKED, event.orderNo)
+            self.acks += 1
+            self.ack_time += handle.latency()
+
+    def on_add_failure(self, failure):
+        handle = self.match(failure)
+        self.events += 1
+        if handle is not None:
+            self.failures += 1
+            handle.failed_orderNo = failure.orderNo or None
+            handle.resolve(OrderHandle.FAILED, reason=failure.reason)
+
+    def on_change(self, event):
+        known = self.active.get(event.orderNo)
+        if known is None:
+            self.put(order_from(event))
+        else:
+            self.put(order_from(event, known.filled, known.tag))
+
+    def on_cancel(self, event):
+        self.remove({event.orderNo})
+
+    def on_mass_cancel(self, event):
+        self.remove({canceled.orderNo for canceled in event.canceledOrders})
+
+    def on_reject(self, event) -> Optional[OrderHandle]:
+        # A rejected change or cancel leaves the order as it was. A rejected add
+        # that was never acked answers its pending handle, which is returned
+        if event.action != NinjaApiOrderHandling_pb2.OrderRejectEvent.ADD:
+            self.events += 1
+            return None
+        if event.orderNo in self.active:
+            self.remove({event.orderNo})
+            return None
+        handle = self.match_reject(event)
+        self.events += 1
+        if handle is not None:
+            self.failures += 1
+            handle.resolve(OrderHandle.FAILED, reason=event.reason)
+        return handle
+
+    def on_fill(self, fill):
+        order = self.active.get(fill.orderNo)
+        if order is None:  # not a working order of this session
+            self.events += 1
+            return
+        remaining = order.qty - fill.qty
+        if remaining <= 0 or not fill.isPartialFill:
+            self.remove({fill.orderNo})
+        else:
+            self.put(order._replace(qty=remaining, filled=order.filled + fill.qty))
+
+    def reconcile(self, active_orders):
+        # Swap in the server's view from an ACTIVE_ORDERS_RESPONSE
+        known = self.active
+        active = {}
+        for active_order in active_orders:
+            if active_order.qty != 0:
+                previous = known.get(active_order.orderNo)
+                active[active_order.orderNo] = (
+                    order_from(active_order)
+                    if previous is None
+                    else order_from(active_order, previous.filled, previous.tag)
+                )
+        corrections = len(known.keys() ^ active.keys()) + sum(
+            1
+            for orderNo, order in active.items()
+            if orderNo in known and known[orderNo] != order
+        )
+        if corrections:
+            logging.warning(f"Order reconciliation corrected {corrections} orders")
+            self.corrections += corrections
+        self.reconciles += 1
+        self.publish(OrderView.build(active))
+        # whatever an unanswered add did shows up in the reconciliation
+        self.fail_pending("no answer", time.time_ns() - int(PENDING_TIMEOUT * 1e9))
+
+    """
+    Wait until the orders changed after a version
+    Parameters:
+        version (int): The version the caller has seen.
+        timeout (float, optional): Seconds to wait, None waits until a change.
+    Returns:
+        int: the current version, still version if the wait timed out
+    """
+
+    def wait(self, version, timeout=None) -> int:
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def summary(self) -> str:
+        ack_time = f"{self.ack_time / self.acks * 1e3:.1f} ms" if self.acks else "-"
+        return (
+            f"Orders: {len(self.active)} working, {self.events} events, "
+            f"{self.reconciles} reconciliations, {self.corrections} corrected, "
+            f"{self.acks} adds acked in {ack_time} on average, "
+            f"{self.failures} failed, {len(self.pending)} pending"
+        )
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import threading
+import time
+
+from collections import Counter
+from typing import Optional
+
+RATE_LIMIT_RECOVERY = (
+    60.0  # seconds without a rate limit error before the full rate returns
+)
+
+
+class TokenBucket:
+    """
+    Client side throttle for order requests, so bursts are spread out here
+    instead of being answered with RATE_LIMIT_EXCEEDED. Every request takes a
+    token; tokens refill at rate per second up to burst.
+
+    Urgent requests (cancels and flattens) may take the last urgent_reserve
+    tokens, other requests wait until the bucket holds more than that, so
+    under load cancels and flattens go first. A rate limit error from the
+    server halves the rate until RATE_LIMIT_RECOVERY seconds pass without one.
+    """
+
+    def __init__(self, rate, burst, urgent_reserve=2):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(burst, urgent_reserve + 1)
+        self.urgent_reserve = urgent_reserve
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.limited_at = None  # time.monotonic() of the last rate limit error
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.delayed = 0
+        self.delay = 0.0  # seconds, summed over delayed requests
+        self.rate_limited = 0
+
+    def refill(self, now):
+        if self.limited_at is not None and now - self.limited_at > RATE_LIMIT_RECOVERY:
+            self.rate = self.max_rate
+            self.limited_at = None
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    """
+    Take a token if one is available to this priority
+    Parameters:
+        urgent (bool, optional): A cancel or flatten, may use the urgent reserve.
+    Returns:
+        float: 0.0 if a token was taken, otherwise seconds until one is available
+    """
+
+    def reserve(self, urgent=False) -> float:
+        with self.lock:
+            self.refill(time.monotonic())
+            floor = 0 if urgent else self.urgent_reserve
+            if self.tokens >= floor + 1:
+                self.tokens -= 1
+                self.sent += 1
+                return 0.0
+            return (floor + 1 - self.tokens) / self.rate
+
+    def acquire(self, urgent=False):
+        # Blocks the calling thread until the request may be sent
+        waited = 0.0
+        while True:
+            delay = self.reserve(urgent)
+            if delay == 0.0:
+                break
+            time.sleep(delay)
+            waited += delay
+        self.record(waited)
+
+    async def acquire_async(self, urgent=False):
+        waited = 0.0
+        while True:
+            delay = self.reserve(urgent)
+            if delay == 0.0:
+                break
+            await asyncio.sleep(delay)
+            waited += delay
+        self.record(waited)
+
+    def refund(self):
+        # Returns the token of a request that was not sent after all
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + 1)
+            self.sent -= 1
+
+    def record(self, waited):
+        if waited:
+            self.delayed += 1
+            self.delay += waited
+
+    def on_rate_limited(self):
+        # The server rejected a request for its rate, back off
+        with self.lock:
+            self.rate_limited += 1
+            self.rate = max(self.rate / 2, self.max_rate / 8)
+            self.tokens = min(self.tokens, 0.0)
+            self.limited_at = time.monotonic()
+        logging.warning(
+            f"Order rate limited by the server, throttling to {self.rate:g}/s"
+        )
+
+    def summary(self) -> str:
+        delay = f"{self.delay / self.delayed * 1e3:.1f} ms" if self.delayed else "-"
+        return (
+            f"Order throttle: {self.sent} sent at up to {self.rate:g}/s, "
+            f"{self.delayed} delayed by {delay} on average, "
+            f"{self.rate_limited} rate limit errors"
+        )
+
+
+class SheetRiskBudget:
+    """
+    Order adds left per sheet (maxOrders - ordersSent of SHEET_RISK_RESPONSE)
+    and its clip size, kept current by counting ORDER_ADD_EVENTs, so an add
+    the server would refuse is refused here without a round trip. An OrderAdd
+    names no sheet, so a product counts against every sheet that lists it,
+    and adds in flight count until they are answered.
+
+    The last reserve adds of a sheet are kept for urgent adds (flattens), so
+    a session never runs out of adds while it still holds a position.
+    """
+
+    def __init__(self, reserve=5):
+        self.reserve = reserve
+        self.sheets_of = {}  # product -> sheet names listing it
+        self.risks = {}  # sheet -> [clipSize, ordersSent, maxOrders]
+        self.in_flight = Counter()  # product -> adds sent, not answered yet
+        self.refused = 0
+        self.lock = threading.Lock()
+
+    def update_sheets(self, sheets):
+        # From a SHEETS_RESPONSE
+        sheets_of = {}
+        for sheet in sheets:
+            for contract in sheet.contracts:
+                sheets_of.setdefault(contract.secDesc, []).append(sheet.name)
+        self.sheets_of = sheets_of
+
+    def update_risk(self, risks):
+        # From a SHEET_RISK_RESPONSE, the server's counts replace ours
+        with self.lock:
+            for risk in risks:
+                self.risks[risk.sheet] = [
+                    risk.clipSize,
+                    risk.ordersSent,
+                    risk.maxOrders,
+                ]
+
+    def remaining(self, product) -> Optional[int]:
+        # Adds left for a product, None if none of its sheets has a limit
+        left = [
+            risk[2] - risk[1]
+            for risk in map(self.risks.get, self.sheets_of.get(product, ()))
+            if risk is not None and risk[2]
+        ]
+        if not left:
+            return None
+        return min(left) - self.in_flight[product]
+
+    """
+    Check an order add against the clip size and the adds left on its sheets,
+    counting it as in flight if it may be sent
+    Parameters:
+        product (str): The symbol or product name being traded (e.g., 'ESU5').
+        qty (int): The number of contracts/shares to trade.
+        urgent (bool, optional): A flatten, may use the reserved adds.
+    Returns:
+        str: why the add may not be sent, None if it may
+    """
+
+    def check(self, product, qty, urgent=False) -> Optional[str]:
+        with self.lock:
+            risks = [
+                risk
+                for risk in map(self.risks.get, self.sheets_of.get(product, ()))
+                if risk is not None
+            ]
+            if any(risk[0] and abs(qty) > risk[0] for risk in risks):
+                reason = f"qty {abs(qty)} above the clip size"
+            else:
+                remaining = self.remaining(product)
+                floor = 0 if urgent else self.reserve
+                if remaining is None or remaining > floor:
+                    self.in_flight[product] += 1
+                    return None
+                reason = f"{remaining} order adds left on the sheet"
+            self.refused += 1
+        logging.warning(f"Order add on {product} refused: {reason}")
+        return reason
+
+    def answered(self, product):
+        with self.lock:
+            if self.in_flight[product] > 0:
+                self.in_flight[product] -= 1
+
+    def on_add(self, event):
+        # An ORDER_ADD_EVENT, ours or another client's on a sheet we track
+        with self.lock:
+            risk = self.risks.get(event.sheet)
+            if risk is not None:
+                risk[1] += 1
+        if not event.triggerOrderNo:
+            self.answered(event.contract.secDesc)
+
+    def on_add_failure(self, failure):
+        self.answered(failure.contract.secDesc)
+
+    def clear_in_flight(self):
+        with self.lock:
+            self.in_flight.clear()
+
+    def summary(self) -> str:
+        left = [
+            f"{sheet}: {risk[2] - risk[1]} adds left"
+            for sheet, risk in self.risks.items()
+            if risk[2]
+        ]
+        return (
+            f"Sheet risk: {'; '.join(left) or 'no limits'}, "
+            f"{self.refused} adds refused"
+        )
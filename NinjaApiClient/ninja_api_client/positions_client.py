@@ -14,9 +14,13 @@ import threading
 from datetime import datetime, timedelta
 
 
-class PositionsClient(NinjaApiClient):
-    def __init__(self):
-        super().__init__(settings.positions_host, settings.positions_port)
+class PositionsSession:
+    """
+    Positions state, outbound requests and inbound handlers shared by
+    PositionsClient (threads) and AsyncPositionsClient (asyncio).
+    """
+
+    def init_session(self):
         cme = NinjaApiCommon_pb2.Exchange.CME
         self.products = {"NQU5": cme}
         self.accounts = ["FW077", "FW078", "FW079", "FW080"]
@@ -26,6 +30,8 @@ class PositionsClient(NinjaApiClient):
         self.positions = {}
         self.initial_flatten = True
         self.positionCounter = 0
+        self.position_listeners = []  # called with account, product, totalPos
+        self.register_handlers()
 
     """ 
     Gets positions of specified contract(s) for account(s)
@@ -61,7 +67,7 @@ class PositionsClient(NinjaApiClient):
     def get_all_positions(self):
         self.get_positions()
 
-    def run(self):
+    def login_msg(self):
         login = NinjaApiMessages_pb2.Login()
         login.user = settings.trading_user
         login.password = settings.trading_password
@@ -71,90 +77,116 @@ class PositionsClient(NinjaApiClient):
         container.header.msgType = NinjaApiMessages_pb2.Header.LOGIN_REQUEST
         container.header.version = "v1.0.0"
         container.payload = login.SerializeToString()
-        self.send_msg(container)
+        return container
+
+    def register_handlers(self):
+        header = NinjaApiMessages_pb2.Header
+        self.register_handler(header.LOGIN_RESPONSE, self.on_login)
+        self.register_handler(header.POSITIONS_RESPONSE, self.on_positions)
+        self.register_handler(header.ERROR, self.on_error)
+
+    def on_login(self, payload):
+        resp = NinjaApiMessages_pb2.LoginResponse()
+        resp.ParseFromString(payload)
+        self.get_all_positions()
 
-        while self.connected:
-            msg = self.recv_msg()
-            if not msg:
-                if (
-                    datetime.now() > self.lastTime + timedelta(milliseconds=25)
-                    and len(self.products) > 0
-                    and len(self.accounts) > 0
-                ):
-                    self.get_all_positions()
-                    self.lastTime = datetime.now()
-                else:
-                    continue
-            elif msg.header.msgType == NinjaApiMessages_pb2.Header.LOGIN_RESPONSE:
-                resp = NinjaApiMessages_pb2.LoginResponse()
-                resp.ParseFromString(msg.payload)
+    def on_positions(self, payload):
+        if self.disconnected_at is not None:
+            self.mark_recovered()
+        resp = NinjaApiPositions_pb2.Positions()
+        resp.ParseFromString(payload)
+        for position in resp.positions:
+            self.positions[
+                (
+                    position.account,
+                    position.contract.exchange,
+                    position.contract.secDesc,
+                )
+            ] = position.totalPos
+            for listener in self.position_listeners:
+                listener(position.account, position.contract.secDesc, position.totalPos)
+        if datetime.now() > self.lastPrintTime + timedelta(seconds=60):
+            whitespace = " " * 32
+            logging.info(
+                f"\n{whitespace}".join(
+                    f"Account: {acct}, Product: {secDesc} => TotalPos: {totalPos}"
+                    for (
+                        acct,
+                        exchange,
+                        secDesc,
+                    ), totalPos in self.positions.items()
+                )
+            )
+            self.lastPrintTime = datetime.now().replace(second=0)
+        self.positionCounter += 1
+        # if flatten on boot, self.initial_flatten is True
+        if self.initial_flatten:
+            self.flatten_on_boot(resp.positions)
+            self.initial_flatten = False
+
+    def flatten_on_boot(self, positions):
+        for position in positions:
+            if position.totalPos < 0:
+                ask = None
+                while ask is None:
+                    ask = clients.tradingClient.get_ask(position.contract.secDesc)
+                clients.tradingClient.order(
+                    account=position.account,
+                    product=position.contract.secDesc,
+                    price=ask,
+                    qty=-1 * position.totalPos,
+                    worker="w",
+                    exchange=position.contract.exchange,
+                    tag="FLATTEN_PROGRAMSTART",
+                )
+                time.sleep(0.1)
+            elif position.totalPos > 0:
+                bid = None
+                while bid is None:
+                    bid = clients.tradingClient.get_bid(position.contract.secDesc)
+                clients.tradingClient.order(
+                    account=position.account,
+                    product=position.contract.secDesc,
+                    price=bid,
+                    qty=-1 * position.totalPos,
+                    worker="w",
+                    exchange=position.contract.exchange,
+                    tag="FLATTEN_PROGRAMSTART",
+                )
+                time.sleep(0.1)
+
+    def on_error(self, payload):
+        error = NinjaApiMessages_pb2.Error()
+        error.ParseFromString(payload)
+        logging.info(error.msg)
+
+
+class PositionsClient(PositionsSession, NinjaApiClient):
+    def __init__(self):
+        NinjaApiClient.__init__(self, settings.positions_host, settings.positions_port)
+        self.init_session()
+
+    def start_session(self):
+        # on_login requests all positions, which resyncs them after a reconnect
+        self.send_msg(self.login_msg())
+
+    def run(self):
+        if self.connected:
+            self.start_session()
+        while self.running:
+            if not self.connected:
+                self.reconnect()
+                continue
+            if (
+                datetime.now() > self.lastTime + timedelta(milliseconds=25)
+                and len(self.products) > 0
+                and len(self.accounts) > 0
+            ):
                 self.get_all_positions()
-            elif msg.header.msgType == NinjaApiMessages_pb2.Header.POSITIONS_RESPONSE:
-                resp = NinjaApiPositions_pb2.Positions()
-                resp.ParseFromString(msg.payload)
-                for position in resp.positions:
-                    self.positions[
-                        (
-                            position.account,
-                            position.contract.exchange,
-                            position.contract.secDesc,
-                        )
-                    ] = position.totalPos
-                if datetime.now() > self.lastPrintTime + timedelta(seconds=60):
-                    whitespace = " " * 32
-                    logging.info(
-                        f"\n{whitespace}".join(
-                            f"Account: {acct}, Product: {secDesc} => TotalPos: {totalPos}"
-                            for (
-                                acct,
-                                exchange,
-                                secDesc,
-                            ), totalPos in self.positions.items()
-                        )
-                    )
-                    self.lastPrintTime = datetime.now().replace(second=0)
-                self.positionCounter += 1
-                # if flatten on boot, self.initial_flatten is True
-                if self.initial_flatten:
-                    for position in resp.positions:
-                        if position.totalPos < 0:
-                            ask = None
-                            while ask is None:
-                                ask = clients.tradingClient.get_ask(
-                                    position.contract.secDesc
-                                )
-                            clients.tradingClient.order(
-                                account=position.account,
-                                product=position.contract.secDesc,
-                                price=ask,
-                                qty=-1 * position.totalPos,
-                                worker="w",
-                                exchange=position.contract.exchange,
-                                tag="FLATTEN_PROGRAMSTART",
-                            )
-                            time.sleep(0.1)
-                        elif position.totalPos > 0:
-                            bid = None
-                            while bid is None:
-                                bid = clients.tradingClient.get_bid(
-                                    position.contract.secDesc
-                                )
-                            clients.tradingClient.order(
-                                account=position.account,
-                                product=position.contract.secDesc,
-                                price=bid,
-                                qty=-1 * position.totalPos,
-                                worker="w",
-                                exchange=position.contract.exchange,
-                                tag="FLATTEN_PROGRAMSTART",
-                            )
-                            time.sleep(0.1)
-                    self.initial_flatten = False
-            elif msg.header.msgType == NinjaApiMessages_pb2.Header.ERROR:
-                error = NinjaApiMessages_pb2.Error()
-                error.ParseFromString(msg.payload)
-                logging.info(error.msg)
-
-            time.sleep(0.01)
+                self.lastTime = datetime.now()
+            timeout = (
+                self.lastTime + timedelta(milliseconds=25) - datetime.now()
+            ).total_seconds()
+            self.poll(max(timeout, 0))
 
         self.disconnect()
@@ -0,0 +1,228 @@
+import logging
+import threading
+import time
+
+from typing import NamedTuple, Optional
+
+import NinjaApiCommon_pb2
+
+BUY = NinjaApiCommon_pb2.Side.BUY
+
+
+class RiskLimits(NamedTuple):
+    # None leaves a limit unchecked
+    max_position: Optional[int] = None  # contracts long or short, with working orders
+    max_order_qty: Optional[int] = None
+    max_ticks_from_market: Optional[int] = None  # from the last trade
+
+
+def merge_limits(*limits) -> RiskLimits:
+    # The tightest of each limit that is set
+    return RiskLimits(
+        *(
+            min((value for value in values if value is not None), default=None)
+            for values in zip(*limits)
+        )
+    )
+
+
+class RiskEngine:
+    """
+    Pre-trade checks on every order add and change, run on the sending thread
+    before anything reaches the socket: order qty, position, price inside the
+    exchange's limit prices (ContractInfo highLimitPrice/lowLimitPrice) and
+    distance from the last trade. Limits are set per account, per product and
+    as defaults, the tightest applying. Every check reads cached state only
+    (positions, OrderView.working_qty, OrderManager.pending_qty, ContractSpec,
+    MarketState), so it costs microseconds; checks and their time are counted
+    per check.
+
+    The position check counts the working orders on the order's side, and
+    the adds sent on it that are not acked yet, as if they filled. Urgent
+    orders (flattens) cancel those first and are only held to the position
+    they leave.
+
+    Positions are counted from this session's fills. set_position() replaces
+    the count for an account and product with the positions connection's
+    figure, and later fills are counted on top of it until the next one.
+    """
+
+    CHECKS = ("qty", "position", "limit_price", "market")
+
+    def __init__(self, orders, contracts, market_data, defaults=RiskLimits()):
+        self.orders = orders
+        self.contracts = contracts
+        self.market_data = market_data
+        self.defaults = defaults
+        self.account_limits = {}
+        self.product_limits = {}
+        self.effective = {}  # (account, product) -> RiskLimits, cleared on changes
+        self.positions = {}  # (account, product) -> signed qty
+        self.lock = threading.Lock()  # guards positions and the counters
+        self.counts = dict.fromkeys(self.CHECKS, 0)
+        self.times = dict.fromkeys(self.CHECKS, 0)  # nanoseconds
+        self.refused = dict.fromkeys(self.CHECKS, 0)
+        self.unknown = 0  # changes refused, their order was not working
+
+    """
+    Set limits for an account, a product, or the defaults when neither is given
+    Parameters:
+        account (str, optional): The account identifier the limits apply to.
+        product (str, optional): The symbol or product name the limits apply to (e.g., 'ESU5').
+        max_position (int, optional): Contracts long or short, counting working orders.
+        max_order_qty (int, optional): Contracts in one order.
+        max_ticks_from_market (int, optional): Ticks an order may be priced from the last trade.
+    """
+
+    def set_limits(self, account=None, product=None, **limits):
+        with self.lock:
+            if account is None and product is None:
+                self.defaults = self.defaults._replace(**limits)
+            for key, table in (
+                (account, self.account_limits),
+                (product, self.product_limits),
+            ):
+                if key is not None:
+                    table[key] = table.get(key, RiskLimits())._replace(**limits)
+            self.effective = {}
+
+    def limits(self, account, product) -> RiskLimits:
+        limits = self.effective.get((account, product))
+        if limits is None:
+            limits = merge_limits(
+                self.defaults,
+                self.account_limits.get(account, RiskLimits()),
+                self.product_limits.get(product, RiskLimits()),
+            )
+            self.effective[(account, product)] = limits
+        return limits
+
+    def set_position(self, account, product, qty):
+        # From the positions connection, authoritative over the counted fills
+        with self.lock:
+            self.positions[(account, product)] = qty
+
+    def on_fill(self, fill):
+        key = (fill.account, fill.contract.secDesc)
+        with self.lock:
+            qty = fill.qty if fill.side == BUY else -fill.qty
+            self.positions[key] = self.positions.get(key, 0) + qty
+
+    """
+    Check an order add
+    Parameters:
+        orderadd (OrderAdd): The request about to be sent, its price in feed units.
+        urgent (bool, optional): A flatten, its working orders are canceled first.
+    Returns:
+        str: why the order may not be sent, None if it may
+    """
+
+    def check_add(self, orderadd, urgent=False) -> Optional[str]:
+        return self.check(
+            orderadd.account,
+            orderadd.contract.secDesc,
+            orderadd.side,
+            orderadd.qty,
+            orderadd.price,
+            0,
+            urgent,
+        )
+
+    """
+    Check an order change
+    Parameters:
+        orderNo (str): The order being changed.
+        order (Order): The working order, None if it is not in activeOrders.
+        price (float): The new price in feed units.
+        qty (int): The new qty.
+    Returns:
+        str: why the change may not be sent, None if it may
+    """
+
+    def check_change(self, orderNo, order, price, qty) -> Optional[str]:
+        if order is None:
+            # Not acked yet or no longer working, there is nothing to check the
+            # change against
+            with self.lock:
+                self.unknown += 1
+            reason = f"order {orderNo} is not working"
+            logging.warning(f"Order change refused: {reason}")
+            return reason
+        return self.check(
+            order.account, order.product, order.side, qty, price, order.qty
+        )
+
+    def check(self, account, product, side, qty, price, replaced=0, urgent=False):
+        limits = self.limits(account, product)
+        refused = None
+        clock = time.perf_counter_ns
+        start = clock()
+        if limits.max_order_qty is not None and qty > limits.max_order_qty:
+            refused = "qty", f"qty {qty} above {limits.max_order_qty}"
+        checked = clock()
+        self.count("qty", checked - start)
+        if refused is None and limits.max_position is not None:
+            with self.lock:
+                position = self.positions.get((account, product), 0)
+            signed = qty if side == BUY else -qty
+            if urgent:
+                exposure = abs(position + signed)
+            else:
+                key = account, product, side
+                working = self.orders.view.working_qty.get(key, 0)
+                working += self.orders.pending_qty.get(key, 0) + qty - replaced
+                exposure = position + working if side == BUY else working - position
+            if exposure > limits.max_position:
+                refused = "position", (
+                    f"position {position} would reach {exposure}, "
+                    f"above {limits.max_position}"
+                )
+            start, checked = checked, clock()
+            self.count("position", checked - start)
+        spec = self.contracts.get(product) if refused is None else None
+        if spec is not None:
+            if spec.high_limit is not None and price > spec.high_limit:
+                refused = (
+                    "limit_price",
+                    f"price {price} above the limit {spec.high_limit}",
+                )
+            elif spec.low_limit is not None and price < spec.low_limit:
+                refused = (
+                    "limit_price",
+                    f"price {price} below the limit {spec.low_limit}",
+                )
+            start, checked = checked, clock()
+            self.count("limit_price", checked - start)
+            if refused is None and limits.max_ticks_from_market is not None:
+                last = self.market_data.state(product).trade_price
+                if last is not None:
+                    away = abs(spec.to_ticks(price) - spec.to_ticks(last))
+                    if away > limits.max_ticks_from_market:
+                        refused = "market", f"price {price} is {away} ticks from {last}"
+                start, checked = checked, clock()
+                self.count("market", checked - start)
+        if refused is None:
+            return None
+        check, reason = refused
+        with self.lock:
+            self.refused[check] += 1
+        logging.warning(f"Order on {product} for {account} refused: {reason}")
+        return reason
+
+    def count(self, check, elapsed):
+        with self.lock:
+            self.counts[check] += 1
+            self.times[check] += elapsed
+
+    def summary(self) -> str:
+        checks = [
+            f"{check} {self.times[check] / self.counts[check] / 1e3:.2f} us "
+            f"({self.refused[check]} refused)"
+            for check in self.CHECKS
+            if self.counts[check]
+        ]
+        return (
+            "Risk checks: "
+            + (", ".join(checks) or "none yet")
+            + f", {self.unknown} changes of unknown orders refused"
+        )
@@ -1,10 +1,15 @@
+import asyncio
 import logging
+import sys
 import threading
 import clients
 
 # import clients
 from trading_client import TradingClient
 from positions_client import PositionsClient
+from market_data_client import MarketDataClient
+from async_trading_client import AsyncTradingClient
+from async_positions_client import AsyncPositionsClient
 import flatten_and_close
 
 # import algos
@@ -26,10 +31,21 @@ def run_clients():
         logging.info(f"Positions Client Added")
         clients.positionsClient = PositionsClient()
         programs.append(clients.positionsClient)
+    market_data = None
+    if settings.market_data_access_token:
+        logging.info(f"Market Data Client Added")
+        clients.marketDataClient = MarketDataClient()
+        programs.append(clients.marketDataClient)
+        market_data = clients.marketDataClient.market_data
     if settings.trading_access_token:
         logging.info(f"Trading Client Added")
-        clients.tradingClient = TradingClient()
+        clients.tradingClient = TradingClient(market_data)
         programs.append(clients.tradingClient)
+        if clients.positionsClient is not None:
+            # pre-trade position checks use the server's positions
+            clients.positionsClient.position_listeners.append(
+                clients.tradingClient.risk.set_position
+            )
     for client in programs:
         thread = threading.Thread(target=client.run, daemon=True)
         thread.start()
@@ -61,5 +77,26 @@ def run_clients():
         thread.join()
 
 
+async def run_async_clients():
+    # Every connection runs as a task on a single event loop. The algos are
+    # still blocking threads, so they are not started in this mode.
+    logging.basicConfig(
+        format="%(levelname)s - %(asctime)s: %(message)s", level=logging.INFO
+    )
+    programs = []
+    if settings.positions_access_token:
+        logging.info(f"Async Positions Client Added")
+        clients.positionsClient = AsyncPositionsClient()
+        programs.append(clients.positionsClient)
+    if settings.trading_access_token:
+        logging.info(f"Async Trading Client Added")
+        clients.tradingClient = AsyncTradingClient()
+        programs.append(clients.tradingClient)
+    await asyncio.gather(*(client.run() for client in programs))
+
+
 if __name__ == "__main__":
-    run_clients()
+    if "--asyncio" in sys.argv:
+        asyncio.run(run_async_clients())
+    else:
+        run_clients()
@@ -0,0 +1,169 @@
+import time
+
+from collections import namedtuple
+
+import numpy as np
+
+TRADE_COLUMNS = (
+    ("time", np.int64),  # exchange transact time, epoch nanoseconds
+    ("price", np.float64),
+    ("qty", np.uint32),
+    ("aggressor", np.uint8),  # NinjaApiCommon_pb2.Aggressor
+    ("sqn", np.uint32),
+    ("bid", np.float64),  # top of book when the trade was received
+    ("ask", np.float64),
+)
+
+TOB_COLUMNS = (
+    ("time", np.int64),  # TobUpdate.lastChange, epoch nanoseconds
+    ("bid", np.float64),
+    ("ask", np.float64),
+    ("bid_qty", np.uint32),
+    ("ask_qty", np.uint32),
+)
+
+
+class TickRing:
+    """
+    Append-only ring buffer with one numpy array per column. Every row is
+    written twice, at row % capacity and row % capacity + capacity, so the
+    latest rows are always one contiguous slice and windows are views rather
+    than copies. Capacity doubles up to max_capacity, after which the oldest
+    rows are overwritten.
+
+    One thread appends (the market data handler), any thread may query. A
+    window is a snapshot of the rows present when it was taken; its rows are
+    overwritten once capacity newer rows arrive, so copy what you keep longer.
+    Window times must be non-decreasing for since() and last_seconds().
+    """
+
+    def __init__(self, name, columns, capacity=4096, max_capacity=1 << 20):
+        self.names = tuple(column for column, _ in columns)
+        self.dtypes = tuple(dtype for _, dtype in columns)
+        self.window_type = namedtuple(name, self.names)
+        self.max_capacity = max(capacity, max_capacity)
+        self.count = 0  # rows appended so far, readers only look below it
+        self.layout = self.allocate(capacity)
+
+    def allocate(self, capacity):
+        arrays = tuple(np.zeros(2 * capacity, dtype) for dtype in self.dtypes)
+        return capacity, arrays
+
+    def grow(self):
+        # Only called when exactly capacity rows were written, so rows 0..count
+        # sit unwrapped at the start of every array
+        capacity, arrays = self.layout
+        new_capacity, new_arrays = self.allocate(capacity * 2)
+        for old, new in zip(arrays, new_arrays):
+            new[:capacity] = old[:capacity]
+            new[new_capacity : new_capacity + capacity] = old[:capacity]
+        self.layout = new_capacity, new_arrays
+
+    def append(self, *values):
+        count = self.count
+        capacity, arrays = self.layout
+        if count == capacity and capacity < self.max_capacity:
+            self.grow()
+            capacity, arrays = self.layout
+        low = count % capacity
+        high = low + capacity
+        for array, value in zip(arrays, values):
+            array[low] = value
+            array[high] = value
+        self.count = count + 1  # publish the row only once it is complete
+
+    def __len__(self):
+        return min(self.count, self.layout[0])
+
+    """
+    Get the latest rows as zero-copy column views
+    Parameters:
+        n (int, optional): Number of rows, None returns every row still held.
+    Returns:
+        namedtuple of numpy arrays, one per column, oldest row first
+    """
+
+    def last(self, n=None):
+        count = self.count  # read before layout, see grow()
+        capacity, arrays = self.layout
+        held = min(count, capacity)
+        n = held if n is None else max(0, min(n, held))
+        end = (count - 1) % capacity + capacity + 1 if count else capacity
+        return self.window_type(*(array[end - n : end] for array in arrays))
+
+    """
+    Get rows whose time is at or after a timestamp
+    Parameters:
+        time_ns (int): Epoch nanoseconds.
+    Returns:
+        namedtuple of numpy arrays, one per column, oldest row first
+    """
+
+    def since(self, time_ns):
+        window = self.last()
+        start = np.searchsorted(window.time, time_ns, side="left")
+        return self.window_type(*(column[start:] for column in window))
+
+    """
+    Get rows from the last seconds
+    Parameters:
+        seconds (float): Length of the window.
+        now_ns (int, optional): End of the window in epoch nanoseconds, defaults to now.
+    Returns:
+        namedtuple of numpy arrays, one per column, oldest row first
+    """
+
+    def last_seconds(self, seconds, now_ns=None):
+        if now_ns is None:
+            now_ns = time.time_ns()
+        return self.since(now_ns - int(seconds * 1e9))
+
+
+class TickStore:
+    """
+    Trade and top of book TickRing per product, filled by MarketData from
+    every MARKET_UPDATES message, so algos can query recent history in memory
+    instead of going back to the database.
+    """
+
+    def __init__(self, capacity=4096, max_capacity=1 << 20):
+        self.capacity = capacity
+        self.max_capacity = max_capacity
+        self.trade_rings = {}
+        self.tob_rings = {}
+
+    def ring(self, rings, name, columns, product) -> TickRing:
+        ring = rings.get(product)
+        if ring is None:
+            ring = TickRing(name, columns, self.capacity, self.max_capacity)
+            ring = rings.setdefault(product, ring)
+        return ring
+
+    """
+    Get the trade history of a product
+    Parameters:
+        product (str): The symbol or product name being traded (e.g., 'ESU5').
+    Returns:
+        TickRing with columns time, price, qty, aggressor, sqn, bid and ask
+    """
+
+    def trades(self, product) -> TickRing:
+        return self.ring(self.trade_rings, "Trades", TRADE_COLUMNS, product)
+
+    """
+    Get the top of book history of a product
+    Parameters:
+        product (str): The symbol or product name being traded (e.g., 'ESU5').
+    Returns:
+        TickRing with columns time, bid, ask, bid_qty and ask_qty
+    """
+
+    def tob(self, product) -> TickRing:
+        return self.ring(self.tob_rings, "Tob", TOB_COLUMNS, product)
+
+    def summary(self) -> str:
+        held = [
+            f"{product}: {len(ring)} trades, {len(self.tob(product))} tob"
+            for product, ring in self.trade_rings.items()
+        ]
+        return "Tick store: " + ("; ".join(held) or "empty")
@@ -0,0 +1,72 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+
+class Timer:
+    __slots__ = ("when", "callback", "cancelled")
+
+    def __init__(self, when, callback):
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerScheduler:
+    """
+    Runs callbacks at a time.monotonic() deadline from a single thread that
+    sleeps until the earliest timer is due. One scheduler serves every
+    connection, so periodic work costs one wakeup per timer instead of a
+    polling thread per client. Callbacks must be short and must not block.
+    """
+
+    def __init__(self, name="ninja-timers"):
+        self.name = name
+        self.heap = []
+        self.cond = threading.Condition()
+        self.sequence = itertools.count()  # tie breaker for equal deadlines
+        self.thread = None
+
+    def call_at(self, when, callback) -> Timer:
+        timer = Timer(when, callback)
+        with self.cond:
+            heapq.heappush(self.heap, (when, next(self.sequence), timer))
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name=self.name, daemon=True
+                )
+                self.thread.start()
+            elif self.heap[0][2] is timer:
+                # New earliest deadline, wake the scheduler to re-arm its wait
+                self.cond.notify()
+        return timer
+
+    def call_later(self, delay, callback) -> Timer:
+        return self.call_at(time.monotonic() + delay, callback)
+
+    def run(self):
+        while True:
+            with self.cond:
+                while True:
+                    while self.heap and self.heap[0][2].cancelled:
+                        heapq.heappop(self.heap)
+                    if not self.heap:
+                        self.cond.wait()
+                        continue
+                    delay = self.heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self.cond.wait(delay)
+                _, _, timer = heapq.heappop(self.heap)
+            try:
+                timer.callback()
+            except:
+                logging.exception(f"Timer callback {timer.callback} failed")
+
+
+timers = TimerScheduler()
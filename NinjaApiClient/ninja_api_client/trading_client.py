@@ -1,4 +1,10 @@
 from ninja_api_client import NinjaApiClient
+from market_data import MarketData
+from message_pool import OutboundTemplates
+from contracts import ContractRegistry
+from order_manager import OrderManager
+from order_throttle import SheetRiskBudget, TokenBucket
+from risk_engine import RiskEngine, RiskLimits
 from config import settings
 
 import NinjaApiCommon_pb2
@@ -16,10 +22,20 @@ import threading
 from HELPERS import TradingLogger
 
 
-class TradingClient(NinjaApiClient):
+RATE_LIMIT_ERRORS = (
+    NinjaApiMessages_pb2.Error.RATE_LIMIT_EXCEEDED,
+    NinjaApiMessages_pb2.Error.MSG_RATE_LIMIT_EXCEEDED,
+)
 
-    def __init__(self):
-        super().__init__(settings.trading_host, settings.trading_port)
+
+class TradingSession:
+    """
+    Trading state, outbound message builders and inbound message handlers.
+    Transport agnostic: TradingClient (threads) and AsyncTradingClient (asyncio)
+    both mix this in and only differ in how messages reach the socket.
+    """
+
+    def init_session(self, market_data=None):
         self.logging = True
         self.logger = TradingLogger()
         cme = NinjaApiCommon_pb2.Exchange.CME
@@ -27,104 +43,646 @@ class TradingClient(NinjaApiClient):
         self.lastPrintTime = datetime.now().replace(second=0)
         self.products = {"NQU5": cme}
         self.accounts = ["FW077", "FW078", "FW079", "FW080"]
-        self.latest_trade_price = {product: None for product in self.products.keys()}
-        self.latest_bid = {product: None for product in self.products.keys()}
-        self.latest_ask = {product: None for product in self.products.keys()}
-        self.latest_low = {product: None for product in self.products.keys()}
-        self.latest_high = {product: None for product in self.products.keys()}
-        self.latest_volume = {product: 0 for product in self.products.keys()}
+        # With a MarketDataClient the feed arrives on its own connection and
+        # this session only reads it; otherwise it subscribes itself
+        self.owns_market_data = market_data is None
+        self.market_data = market_data or MarketData(self.products)
+        if self.market_data.contracts is None:
+            self.market_data.contracts = ContractRegistry(settings.contract_cache)
+        self.contracts = self.market_data.contracts  # ticks on the bus use it too
+        if self.owns_market_data:
+            self.market_data.sender = self.send_msg
+        self.bus = self.market_data.bus  # bus.subscribe(product, on_tob, on_trade)
+        self.ticks = self.market_data.ticks  # ticks.trades(product).last_seconds(60)
         self.inOrderChange = {}
-        self.activeOrders = {}
-        self.activeOrderCounter = 0
+        self.orders = OrderManager()  # kept from order events, see activeOrders
+        self.throttle = TokenBucket(settings.order_rate, settings.order_burst)
+        self.sheet_risk = SheetRiskBudget(settings.order_add_reserve)
+        self.risk = RiskEngine(
+            self.orders,
+            self.contracts,
+            self.market_data,
+            RiskLimits(
+                settings.risk_max_position,
+                settings.risk_max_order_qty,
+                settings.risk_max_ticks_from_market,
+            ),
+        )  # risk.set_limits(account=..., product=..., max_position=...)
         self.fillCounter = 0
+        self.templates = OutboundTemplates()
+        self.register_handlers()
+
+    """
+    Start market data for products at runtime, in one StartMarketData for all of
+    them. Interest is counted per product, pair every subscribe with an unsubscribe.
+    Parameters:
+        contracts (dict, list or str): {product: exchange}, Contract messages (e.g. from a sheet) or product names.
+        cadence (float, optional): Server side conflation in seconds this caller accepts, the server conflates only at the smallest one asked for. 0 for every tick.
+    Returns:
+        dict: {product: exchange} of the products that were started or sped up
+    """
+
+    def subscribe(self, contracts, cadence=0.0):
+        started = self.market_data.subscribe(contracts, cadence)
+        unknown = {
+            product: exchange
+            for product, exchange in started.items()
+            if self.contracts.get(product) is None
+        }
+        if unknown:
+            self.send_msg(self.contracts.request_msg(unknown))
+        return started
+
+    """
+    Release interest in products, stopping market data for those no one else needs
+    Parameters:
+        contracts (dict, list or str): {product: exchange}, Contract messages (e.g. from a sheet) or product names.
+        cadence (float, optional): The cadence given to subscribe.
+    Returns:
+        dict: {product: exchange} of the products that were stopped
+    """
+
+    def unsubscribe(self, contracts, cadence=0.0):
+        return self.market_data.unsubscribe(contracts, cadence)
+
+    """
+    Get a consistent view of the latest bid, ask, trade, high, low and volume
+    Parameters:
+        product (str): The symbol or product name being traded (e.g., 'ESU5').
+    Returns:
+        MarketSnapshot (see market_data.py), fields are None until data arrives
+    """
+
+    def snapshot(self, product):
+        return self.market_data.snapshot(product)
 
     """
-    Get latest bid
+    Get latest bid, waiting for market data if there is none yet
     Parameters:
         product (str): The symbol or product name being traded (e.g., 'ESU5').
+        timeout (float, optional): Seconds to wait for data, None waits until available.
     """
 
-    def get_bid(self, product):
-        attempts = 0
-        max_attempts = 1_000
-        while attempts < max_attempts:
-            bid = self.latest_bid.get(product)
-            if bid is not None:
-                return bid
-            attempts += 1
-        return None
+    def get_bid(self, product, timeout=None):
+        return self.market_data.get_bid(product, timeout)
 
     """
     Get latest ask
     Parameters:
         product (str): The symbol or product name being traded (e.g., 'ESU5').
+        timeout (float, optional): Seconds to wait for data, None waits until available.
     """
 
-    def get_ask(self, product):
-        attempts = 0
-        max_attempts = 1_000
-        while attempts < max_attempts:
-            ask = self.latest_ask.get(product)
-            if ask is not None:
-                return ask
-            attempts += 1
-        return None
+    def get_ask(self, product, timeout=None):
+        return self.market_data.get_ask(product, timeout)
 
     """
     Get latest high
     Parameters:
         product (str): The symbol or product name being traded (e.g., 'ESU5').
+        timeout (float, optional): Seconds to wait for data, None waits until available.
     """
 
-    def get_high(self, product):
-        attempts = 0
-        max_attempts = 1_000
-        while attempts < max_attempts:
-            high = self.latest_high.get(product)
-            if high is not None:
-                return high
-            attempts += 1
-        return None
+    def get_high(self, product, timeout=None):
+        return self.market_data.get_high(product, timeout)
 
     """
     Get latest low
     Parameters:
         product (str): The symbol or product name being traded (e.g., 'ESU5').
+        timeout (float, optional): Seconds to wait for data, None waits until available.
     """
 
-    def get_low(self, product):
-        attempts = 0
-        max_attempts = 1_000
-        while attempts < max_attempts:
-            low = self.latest_low.get(product)
-            if low is not None:
-                return low
-            attempts += 1
-        return None
+    def get_low(self, product, timeout=None):
+        return self.market_data.get_low(product, timeout)
 
-        """
+    """
     Get latest traded price
     Parameters:
         product (str): The symbol or product name being traded (e.g., 'ESU5').
+        timeout (float, optional): Seconds to wait for data, None waits until available.
     """
 
-    def get_trade_price(self, product):
-        while True:
-            trade_price = self.latest_trade_price.get(product)
-            if trade_price is not None:
-                return trade_price
+    def get_trade_price(self, product, timeout=None):
+        return self.market_data.get_trade_price(product, timeout)
 
     """
     Get volume of this trade update (since turninig on the connection, warmup for day will have to be done on algo side)
     Parameters:
         product (str): The symbol or product name being traded (e.g., 'ESU5').
+        timeout (float, optional): Seconds to wait for data, None waits until available.
     """
 
-    def get_volume(self, product):
-        while True:
-            volume = self.latest_volume.get(product)
-            if volume != 0:
-                return volume
+    def get_volume(self, product, timeout=None):
+        return self.market_data.get_volume(product, timeout)
+
+    """
+    Block until a market update newer than after_seq arrives, instead of polling
+    Parameters:
+        product (str): The symbol or product name being traded (e.g., 'ESU5').
+        after_seq (int, optional): seq of the last snapshot seen, None waits for the next update.
+        timeout (float, optional): Seconds to wait, None waits forever.
+    Returns:
+        MarketSnapshot, its seq is still after_seq if the wait timed out
+    """
+
+    def wait_for_update(self, product, after_seq=None, timeout=None):
+        return self.market_data.wait_for_update(product, after_seq, timeout)
+
+    # Working orders by orderNo as an immutable Order snapshot, updated from
+    # the order events in real time and reconciled with ACTIVE_ORDERS
+    @property
+    def activeOrders(self):
+        return self.orders.active
+
+    # Grows with every order state change and every reconciliation
+    @property
+    def activeOrderCounter(self):
+        return self.orders.version
+
+    def log_summary(self):
+        if len(self.activeOrders) > 0:
+            logging.info(
+                "| ".join(
+                    f"{order.orderNo}: {order.account}, {order.price}, {order.qty*((-2*order.side)+3)}"
+                    for order in self.activeOrders.values()
+                )
+            )
+        else:
+            logging.info("No Active Orders")
+        logging.info(self.orders.summary())
+        logging.info(self.throttle.summary())
+        logging.info(self.sheet_risk.summary())
+        logging.info(self.risk.summary())
+        logging.info(self.stats.summary())
+        logging.info(self.transport_summary())
+        if self.owns_market_data:
+            logging.info(self.bus.summary())
+            logging.info(self.ticks.summary())
+        self.lastPrintTime = datetime.now().replace(second=0)
+
+    # region OUTBOUND MESSAGES
+    def login_msg(self):
+        login = NinjaApiMessages_pb2.Login()
+        login.user = settings.trading_user
+        login.password = settings.trading_password
+        login.connectionType = NinjaApiMessages_pb2.ConnectionType.TRADING_CONNECTION
+        login.accessToken = settings.trading_access_token
+        container = NinjaApiMessages_pb2.MsgContainer()
+        container.header.msgType = NinjaApiMessages_pb2.Header.LOGIN_REQUEST
+        container.header.version = "v1.0.0"
+        container.payload = login.SerializeToString()
+        return container
+
+    def session_msgs(self):
+        # Requests sent right after login: reference data, then market data
+        msgs = []
+        for msg_type in (
+            NinjaApiMessages_pb2.Header.NINJA_REQUEST,
+            NinjaApiMessages_pb2.Header.ACCOUNTS_REQUEST,
+            NinjaApiMessages_pb2.Header.WORKING_RULES_REQUEST,
+            NinjaApiMessages_pb2.Header.PRICE_FEED_STATUS_REQUEST,
+        ):
+            container = NinjaApiMessages_pb2.MsgContainer()
+            container.header.msgType = msg_type
+            msgs.append(container)
+        sheets = NinjaApiSheets_pb2.Sheets()
+        container = NinjaApiMessages_pb2.MsgContainer()
+        container.header.msgType = NinjaApiMessages_pb2.Header.SHEETS_REQUEST
+        container.payload = sheets.SerializeToString()
+        msgs.append(container)
+        msgs.append(self.contracts.request_msg(self.market_data.products))
+        if self.owns_market_data:
+            msgs.extend(self.market_data.start_market_data_msgs())
+        return msgs
+
+    def order_msg(
+        self,
+        account,
+        product,
+        price,
+        qty,
+        worker="w",
+        exchange=NinjaApiCommon_pb2.Exchange.CME,
+        ticks=None,
+    ):
+        # Order builders refill this thread's templates; the returned container
+        # is reused by the next build, so send it right away
+        orderadd = self.templates.order_add
+        orderadd.account = account
+        orderadd.contract.exchange = exchange
+        orderadd.contract.secDesc = product
+        orderadd.contract.whName = product
+        if qty < 0:
+            orderadd.side = NinjaApiCommon_pb2.Side.SELL
+        else:
+            orderadd.side = NinjaApiCommon_pb2.Side.BUY
+        orderadd.qty = abs(qty)
+        orderadd.price = self.order_price(product, price, ticks)
+        orderadd.prefix = worker
+        return self.templates.wrap(
+            NinjaApiMessages_pb2.Header.ORDER_ADD_REQUEST, orderadd
+        )
+
+    def send_order(
+        self,
+        account,
+        product,
+        price,
+        qty,
+        worker,
+        exchange,
+        tag="",
+        ticks=None,
+        urgent=False,
+    ):
+        # Tracks the order add before sending it, its answer resolves the handle.
+        # Call after taking a throttle token, it is refunded if the add is not sent
+        msg = self.order_msg(account, product, price, qty, worker, exchange, ticks)
+        refused = self.risk.check_add(
+            self.templates.order_add, urgent
+        ) or self.sheet_risk.check(product, qty, urgent)
+        handle = self.orders.track(self.templates.order_add, tag)
+        if refused is not None:
+            self.throttle.refund()
+            self.orders.fail(handle, refused)
+            return handle
+        if not self.connected:
+            self.throttle.refund()
+            self.sheet_risk.answered(product)
+            self.orders.fail(handle, "not connected")
+            return handle
+        self.send_msg(msg)
+        return handle
+
+    def change_order_msg(
+        self, orderNo, price, qty, worker="w", product=None, ticks=None
+    ):
+        # change order to new price and qty, None if the order already rests
+        # there (the server would answer ORDER_CHANGE_FAILURE), is not in
+        # activeOrders or the risk checks refuse the change
+        if qty < 0:
+            logging.info(
+                "Negative qtys are transitioned to positive as side captures direction."
+            )
+            qty = abs(qty)
+        price = self.order_price(product, price, ticks)
+        order = self.activeOrders.get(orderNo)
+        if order is not None and order.price == price and order.qty == qty:
+            logging.debug(f"Order {orderNo} already at {price} x {qty}, not changed")
+            return None
+        if self.risk.check_change(orderNo, order, price, qty):
+            return None
+        orderchange = self.templates.order_change
+        orderchange.orderNo = orderNo
+        orderchange.qty = qty
+        orderchange.price = price
+        orderchange.prefix = worker
+        return self.templates.wrap(
+            NinjaApiMessages_pb2.Header.ORDER_CHANGE_REQUEST, orderchange
+        )
+
+    def order_price(self, product, price, ticks=None) -> float:
+        # Feed units price of an order: exact from whole ticks, otherwise the
+        # given price snapped to the contract's tick size
+        spec = self.contracts.get(product)
+        if ticks is not None:
+            if spec is None:
+                raise LookupError(f"No contract info for {product}")
+            return spec.from_ticks(ticks)
+        return price if spec is None else spec.round_price(price)
+
+    def cancel_order_msg(self, orderNo):
+        ordercancel = self.templates.order_cancel
+        ordercancel.orderNo = orderNo
+        return self.templates.wrap(
+            NinjaApiMessages_pb2.Header.ORDER_CANCEL_REQUEST, ordercancel
+        )
+
+    def cancel_all_msg(self, cancelGTCs=False):
+        cancelall = self.templates.cancel_all
+        cancelall.cancelGTCs = cancelGTCs
+        return self.templates.wrap(
+            NinjaApiMessages_pb2.Header.CANCEL_ALL_ORDERS_REQUEST, cancelall
+        )
+
+    def active_orders_msg(self):
+        return self.templates.wrap(
+            NinjaApiMessages_pb2.Header.ACTIVE_ORDERS_REQUEST,
+            self.templates.active_orders,
+        )
+
+    def register_handlers(self):
+        header = NinjaApiMessages_pb2.Header
+        self.register_handler(header.MARKET_UPDATES, self.on_market_updates)
+        self.register_handler(header.ACTIVE_ORDERS_RESPONSE, self.on_active_orders)
+        self.register_handler(header.ERROR, self.on_error)
+        self.register_handler(header.NINJA_RESPONSE, self.on_ninja)
+        self.register_handler(header.ACCOUNTS_RESPONSE, self.on_accounts)
+        self.register_handler(header.SHEETS_RESPONSE, self.on_sheets)
+        self.register_handler(header.SHEET_RISK_RESPONSE, self.on_sheet_risk)
+        self.register_handler(header.SHEET_STATE_RESPONSE, self.on_sheet_states)
+        self.register_handler(header.CONTRACT_INFO_RESPONSE, self.on_contract_info)
+        self.register_handler(header.SETTLEMENTS_RESPONSE, self.on_settlements)
+        self.register_handler(header.WORKING_RULES_RESPONSE, self.on_working_rules)
+        self.register_handler(
+            header.PRICE_FEED_STATUS_RESPONSE, self.on_price_feed_status
+        )
+        self.register_handler(
+            header.SECURITY_STATUSES_RESPONSE, self.on_security_statuses
+        )
+        self.register_handler(header.ORDER_ADD_EVENT, self.on_order_add)
+        self.register_handler(header.ORDER_REJECT_EVENT, self.on_order_reject)
+        self.register_handler(header.ORDER_ADD_FAILURE, self.on_order_add_failure)
+        self.register_handler(header.ORDER_CANCEL_EVENT, self.on_order_cancel)
+        self.register_handler(header.ORDER_CANCEL_FAILURE, self.on_order_cancel_failure)
+        self.register_handler(header.ORDER_CHANGE_EVENT, self.on_order_change)
+        self.register_handler(header.ORDER_CHANGE_FAILURE, self.on_order_change_failure)
+        self.register_handler(header.MASS_CANCEL_EVENT, self.on_mass_cancel)
+        self.register_handler(header.FILL_NOTICE, self.on_fill)
+
+    # ________________________________________________________________________________
+    # region ON EVERY MARKET UPDATE
+    def on_market_updates(self, payload):
+        if self.disconnected_at is not None:
+            self.mark_recovered()
+        self.market_data.on_market_updates(payload)
+
+    ##________________________________________________________________________________
+    # region PRINT AVAILABLE FIELDS
+    def on_active_orders(self, payload):
+        resp = self.pool.parse(NinjaApiOrderHandling_pb2.ActiveOrders, payload)
+        self.orders.reconcile(resp.activeOrders)
+        self.pool.release(resp)
+        if self.disconnected_at is not None and not self.owns_market_data:
+            self.mark_recovered()
+
+    def on_error(self, payload):
+        error = NinjaApiMessages_pb2.Error()
+        error.ParseFromString(payload)
+        if error.type in RATE_LIMIT_ERRORS:
+            self.throttle.on_rate_limited()
+        logging.info(error.msg)
+
+    def on_ninja(self, payload):
+        resp = NinjaApiMessages_pb2.NinjaInfo()
+        resp.ParseFromString(payload)
+        logging.info("Connected to ninja " + resp.name)
+
+    def on_accounts(self, payload):
+        resp = NinjaApiMessages_pb2.Accounts()
+        resp.ParseFromString(payload)
+        logging.info("Available accounts are " + ", ".join(resp.accounts))
+
+    def on_sheets(self, payload):
+        resp = NinjaApiSheets_pb2.Sheets()
+        resp.ParseFromString(payload)
+        self.sheet_risk.update_sheets(resp.sheets)
+        sheetnames = [sheet.name for sheet in resp.sheets]
+        logging.info("Available sheets are " + ", ".join(sheetnames))
+        getcontractinfo = NinjaApiContracts_pb2.GetContractInfo()
+        getsettlements = NinjaApiContracts_pb2.GetSettlements()
+        getsecuritystatuses = NinjaApiMarketData_pb2.GetSecurityStatuses()
+        for sheet in resp.sheets:
+            logging.info(
+                f"Sheet {sheet.name} has contracts {', '.join(contract.secDesc for contract in sheet.contracts)}"
+            )
+            contracts = [
+                contract for contract in sheet.contracts if contract.secDesc != "-----"
+            ]
+            getcontractinfo.contracts.extend(contracts)
+            getsettlements.contracts.extend(contracts)
+            getsecuritystatuses.contracts.extend(contracts)
+        if resp.sheets:
+            container = NinjaApiMessages_pb2.MsgContainer()
+            sheetrisk = NinjaApiSheets_pb2.GetSheetRisk()
+            sheetrisk.sheets.extend(sheetnames)
+            container.header.msgType = NinjaApiMessages_pb2.Header.SHEET_RISK_REQUEST
+            container.payload = sheetrisk.SerializeToString()
+            self.send_msg(container)
+            sheetstates = NinjaApiSheets_pb2.GetSheetStates()
+            sheetstates.sheets.extend(sheetnames)
+            container.header.msgType = NinjaApiMessages_pb2.Header.SHEET_STATE_REQUEST
+            container.payload = sheetstates.SerializeToString()
+            self.send_msg(container)
+            container.header.msgType = NinjaApiMessages_pb2.Header.CONTRACT_INFO_REQUEST
+            container.payload = getcontractinfo.SerializeToString()
+            self.send_msg(container)
+            container.header.msgType = NinjaApiMessages_pb2.Header.SETTLEMENTS_REQUEST
+            container.payload = getsettlements.SerializeToString()
+            self.send_msg(container)
+            container.header.msgType = (
+                NinjaApiMessages_pb2.Header.SECURITY_STATUSES_REQUEST
+            )
+            container.payload = getsecuritystatuses.SerializeToString()
+            self.send_msg(container)
+
+    def on_sheet_risk(self, payload):
+        resp = NinjaApiSheets_pb2.SheetRiskList()
+        resp.ParseFromString(payload)
+        self.sheet_risk.update_risk(resp.riskForSheets)
+        for sheetrisk in resp.riskForSheets:
+            logging.info(
+                f"Sheet {sheetrisk.sheet} has clip size {sheetrisk.clipSize} and {sheetrisk.maxOrders - sheetrisk.ordersSent} order adds remaining"
+            )
+
+    def on_sheet_states(self, payload):
+        resp = NinjaApiSheets_pb2.SheetStates()
+        resp.ParseFromString(payload)
+        for sheetstate in resp.sheetStates:
+            if sheetstate.status == NinjaApiSheets_pb2.SheetState.Status.DISABLED:
+                logging.info(f"Sheet {sheetstate.sheet} is DISABLED")
+            elif sheetstate.status == NinjaApiSheets_pb2.SheetState.Status.OFF:
+                logging.info(f"Sheet {sheetstate.sheet} is OFF")
+            elif sheetstate.status == NinjaApiSheets_pb2.SheetState.Status.ON:
+                logging.info(f"Sheet {sheetstate.sheet} is ON")
+
+    def on_contract_info(self, payload):
+        resp = NinjaApiContracts_pb2.ContractInfoList()
+        resp.ParseFromString(payload)
+        for contractinfo in resp.contractInfoList:
+            logging.info(
+                f"Contract {contractinfo.contract.secDesc} has {len(contractinfo.legs)} legs. "
+                f"It ticks in {contractinfo.tickSize} increments and each tick is worth {contractinfo.tickAmt} {contractinfo.currency}."
+            )
+        self.contracts.update(resp.contractInfoList)
+
+    def on_settlements(self, payload):
+        resp = NinjaApiContracts_pb2.Settlements()
+        resp.ParseFromString(payload)
+        for settlement in resp.settlements:
+            if settlement.HasField("prelim") and settlement.HasField("final"):
+                logging.info(
+                    f"Contract {settlement.contract.secDesc} "
+                    f"on {settlement.date.month}/{settlement.date.day}/{settlement.date.year} "
+                    f"has prelim settlement {settlement.prelim} and final settlement {settlement.final}."
+                )
+            elif settlement.HasField("prelim"):
+                logging.info(
+                    f"Contract {settlement.contract.secDesc} "
+                    f"on {settlement.date.month}/{settlement.date.day}/{settlement.date.year} "
+                    f"has prelim settlement {settlement.prelim}."
+                )
+            else:
+                logging.info(
+                    f"Contract {settlement.contract.secDesc} "
+                    f"on {settlement.date.month}/{settlement.date.day}/{settlement.date.year} "
+                    f"has final settlement {settlement.final}."
+                )
+
+    def on_working_rules(self, payload):
+        resp = NinjaApiWorkingRules_pb2.WorkingRules()
+        resp.ParseFromString(payload)
+        for rule in resp.workingRules:
+            logging.info(
+                f"Found working rule '{rule.prefix}' "
+                f"with type {NinjaApiWorkingRules_pb2.WorkingRule.WorkType.Name(rule.workType)}"
+            )
+
+    def on_price_feed_status(self, payload):
+        resp = NinjaApiMarketData_pb2.PriceFeedStatus()
+        resp.ParseFromString(payload)
+        logging.info(
+            f"Price feed status is {NinjaApiMarketData_pb2.PriceFeedStatus.Status.Name(resp.status)}"
+        )
+
+    def on_security_statuses(self, payload):
+        resp = NinjaApiMarketData_pb2.SecurityStatuses()
+        resp.ParseFromString(payload)
+        for secStatus in resp.statuses:
+            logging.info(
+                f"Security status for {secStatus.contract.secDesc} is {NinjaApiMarketData_pb2.SecurityStatus.Status.Name(secStatus.status)}"
+            )
+
+    def on_order_add(self, payload):
+        resp = self.pool.parse(NinjaApiOrderHandling_pb2.OrderAddEvent, payload)
+        self.orders.on_add(resp)
+        self.sheet_risk.on_add(resp)
+        logging.info(
+            f"Order {resp.orderNo} added on {resp.contract.secDesc}: "
+            f"{NinjaApiCommon_pb2.Side.Name(resp.side)} {resp.qty} at {resp.price} ({resp.prefix})"
+        )
+        self.pool.release(resp)
+
+    def on_order_reject(self, payload):
+        resp = self.pool.parse(NinjaApiOrderHandling_pb2.OrderRejectEvent, payload)
+        handle = self.orders.on_reject(resp)
+        if handle is not None:
+            self.sheet_risk.answered(handle.product)
+        logging.info(
+            f"Order {resp.orderNo} on {resp.contract.secDesc} rejected "
+            f"({NinjaApiOrderHandling_pb2.OrderRejectEvent.Action.Name(resp.action)}): "
+            f'("{resp.reason}")'
+        )
+        self.pool.release(resp)
+
+    def on_order_add_failure(self, payload):
+        resp = self.pool.parse(NinjaApiOrderHandling_pb2.OrderAddFailure, payload)
+        self.orders.on_add_failure(resp)
+        self.sheet_risk.on_add_failure(resp)
+        if resp.errorCode in RATE_LIMIT_ERRORS:
+            self.throttle.on_rate_limited()
+        logging.info(
+            f"Received order add failure for {resp.contract.secDesc} "
+            f"with order number ({resp.orderNo}). "
+            f"Error code: {resp.errorCode}. "
+            f'Reason: ("{resp.reason}").'
+        )
+        self.pool.release(resp)
+
+    def on_order_cancel(self, payload):
+        resp = self.pool.parse(NinjaApiOrderHandling_pb2.OrderCancelEvent, payload)
+        self.orders.on_cancel(resp)
+        logging.info(
+            f"Canceled order {resp.orderNo} on contract {resp.contract.secDesc}"
+        )
+        self.pool.release(resp)
+
+    def on_order_cancel_failure(self, payload):
+        resp = self.pool.parse(NinjaApiOrderHandling_pb2.OrderCancelFailure, payload)
+        logging.info(
+            f"Received order cancel failure for order {resp.orderNo} on contract {resp.contract.secDesc}"
+        )
+        self.pool.release(resp)
+
+    def on_order_change(self, payload):
+        resp = self.pool.parse(NinjaApiOrderHandling_pb2.OrderChangeEvent, payload)
+        self.orders.on_change(resp)
+        logging.info(
+            f"Received order change event for {resp.contract.secDesc} "
+            f"with order number ({resp.orderNo}). "
+            f"Price: {resp.price}, Side: {NinjaApiCommon_pb2.Side.Name(resp.side)}, Qty: {resp.qty}"
+        )
+        self.pool.release(resp)
+
+    def on_order_change_failure(self, payload):
+        resp = self.pool.parse(NinjaApiOrderHandling_pb2.OrderChangeFailure, payload)
+        if resp.errorCode in RATE_LIMIT_ERRORS:
+            self.throttle.on_rate_limited()
+        logging.info(
+            f"Received order change failure for {resp.contract.secDesc} "
+            f"with order number ({resp.orderNo}), side ({resp.side}), qty ({resp.qty}), price ({resp.price}), worker ({resp.prefix}). "
+            f"Error code: {NinjaApiMessages_pb2.Error.Type.Name(resp.errorCode)}."
+            f'Reason: ("{resp.reason}").'
+        )
+        self.pool.release(resp)
+
+    def on_mass_cancel(self, payload):
+        resp = self.pool.parse(NinjaApiOrderHandling_pb2.MassCancelEvent, payload)
+        self.orders.on_mass_cancel(resp)
+        logging.info(f"{len(resp.canceledOrders)} were canceled. They are: ")
+        for order in resp.canceledOrders:
+            logging.info(
+                f"Canceled order {order.orderNo} on contract {order.contract.secDesc}"
+            )
+        self.pool.release(resp)
+
+    def on_fill(self, payload):
+        resp = self.pool.parse(NinjaApiOrderHandling_pb2.FillNotice, payload)
+        # Position first, a check in between sees the fill twice, never not at all
+        self.risk.on_fill(resp)
+        self.orders.on_fill(resp)
+        self.fillCounter += 1
+        logging.info(
+            f"Filled on {resp.qty if resp.side == NinjaApiCommon_pb2.Side.BUY else -resp.qty} "
+            f"{resp.contract.secDesc} ({resp.orderNo}) at a price of {resp.price}. "
+        )
+        if self.logging:
+            # log the trade in txt
+            tradeTime = datetime.fromtimestamp(resp.transactTime.timestamp / 1e9)
+            if resp.side == NinjaApiCommon_pb2.Side.BUY:
+                self.logger.log_trade(
+                    tradeTime,
+                    resp.price,
+                    resp.qty,
+                    resp.account,
+                )
+            elif resp.side == NinjaApiCommon_pb2.Side.SELL:
+                self.logger.log_trade(
+                    tradeTime,
+                    resp.price,
+                    -1 * resp.qty,
+                    resp.account,
+                )
+        self.pool.release(resp)
+
+    def on_connection_lost(self):
+        # adds in flight may or may not have reached the server, the next
+        # reconciliation shows which did
+        self.orders.fail_pending("connection lost")
+        self.sheet_risk.clear_in_flight()
+        if self.owns_market_data:
+            logging.warning("Trading connection lost. Market data invalidated.")
+            self.market_data.invalidate()
+        else:
+            logging.warning("Trading connection lost.")
+
+
+class TradingClient(TradingSession, NinjaApiClient):
+
+    def __init__(self, market_data=None):
+        NinjaApiClient.__init__(self, settings.trading_host, settings.trading_port)
+        self.init_session(market_data)
 
     """
     Submit an order to the specified exchange.
@@ -136,9 +694,11 @@ class TradingClient(NinjaApiClient):
         worker (str, optional): Identifier for the worker or system submitting the order. Default is "w".
         exchange (Exchange Enum, optional): The exchange to route the order to (e.g., CME). Default is NinjaApiCommon_pb2.Exchange.CME.
         tag (str, optional): A custom string for tagging or identifying the order. Default is "".
+        ticks (int, optional): The price as whole ticks of the contract, used instead of price.
+        urgent (bool, optional): Sent ahead of other requests when throttled and may use the sheet's reserved order adds. Default is False.
         log (bool, optional): Whether to log the order submission. Default is True.
     Returns:
-        None
+        OrderHandle, resolves with the orderNo once the server accepted or failed the order
     """
 
     def order(
@@ -150,25 +710,14 @@ class TradingClient(NinjaApiClient):
         worker="w",
         exchange=NinjaApiCommon_pb2.Exchange.CME,
         tag="",
+        ticks=None,
+        urgent=False,
         # log=True,
     ):
-        container = NinjaApiMessages_pb2.MsgContainer()
-        orderadd = NinjaApiOrderHandling_pb2.OrderAdd()
-        orderadd.account = account
-        orderadd.contract.exchange = exchange
-        orderadd.contract.secDesc = product
-        orderadd.contract.whName = product
-        orderadd.timeInForce.type = NinjaApiOrderHandling_pb2.TimeInForce.Type.GTC
-        if qty < 0:
-            orderadd.side = NinjaApiCommon_pb2.Side.SELL
-        else:
-            orderadd.side = NinjaApiCommon_pb2.Side.BUY
-        orderadd.qty = abs(qty)
-        orderadd.price = price
-        orderadd.prefix = worker
-        container.header.msgType = NinjaApiMessages_pb2.Header.ORDER_ADD_REQUEST
-        container.payload = orderadd.SerializeToString()
-        self.send_msg(container)
+        self.throttle.acquire(urgent)
+        return self.send_order(
+            account, product, price, qty, worker, exchange, tag, ticks, urgent
+        )
 
     """
     Cancels ALL working orders and submits market order to flatten at the specifed price. 
@@ -180,9 +729,9 @@ class TradingClient(NinjaApiClient):
         worker (str, optional): Identifier for the worker or system submitting the order. Default is "w".
         exchange (Exchange Enum, optional): The exchange to route the order to (e.g., CME). Default is NinjaApiCommon_pb2.Exchange.CME.
         tag (str, optional): A custom string for tagging or identifying the order. Default is "".
-        log (bool, optional): Whether to log the order submission. Default is True.
+        ticks (int, optional): The price as whole ticks of the contract, used instead of price.
     Returns:
-        None
+        OrderHandle of the flattening order
     """
 
     def flatten(
@@ -194,14 +743,16 @@ class TradingClient(NinjaApiClient):
         worker="w",
         exchange=NinjaApiCommon_pb2.Exchange.CME,
         tag="",
+        ticks=None,
     ):
-        container = NinjaApiMessages_pb2.MsgContainer()
-        ordercancel = NinjaApiOrderHandling_pb2.CancelAllOrders()
-        ordercancel.cancelGTCs = True
-        container.header.msgType = NinjaApiMessages_pb2.Header.CANCEL_ALL_ORDERS_REQUEST
-        container.payload = ordercancel.SerializeToString()
-        self.send_msg(container)
-        self.order(account, product, price, qty, tag=tag)
+        # both requests take their token before the cancel goes out
+        self.throttle.acquire(urgent=True)
+        self.throttle.acquire(urgent=True)
+        with self.batch():
+            self.send_msg(self.cancel_all_msg(cancelGTCs=True))
+            return self.send_order(
+                account, product, price, qty, worker, exchange, tag, ticks, True
+            )
 
     """
     Change order according to given parameters
@@ -209,7 +760,7 @@ class TradingClient(NinjaApiClient):
         orderNo (str): The order number/identifier that we want to change
         price (float): The price at which to change the order.
         qty (int): The number of contracts/shares to trade.
-        
+        ticks (int, optional): The price as whole ticks of the contract, used instead of price.
     Returns:
         None
     """
@@ -230,23 +781,20 @@ class TradingClient(NinjaApiClient):
 
     # JUST CHANGES THE ORDER
     def change_order(
-        self, orderNo, price, qty, worker="w", account="", product="", exchange=1
+        self,
+        orderNo,
+        price,
+        qty,
+        worker="w",
+        account="",
+        product="",
+        exchange=1,
+        ticks=None,
     ):
-        # change order to new price and qty
-        if qty < 0:
-            logging.info(
-                "Negative qtys are transitioned to positive as side captures direction."
-            )
-            qty = abs(qty)
-        container = NinjaApiMessages_pb2.MsgContainer()
-        orderchange = NinjaApiOrderHandling_pb2.OrderChange()
-        orderchange.orderNo = orderNo
-        orderchange.qty = qty
-        orderchange.price = price
-        orderchange.prefix = worker
-        container.header.msgType = NinjaApiMessages_pb2.Header.ORDER_CHANGE_REQUEST
-        container.payload = orderchange.SerializeToString()
-        self.send_msg(container)
+        msg = self.change_order_msg(orderNo, price, qty, worker, product, ticks)
+        if msg is not None:
+            self.throttle.acquire()
+            self.send_msg(msg)
 
     # # CHANGES ORDER TO G WORKER THEN ASSIGNS WORKER TO IT
     # def change_order(
@@ -285,12 +833,8 @@ class TradingClient(NinjaApiClient):
     """
 
     def cancel_order(self, orderNo):
-        container = NinjaApiMessages_pb2.MsgContainer()
-        ordercancel = NinjaApiOrderHandling_pb2.OrderCancel()
-        ordercancel.orderNo = orderNo
-        container.header.msgType = NinjaApiMessages_pb2.Header.ORDER_CANCEL_REQUEST
-        container.payload = ordercancel.SerializeToString()
-        self.send_msg(container)
+        self.throttle.acquire(urgent=True)
+        self.send_msg(self.cancel_order_msg(orderNo))
 
     """
     Mass Cancel all orders
@@ -301,11 +845,8 @@ class TradingClient(NinjaApiClient):
     """
 
     def mass_cancel(self):
-        container = NinjaApiMessages_pb2.MsgContainer()
-        masscancel = NinjaApiOrderHandling_pb2.CancelAllOrders()
-        container.header.msgType = NinjaApiMessages_pb2.Header.CANCEL_ALL_ORDERS_REQUEST
-        container.payload = masscancel.SerializeToString()
-        self.send_msg(container)
+        self.throttle.acquire(urgent=True)
+        self.send_msg(self.cancel_all_msg())
         logging.info(f"Mass Cancel Request Sent")
 
     """
@@ -317,346 +858,39 @@ class TradingClient(NinjaApiClient):
     """
 
     def check_orders(self):
-        container = NinjaApiMessages_pb2.MsgContainer()
-        getactiveorders = NinjaApiOrderHandling_pb2.GetActiveOrders()
-        getactiveorders.showOnlyApiOrders = True
-        container.header.msgType = NinjaApiMessages_pb2.Header.ACTIVE_ORDERS_REQUEST
-        container.payload = getactiveorders.SerializeToString()
-        self.send_msg(container)
+        self.send_msg(self.active_orders_msg())
 
-    def run(self):
+    def start_session(self):
         # region LOGIN
-        login = NinjaApiMessages_pb2.Login()
-        login.user = settings.trading_user
-        login.password = settings.trading_password
-        login.connectionType = NinjaApiMessages_pb2.ConnectionType.TRADING_CONNECTION
-        login.accessToken = settings.trading_access_token
-        container = NinjaApiMessages_pb2.MsgContainer()
-        container.header.msgType = NinjaApiMessages_pb2.Header.LOGIN_REQUEST
-        container.header.version = "v1.0.0"
-        container.payload = login.SerializeToString()
-        self.send_msg(container)
-
-        ##________________________________________________________________________________
-        # region REQUEST AVAILABLE FIELDS
-        container.header.msgType = NinjaApiMessages_pb2.Header.NINJA_REQUEST
-        container.payload = b""
-        self.send_msg(container)
-        container.header.msgType = NinjaApiMessages_pb2.Header.ACCOUNTS_REQUEST
-        self.send_msg(container)
-        container.header.msgType = NinjaApiMessages_pb2.Header.WORKING_RULES_REQUEST
-        self.send_msg(container)
-        container.header.msgType = NinjaApiMessages_pb2.Header.PRICE_FEED_STATUS_REQUEST
-        self.send_msg(container)
-        sheets = NinjaApiSheets_pb2.Sheets()
-        container.header.msgType = NinjaApiMessages_pb2.Header.SHEETS_REQUEST
-        container.payload = sheets.SerializeToString()
-        self.send_msg(container)
-
-        ##________________________________________________________________________________
-        # region START MARKET DATA
-        startmd = NinjaApiMarketData_pb2.StartMarketData()
-        for product in self.products.keys():
-            contract = startmd.contracts.add()
-            contract.exchange = self.products.get(product)
-            contract.secDesc = product
-            contract.whName = product
-        startmd.cadence.duration = 0  # in milliseconds
-        startmd.includeImplieds = True
-        startmd.includeTradeUpdates = True
-        container.header.msgType = NinjaApiMessages_pb2.Header.START_MARKET_DATA_REQUEST
-        container.payload = startmd.SerializeToString()
-        self.send_msg(container)
-        while self.connected:
+        with self.batch():
+            self.send_msg(self.login_msg())
+
+            ##________________________________________________________________________________
+            # region REQUEST AVAILABLE FIELDS AND START MARKET DATA
+            for container in self.session_msgs():
+                self.send_msg(container)
+            # resync working orders that changed while disconnected
+            self.check_orders()
+        self.lastOrderCheck = datetime.now()
+
+    def run(self):
+        if self.connected:
+            self.start_session()
+        while self.running:
+            if not self.connected:
+                self.reconnect()
+                continue
             if datetime.now() > self.lastPrintTime + timedelta(seconds=60):
-                if len(self.activeOrders) > 0:
-                    logging.info(
-                        "| ".join(
-                            f"{order.orderNo}: {order.account}, {order.price}, {order.qty*((-2*order.side)+3)}"
-                            for order in self.activeOrders.values()
-                        )
-                    )
-                else:
-                    logging.info("No Active Orders")
-                self.lastPrintTime = datetime.now().replace(second=0)
-            if datetime.now() > self.lastOrderCheck + timedelta(microseconds=50_000):
+                self.log_summary()
+            # order state follows the order events, ACTIVE_ORDERS only
+            # reconciles it in case one was missed
+            reconcile = timedelta(seconds=settings.order_reconcile_interval)
+            if datetime.now() > self.lastOrderCheck + reconcile:
                 self.check_orders()
                 self.lastOrderCheck = datetime.now()
 
-            msg = self.recv_msg()
-            if not msg:
-                continue
-
-            # ________________________________________________________________________________
-            # region ON EVERY MARKET UPDATE
-            elif msg.header.msgType == NinjaApiMessages_pb2.Header.MARKET_UPDATES:
-                resp = NinjaApiMarketData_pb2.MarketUpdates()
-                resp.ParseFromString(msg.payload)
-                for update in resp.marketUpdates:
-                    product = update.contract.secDesc
-                    if len(update.tradeUpdates) > 0:
-                        high = None
-                        low = None
-                        volume = 0
-                        if len(update.tradeUpdates) == 1:
-                            high = update.tradeUpdates[0].tradePrice
-                            low = update.tradeUpdates[0].tradePrice
-                            volume = update.tradeUpdates[0].tradeQty
-                        else:
-                            for trade in update.tradeUpdates:
-                                if high is None:
-                                    high = trade.tradePrice
-                                elif trade.tradePrice > high:
-                                    high = trade.tradePrice
-                                if low is None:
-                                    low = trade.tradePrice
-                                elif trade.tradePrice < low:
-                                    low = trade.tradePrice
-                                volume += trade.tradeQty
-
-                        self.latest_trade_price[product] = update.tradeUpdates[
-                            -1
-                        ].tradePrice
-                        self.latest_high[product] = high
-                        self.latest_low[product] = low
-                        self.latest_bid[product] = update.tobUpdate.bidPrice
-                        self.latest_ask[product] = update.tobUpdate.askPrice
-                        self.latest_volume[product] += volume
-
-                # logging.info(f"trade_price: {self.latest_trade_price}")
-                # logging.info(f"bid: {self.latest_bid}")
-                # logging.info(f"ask: {self.latest_ask}")
-                # logging.info(f"low: {self.latest_low}")
-                # logging.info(f"high: {self.latest_high}")
-            ##________________________________________________________________________________
-            # region PRINT AVAILABLE FIELDS
-            elif (
-                msg.header.msgType == NinjaApiMessages_pb2.Header.ACTIVE_ORDERS_RESPONSE
-            ):
-                resp = NinjaApiOrderHandling_pb2.ActiveOrders()
-                resp.ParseFromString(msg.payload)
-                self.activeOrders.clear()
-                for activeorder in resp.activeOrders:
-                    if activeorder.qty != 0:
-                        self.activeOrders[activeorder.orderNo] = activeorder
-                self.activeOrderCounter += 1
-            elif msg.header.msgType == NinjaApiMessages_pb2.Header.ERROR:
-                error = NinjaApiMessages_pb2.Error()
-                error.ParseFromString(msg.payload)
-                logging.info(error.msg)
-            elif msg.header.msgType == NinjaApiMessages_pb2.Header.NINJA_RESPONSE:
-                resp = NinjaApiMessages_pb2.NinjaInfo()
-                resp.ParseFromString(msg.payload)
-                logging.info("Connected to ninja " + resp.name)
-            elif msg.header.msgType == NinjaApiMessages_pb2.Header.ACCOUNTS_RESPONSE:
-                resp = NinjaApiMessages_pb2.Accounts()
-                resp.ParseFromString(msg.payload)
-                logging.info("Available accounts are " + ", ".join(resp.accounts))
-            elif msg.header.msgType == NinjaApiMessages_pb2.Header.SHEETS_RESPONSE:
-                resp = NinjaApiSheets_pb2.Sheets()
-                resp.ParseFromString(msg.payload)
-                sheetnames = [sheet.name for sheet in resp.sheets]
-                logging.info("Available sheets are " + ", ".join(sheetnames))
-                getcontractinfo = NinjaApiContracts_pb2.GetContractInfo()
-                getsettlements = NinjaApiContracts_pb2.GetSettlements()
-                getsecuritystatuses = NinjaApiMarketData_pb2.GetSecurityStatuses()
-                for sheet in resp.sheets:
-                    logging.info(
-                        f"Sheet {sheet.name} has contracts {', '.join(contract.secDesc for contract in sheet.contracts)}"
-                    )
-                    contracts = [
-                        contract
-                        for contract in sheet.contracts
-                        if contract.secDesc != "-----"
-                    ]
-                    getcontractinfo.contracts.extend(contracts)
-                    getsettlements.contracts.extend(contracts)
-                    getsecuritystatuses.contracts.extend(contracts)
-                if resp.sheets:
-                    sheetrisk = NinjaApiSheets_pb2.GetSheetRisk()
-                    sheetrisk.sheets.extend(sheetnames)
-                    container.header.msgType = (
-                        NinjaApiMessages_pb2.Header.SHEET_RISK_REQUEST
-                    )
-                    container.payload = sheetrisk.SerializeToString()
-                    self.send_msg(container)
-                    sheetstates = NinjaApiSheets_pb2.GetSheetStates()
-                    sheetstates.sheets.extend(sheetnames)
-                    container.header.msgType = (
-                        NinjaApiMessages_pb2.Header.SHEET_STATE_REQUEST
-                    )
-                    container.payload = sheetstates.SerializeToString()
-                    self.send_msg(container)
-                    container.header.msgType = (
-                        NinjaApiMessages_pb2.Header.CONTRACT_INFO_REQUEST
-                    )
-                    container.payload = getcontractinfo.SerializeToString()
-                    self.send_msg(container)
-                    container.header.msgType = (
-                        NinjaApiMessages_pb2.Header.SETTLEMENTS_REQUEST
-                    )
-                    container.payload = getsettlements.SerializeToString()
-                    self.send_msg(container)
-                    container.header.msgType = (
-                        NinjaApiMessages_pb2.Header.SECURITY_STATUSES_REQUEST
-                    )
-                    container.payload = getsecuritystatuses.SerializeToString()
-                    self.send_msg(container)
-            elif msg.header.msgType == NinjaApiMessages_pb2.Header.SHEET_RISK_RESPONSE:
-                resp = NinjaApiSheets_pb2.SheetRiskList()
-                resp.ParseFromString(msg.payload)
-                for sheetrisk in resp.riskForSheets:
-                    logging.info(
-                        f"Sheet {sheetrisk.sheet} has clip size {sheetrisk.clipSize} and {sheetrisk.maxOrders - sheetrisk.ordersSent} order adds remaining"
-                    )
-            elif msg.header.msgType == NinjaApiMessages_pb2.Header.SHEET_STATE_RESPONSE:
-                resp = NinjaApiSheets_pb2.SheetStates()
-                resp.ParseFromString(msg.payload)
-                for sheetstate in resp.sheetStates:
-                    if (
-                        sheetstate.status
-                        == NinjaApiSheets_pb2.SheetState.Status.DISABLED
-                    ):
-                        logging.info(f"Sheet {sheetstate.sheet} is DISABLED")
-                    elif sheetstate.status == NinjaApiSheets_pb2.SheetState.Status.OFF:
-                        logging.info(f"Sheet {sheetstate.sheet} is OFF")
-                    elif sheetstate.status == NinjaApiSheets_pb2.SheetState.Status.ON:
-                        logging.info(f"Sheet {sheetstate.sheet} is ON")
-            elif (
-                msg.header.msgType == NinjaApiMessages_pb2.Header.CONTRACT_INFO_RESPONSE
-            ):
-                resp = NinjaApiContracts_pb2.ContractInfoList()
-                resp.ParseFromString(msg.payload)
-                for contractinfo in resp.contractInfoList:
-                    logging.info(
-                        f"Contract {contractinfo.contract.secDesc} has {len(contractinfo.legs)} legs. "
-                        f"It ticks in {contractinfo.tickSize} increments and each tick is worth {contractinfo.tickAmt} {contractinfo.currency}."
-                    )
-            elif msg.header.msgType == NinjaApiMessages_pb2.Header.SETTLEMENTS_RESPONSE:
-                resp = NinjaApiContracts_pb2.Settlements()
-                resp.ParseFromString(msg.payload)
-                for settlement in resp.settlements:
-                    if settlement.HasField("prelim") and settlement.HasField("final"):
-                        logging.info(
-                            f"Contract {settlement.contract.secDesc} "
-                            f"on {settlement.date.month}/{settlement.date.day}/{settlement.date.year} "
-                            f"has prelim settlement {settlement.prelim} and final settlement {settlement.final}."
-                        )
-                    elif settlement.HasField("prelim"):
-                        logging.info(
-                            f"Contract {settlement.contract.secDesc} "
-                            f"on {settlement.date.month}/{settlement.date.day}/{settlement.date.year} "
-                            f"has prelim settlement {settlement.prelim}."
-                        )
-                    else:
-                        logging.info(
-                            f"Contract {settlement.contract.secDesc} "
-                            f"on {settlement.date.month}/{settlement.date.day}/{settlement.date.year} "
-                            f"has final settlement {settlement.final}."
-                        )
-            elif (
-                msg.header.msgType == NinjaApiMessages_pb2.Header.WORKING_RULES_RESPONSE
-            ):
-                resp = NinjaApiWorkingRules_pb2.WorkingRules()
-                resp.ParseFromString(msg.payload)
-                for rule in resp.workingRules:
-                    logging.info(
-                        f"Found working rule '{rule.prefix}' "
-                        f"with type {NinjaApiWorkingRules_pb2.WorkingRule.WorkType.Name(rule.workType)}"
-                    )
-            elif (
-                msg.header.msgType
-                == NinjaApiMessages_pb2.Header.PRICE_FEED_STATUS_RESPONSE
-            ):
-                resp = NinjaApiMarketData_pb2.PriceFeedStatus()
-                resp.ParseFromString(msg.payload)
-                logging.info(
-                    f"Price feed status is {NinjaApiMarketData_pb2.PriceFeedStatus.Status.Name(resp.status)}"
-                )
-            elif (
-                msg.header.msgType
-                == NinjaApiMessages_pb2.Header.SECURITY_STATUSES_RESPONSE
-            ):
-                resp = NinjaApiMarketData_pb2.SecurityStatuses()
-                resp.ParseFromString(msg.payload)
-                for secStatus in resp.statuses:
-                    logging.info(
-                        f"Security status for {secStatus.contract.secDesc} is {NinjaApiMarketData_pb2.SecurityStatus.Status.Name(secStatus.status)}"
-                    )
-            elif msg.header.msgType == NinjaApiMessages_pb2.Header.ORDER_ADD_FAILURE:
-                resp = NinjaApiOrderHandling_pb2.OrderAddFailure()
-                resp.ParseFromString(msg.payload)
-                logging.info(
-                    f"Received order add failure for {resp.contract.secDesc} "
-                    f"with order number ({resp.orderNo}). "
-                    f"Error code: {resp.errorCode}. "
-                    f'Reason: ("{resp.reason}").'
-                )
-            elif msg.header.msgType == NinjaApiMessages_pb2.Header.ORDER_CANCEL_EVENT:
-                resp = NinjaApiOrderHandling_pb2.OrderCancelEvent()
-                resp.ParseFromString(msg.payload)
-                logging.info(
-                    f"Canceled order {resp.orderNo} on contract {resp.contract.secDesc}"
-                )
-            elif msg.header.msgType == NinjaApiMessages_pb2.Header.ORDER_CANCEL_FAILURE:
-                resp = NinjaApiOrderHandling_pb2.OrderCancelFailure()
-                resp.ParseFromString(msg.payload)
-                logging.info(
-                    f"Received order cancel failure for order {resp.orderNo} on contract {resp.contract.secDesc}"
-                )
-            elif msg.header.msgType == NinjaApiMessages_pb2.Header.ORDER_CHANGE_EVENT:
-                resp = NinjaApiOrderHandling_pb2.OrderChangeEvent()
-                resp.ParseFromString(msg.payload)
-                logging.info(
-                    f"Received order change event for {resp.contract.secDesc} "
-                    f"with order number ({resp.orderNo}). "
-                    f"Price: {resp.price}, Side: {NinjaApiCommon_pb2.Side.Name(resp.side)}, Qty: {resp.qty}"
-                )
-            elif msg.header.msgType == NinjaApiMessages_pb2.Header.ORDER_CHANGE_FAILURE:
-                resp = NinjaApiOrderHandling_pb2.OrderChangeFailure()
-                resp.ParseFromString(msg.payload)
-                logging.info(
-                    f"Received order change failure for {resp.contract.secDesc} "
-                    f"with order number ({resp.orderNo}), side ({resp.side}), qty ({resp.qty}), price ({resp.price}), worker ({resp.prefix}). "
-                    f"Error code: {NinjaApiMessages_pb2.Error.Type.Name(resp.errorCode)}."
-                    f'Reason: ("{resp.reason}").'
-                )
-            elif msg.header.msgType == NinjaApiMessages_pb2.Header.MASS_CANCEL_EVENT:
-                resp = NinjaApiOrderHandling_pb2.MassCancelEvent()
-                resp.ParseFromString(msg.payload)
-                logging.info(f"{len(resp.canceledOrders)} were canceled. They are: ")
-                for order in resp.canceledOrders:
-                    logging.info(
-                        f"Canceled order {order.orderNo} on contract {order.contract.secDesc}"
-                    )
-            elif msg.header.msgType == NinjaApiMessages_pb2.Header.FILL_NOTICE:
-                resp = NinjaApiOrderHandling_pb2.FillNotice()
-                resp.ParseFromString(msg.payload)
-                self.fillCounter += 1
-                logging.info(
-                    f"Filled on {resp.qty if resp.side == NinjaApiCommon_pb2.Side.BUY else -resp.qty} "
-                    f"{resp.contract.secDesc} ({resp.orderNo}) at a price of {resp.price}. "
-                )
-                if self.logging:
-                    # log the trade in txt
-                    tradeTime = datetime.fromtimestamp(
-                        resp.transactTime.timestamp / 1e9
-                    )
-                    if resp.side == NinjaApiCommon_pb2.Side.BUY:
-                        self.logger.log_trade(
-                            tradeTime,
-                            resp.price,
-                            resp.qty,
-                            resp.account,
-                        )
-                    elif resp.side == NinjaApiCommon_pb2.Side.SELL:
-                        self.logger.log_trade(
-                            tradeTime,
-                            resp.price,
-                            -1 * resp.qty,
-                            resp.account,
-                        )
-
-            time.sleep(0.02)
+            # drain everything that is ready, otherwise block until the next order check
+            timeout = (self.lastOrderCheck + reconcile - datetime.now()).total_seconds()
+            self.poll(max(timeout, 0))
 
         self.disconnect()
@@ -0,0 +1,141 @@
+import math
+
+from collections import deque
+
+import numpy as np
+
+from bar_builder import ohlc
+
+GK_CLOSE_OPEN = 2 * math.log(2) - 1
+PARKINSON_SCALE = 1 / (4 * math.log(2))
+
+
+def garman_klass_terms(open, high, low, close):
+    # Per bar Garman-Klass variance, works on scalars and numpy arrays
+    log_high_low = np.log(high / low) ** 2
+    log_close_open = np.log(close / open) ** 2
+    return 0.5 * log_high_low - GK_CLOSE_OPEN * log_close_open
+
+
+def parkinson_terms(high, low):
+    return PARKINSON_SCALE * np.log(high / low) ** 2
+
+
+def realized_terms(close):
+    # Squared close to close log returns, one fewer than there are closes
+    close = np.asarray(close, dtype=np.float64)
+    return np.diff(np.log(close)) ** 2
+
+
+class RollingSum:
+    __slots__ = ("terms", "total", "updates")
+
+    def __init__(self, window):
+        self.terms = deque(maxlen=window)
+        self.total = 0.0
+        self.updates = 0
+
+    def add(self, term):
+        terms = self.terms
+        if len(terms) == terms.maxlen:
+            self.total -= terms[0]
+        terms.append(term)
+        self.updates += 1
+        if self.updates % terms.maxlen == 0:
+            self.total = math.fsum(terms)  # keep float drift from accumulating
+        else:
+            self.total += term
+
+    def extend(self, terms):
+        self.terms.extend(terms)
+        self.total = math.fsum(self.terms)
+
+    def vol(self):
+        if not self.terms:
+            return None
+        return math.sqrt(max(self.total, 0.0) / len(self.terms))
+
+
+class RollingVolatility:
+    """
+    Garman-Klass, Parkinson and realized (close to close) volatility over the
+    last window bars, per bar rather than annualized. add_bar() is O(1) and
+    can be registered as a BarBuilder on_bar listener; the latest values are
+    plain attributes, so reading them from another thread costs nothing and
+    never sees a half applied bar. seed() and from_trades() build the same
+    state from history with numpy.
+    """
+
+    def __init__(self, window=1):
+        self.window = window
+        self.gk = RollingSum(window)
+        self.parkinson = RollingSum(window)
+        self.realized = RollingSum(window)
+        self.last_close = None
+        self.garman_klass_vol = None
+        self.parkinson_vol = None
+        self.realized_vol = None  # needs two bars
+        self.updates = 0  # bars applied, bumped after the values above
+
+    def add_bar(self, bar):
+        self.add(bar.open, bar.high, bar.low, bar.close)
+
+    def add(self, open, high, low, close):
+        if low <= 0 or open <= 0:
+            return
+        log_high_low = math.log(high / low) ** 2
+        log_close_open = math.log(close / open) ** 2
+        self.gk.add(0.5 * log_high_low - GK_CLOSE_OPEN * log_close_open)
+        self.parkinson.add(PARKINSON_SCALE * log_high_low)
+        if self.last_close is not None:
+            self.realized.add(math.log(close / self.last_close) ** 2)
+        self.last_close = close
+        self.publish()
+
+    def publish(self):
+        self.garman_klass_vol = self.gk.vol()
+        self.parkinson_vol = self.parkinson.vol()
+        self.realized_vol = self.realized.vol()
+        self.updates += 1
+
+    """
+    Seed the windows from historical bars, e.g. the closed bars of a seeded BarBuilder
+    Parameters:
+        open, high, low, close (array): Bar prices, oldest first.
+    """
+
+    def seed(self, open, high, low, close):
+        open, high, low, close = (
+            np.asarray(prices, dtype=np.float64) for prices in (open, high, low, close)
+        )
+        if len(close) == 0:
+            return
+        self.gk.extend(garman_klass_terms(open, high, low, close)[-self.window :])
+        self.parkinson.extend(parkinson_terms(high, low)[-self.window :])
+        self.realized.extend(realized_terms(close)[-self.window :])
+        self.last_close = float(close[-1])
+        self.publish()
+
+    def seed_bars(self, bars):
+        # seed() from a list of Bar, e.g. BarBuilder.bars(interval)
+        if bars:
+            self.seed(*np.array([bar[3:7] for bar in bars], dtype=np.float64).T)
+
+    """
+    Build the volatility from raw trades in one vectorized pass
+    Parameters:
+        times (array): Trade times in epoch nanoseconds, ascending.
+        prices (array): Trade prices.
+        interval (int): Bar length in seconds.
+        window (int, optional): Number of bars in the rolling window.
+    Returns:
+        RollingVolatility
+    """
+
+    @classmethod
+    def from_trades(cls, times, prices, interval, window=1):
+        volatility = cls(window)
+        if len(times) > 0:
+            bars = ohlc(times, prices, interval)
+            volatility.seed(bars.open, bars.high, bars.low, bars.close)
+        return volatility
@@ -0,0 +1,5 @@
+import os
+
+# config.Settings requires the trading connection's credentials
+for name in ("USER", "PASSWORD", "ACCESS_TOKEN"):
+    os.environ.setdefault(f"NINJA_API_TRADING_{name}", "test")
@@ -0,0 +1,38 @@
+import asyncio
+
+from async_trading_client import AsyncTradingClient
+from order_manager import OrderHandle
+
+
+def test_dropped_connection_fails_pending_handles(tmp_path, monkeypatch):
+    # The session's TradingLogger writes to trades/ under the working directory
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "trades").mkdir()
+
+    async def scenario():
+        accepted = asyncio.get_running_loop().create_future()
+
+        def on_connect(reader, writer):
+            accepted.set_result(writer)
+
+        server = await asyncio.start_server(on_connect, "127.0.0.1", 0)
+        client = AsyncTradingClient()
+        client.logging = False
+        client.port = server.sockets[0].getsockname()[1]
+        await client.connect()
+        peer = await accepted
+        handle = await client.order("FW078", "NQU5", 2345000, 1)
+        assert not handle.done()
+        receiver = asyncio.create_task(client.receive_loop())
+        peer.close()
+        assert await asyncio.wait_for(handle, 5) is None
+        await receiver
+        server.close()
+        await server.wait_closed()
+        return client, handle
+
+    client, handle = asyncio.run(scenario())
+    assert handle.status == OrderHandle.FAILED
+    assert handle.reason == "connection lost"
+    assert not client.connected
+    assert not client.sheet_risk.in_flight
@@ -0,0 +1,114 @@
+import time
+
+import numpy as np
+import pytest
+
+from bar_builder import Bar, BarBuilder, ohlc
+
+SECOND = 10**9
+T0 = 1_700_000_040 * SECOND  # on a minute boundary
+
+
+@pytest.fixture
+def builder():
+    # Boundaries are driven by the tests instead of the shared timers
+    builder = BarBuilder("NQU5", intervals=(60, 1))
+    builder.running = True
+    builder.arm = lambda i, boundary: None
+    yield builder
+    builder.running = False
+
+
+def test_a_trade_past_the_bar_end_closes_the_bar(builder):
+    closed = []
+    builder.on_bar(closed.append)
+    builder.add_trade(T0 + SECOND // 5, 100.0, 2)
+    builder.add_trade(T0 + SECOND // 2, 102.0, 1)
+    builder.add_trade(T0 + SECOND * 3 // 4, 99.0, 3)
+    assert closed == []
+    builder.add_trade(T0 + SECOND, 101.0, 1)
+    assert closed == [Bar("NQU5", 1, T0, 100.0, 102.0, 99.0, 99.0, 6, 3)]
+    assert builder.current_bar(1) == Bar(
+        "NQU5", 1, T0 + SECOND, 101.0, 101.0, 101.0, 101.0, 1, 1
+    )
+    assert builder.current_bar(60) == Bar(
+        "NQU5", 60, T0, 100.0, 102.0, 99.0, 101.0, 7, 4
+    )
+
+
+def test_boundaries_close_the_open_bar_then_flat_bars(builder):
+    builder.add_trade(T0 + 10, 100.0, 1)
+    builder.add_trade(T0 + 20, 101.0, 1)
+    one_second = builder.intervals.index(1)
+    builder.on_boundary(one_second, T0 + SECOND)
+    builder.on_boundary(one_second, T0 + 2 * SECOND)
+    builder.on_boundary(one_second, T0 + 3 * SECOND)
+    assert builder.bars(1) == [
+        Bar("NQU5", 1, T0, 100.0, 101.0, 100.0, 101.0, 2, 2),
+        Bar("NQU5", 1, T0 + SECOND, 101.0, 101.0, 101.0, 101.0, 0, 0),
+        Bar("NQU5", 1, T0 + 2 * SECOND, 101.0, 101.0, 101.0, 101.0, 0, 0),
+    ]
+    assert builder.bars(60) == []
+    assert builder.current_bar(60).trades == 2
+
+
+def test_no_flat_bar_before_the_first_trade_or_twice_per_boundary(builder):
+    one_second = builder.intervals.index(1)
+    builder.on_boundary(one_second, T0)
+    assert builder.bars(1) == []
+    builder.add_trade(T0 - SECOND // 2, 100.0, 1)
+    builder.on_boundary(one_second, T0)
+    builder.on_boundary(one_second, T0)
+    assert [bar.start for bar in builder.bars(1)] == [T0 - SECOND]
+
+
+def test_a_late_trade_does_not_reopen_a_closed_bar(builder):
+    builder.add_trade(T0 + 10, 100.0, 1)
+    builder.on_boundary(builder.intervals.index(1), T0 + SECOND)
+    builder.add_trade(T0 + 20, 99.0, 1)  # stamped inside the closed bar
+    assert builder.current_bar(1).start == T0 + SECOND
+    assert builder.last_bar(1).close == 100.0
+
+
+def test_a_failing_listener_does_not_stop_the_others(builder):
+    closed = []
+    builder.on_bar(lambda bar: 1 / 0)
+    builder.on_bar(closed.append)
+    builder.add_trade(T0, 100.0, 1)
+    builder.add_trade(T0 + SECOND, 101.0, 1)
+    assert [bar.close for bar in closed] == [100.0]
+
+
+def test_seed_matches_the_streaming_bars(builder):
+    rng = np.random.default_rng(7)
+    times = T0 + np.sort(rng.integers(0, 5 * SECOND, 200))
+    prices = 100.0 + rng.integers(-20, 20, 200) * 0.25
+    qtys = rng.integers(1, 5, 200)
+    for time_ns, price, qty in zip(times.tolist(), prices.tolist(), qtys.tolist()):
+        builder.add_trade(time_ns, price, qty)
+    seeded = BarBuilder("NQU5", intervals=(1,))
+    seeded.seed(times, prices, qtys)
+    assert seeded.bars(1) == builder.bars(1) + [builder.current_bar(1)]
+
+
+def test_ohlc_matches_the_streaming_bars(builder):
+    rng = np.random.default_rng(7)
+    times = T0 + np.sort(rng.integers(0, 5 * SECOND, 200))
+    prices = 100.0 + rng.integers(-20, 20, 200) * 0.25
+    qtys = rng.integers(1, 5, 200)
+    for time_ns, price, qty in zip(times.tolist(), prices.tolist(), qtys.tolist()):
+        builder.add_trade(time_ns, price, qty)
+    streamed = builder.bars(1) + [builder.current_bar(1)]
+    columns = ohlc(times, prices, 1, qtys)
+    assert [tuple(bar[2:]) for bar in streamed] == list(
+        zip(*(column.tolist() for column in columns))
+    )
+
+
+def test_seed_keeps_the_bar_in_progress_open():
+    builder = BarBuilder("NQU5", intervals=(1,))
+    now = time.time_ns() + 60 * SECOND  # still open whenever seed() runs
+    builder.seed([T0, T0 + 1, T0 + SECOND, now], [100.0, 101.0, 102.0, 103.0])
+    assert [bar.close for bar in builder.bars(1)] == [101.0, 102.0]
+    assert builder.current_bar(1).start == now - now % SECOND
+    assert builder.last_close == 103.0
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from contracts import ContractRegistry, ContractSpec
+
+
+@pytest.mark.parametrize(
+    "cached",
+    [
+        {"NQU5": {"product": "NQU5", "exchange": 1, "tickSize": 25.0}},
+        {"NQU5": ["NQU5", 1, 25.0]},
+        ["NQU5"],
+        "not json",
+    ],
+)
+def test_unusable_cache_is_ignored(tmp_path, cached):
+    path = tmp_path / "contracts.json"
+    path.write_text(cached if isinstance(cached, str) else json.dumps(cached))
+    registry = ContractRegistry(str(path))
+    assert registry.specs == {}
+
+
+def test_cache_round_trip(tmp_path):
+    path = str(tmp_path / "contracts.json")
+    registry = ContractRegistry(path)
+    registry.specs["NQU5"] = ContractSpec("NQU5", 1, 25.0, 5.0, "USD", price_scale=4)
+    registry.save()
+    spec = ContractRegistry(path).get("NQU5")
+    assert spec.as_dict() == registry.specs["NQU5"].as_dict()
+    assert spec.display_tick == 6.25
+
+
+@pytest.mark.parametrize(
+    "tick_size, price_scale",
+    [(25.0, 100), (0.25, 1), (1.0, 100), (0.5, 1000), (1.5625, 100), (0.1, 10)],
+)
+def test_ticks_round_trip(tick_size, price_scale):
+    spec = ContractSpec("NQU5", 1, tick_size, price_scale=price_scale)
+    for ticks in range(-5_000, 5_000_000, 997):
+        price = spec.from_ticks(ticks)
+        assert spec.to_ticks(price) == ticks
+        assert spec.round_price(price) == pytest.approx(price)
+
+
+def test_to_ticks_rounds_to_the_nearest_tick():
+    spec = ContractSpec("NQU5", 1, 25.0)
+    assert spec.to_ticks(2_362_512.0) == 94_500
+    assert spec.to_ticks(2_362_513.0) == 94_501
+    assert spec.round_price(2_362_513.0) == 2_362_525.0
+    assert spec.round_display(23_625.13) == 23_625.25
+
+
+@pytest.mark.parametrize("tick_size, price_scale", [(25.0, 100), (0.25, 1), (1.0, 4)])
+def test_display_ticks_round_trip(tick_size, price_scale):
+    spec = ContractSpec("NQU5", 1, tick_size, price_scale=price_scale)
+    for ticks in range(-5_000, 5_000_000, 997):
+        display = spec.ticks_to_display(ticks)
+        assert spec.display_to_ticks(display) == ticks
+        assert spec.to_ticks(spec.from_display(display)) == ticks
+        assert display == pytest.approx(spec.to_display(spec.from_ticks(ticks)))
@@ -0,0 +1,99 @@
+import socket
+import struct
+
+import pytest
+
+import NinjaApiMessages_pb2
+from frame_buffer import FrameBuffer, peek_header
+
+
+def frame(body: bytes) -> bytes:
+    return struct.pack("i", len(body)) + body
+
+
+@pytest.fixture
+def pair():
+    left, right = socket.socketpair()
+    yield left, right
+    left.close()
+    right.close()
+
+
+def receive(buffer, sock, count):
+    # Reads until count frames arrived, copying them out of the buffer
+    frames = []
+    while len(frames) < count:
+        assert buffer.recv_into(sock) > 0
+        frames.extend(bytes(body) for body in buffer.frames())
+    return frames
+
+
+def test_frames_split_across_reads(pair):
+    left, right = pair
+    bodies = [b"a" * 5, b"", b"b" * 300, b"c"]
+    wire = b"".join(map(frame, bodies))
+    buffer = FrameBuffer()
+    frames = []
+    for i in range(0, len(wire), 3):
+        left.sendall(wire[i : i + 3])
+        assert buffer.recv_into(right) > 0
+        frames.extend(bytes(body) for body in buffer.frames())
+    assert frames == bodies
+    assert len(buffer) == 0
+
+
+def test_partial_frames_are_compacted_in_a_small_buffer(pair):
+    left, right = pair
+    bodies = [bytes([i]) * 10 for i in range(20)]
+    left.sendall(b"".join(map(frame, bodies)))
+    buffer = FrameBuffer(32)
+    assert receive(buffer, right, len(bodies)) == bodies
+    assert len(buffer.buffer) == 32
+
+
+def test_frame_larger_than_the_buffer_grows_it(pair):
+    left, right = pair
+    bodies = [b"x" * 100, b"y" * 3]
+    left.sendall(b"".join(map(frame, bodies)))
+    buffer = FrameBuffer(16)
+    assert receive(buffer, right, len(bodies)) == bodies
+    assert len(buffer.buffer) >= 104
+
+
+def test_closed_peer_reads_nothing(pair):
+    left, right = pair
+    left.close()
+    assert FrameBuffer().recv_into(right) == 0
+
+
+@pytest.mark.parametrize(
+    "msg_type, payload",
+    [
+        (NinjaApiMessages_pb2.Header.MARKET_UPDATES, b"\x0a\x03abc"),
+        (NinjaApiMessages_pb2.Header.HEARTBEAT, b""),
+        (NinjaApiMessages_pb2.Header.ERROR, b"payload"),  # the proto3 default
+        (300, b"z" * 200),  # a two byte varint
+    ],
+)
+def test_peek_header_matches_the_parsed_container(msg_type, payload):
+    container = NinjaApiMessages_pb2.MsgContainer()
+    container.header.msgType = msg_type
+    container.payload = payload
+    wire = memoryview(container.SerializeToString())
+    peeked_type, peeked_payload = peek_header(wire)
+    parsed = NinjaApiMessages_pb2.MsgContainer.FromString(bytes(wire))
+    assert peeked_type == parsed.header.msgType == msg_type
+    assert bytes(peeked_payload) == parsed.payload == payload
+    assert isinstance(peeked_payload, memoryview)  # a slice, not a copy
+
+
+def test_peek_header_skips_unknown_fields():
+    container = NinjaApiMessages_pb2.MsgContainer()
+    container.header.msgType = NinjaApiMessages_pb2.Header.HEARTBEAT
+    container.payload = b"body"
+    # unknown varint, fixed32 and length delimited fields around the known ones
+    extra = b"\x18\x96\x01" + b"\x25\x00\x00\x00\x00" + b"\x3a\x02hi"
+    wire = memoryview(extra + container.SerializeToString() + extra)
+    msg_type, payload = peek_header(wire)
+    assert msg_type == NinjaApiMessages_pb2.Header.HEARTBEAT
+    assert bytes(payload) == b"body"
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+
+import pytest
+
+import NinjaApiMarketData_pb2
+from market_data import MarketData, MarketState
+
+
+def market_updates(product, bid, ask, trades=()):
+    updates = NinjaApiMarketData_pb2.MarketUpdates()
+    update = updates.marketUpdates.add()
+    update.contract.secDesc = product
+    update.tobUpdate.bidPrice = bid
+    update.tobUpdate.askPrice = ask
+    update.tobUpdate.bidQty = 1
+    update.tobUpdate.askQty = 1
+    for price, qty in trades:
+        trade = update.tradeUpdates.add()
+        trade.tradePrice = price
+        trade.tradeQty = qty
+    return updates.SerializeToString()
+
+
+def test_snapshot_of_an_unseen_product_is_empty():
+    snapshot = MarketData({"NQU5": 1}).snapshot("ESU5")
+    assert snapshot.seq == 0
+    assert (snapshot.bid, snapshot.ask, snapshot.volume) == (None, None, 0)
+
+
+def test_snapshots_never_mix_two_updates():
+    market_data = MarketData({"NQU5": 1})
+    payloads = [
+        market_updates("NQU5", float(i), i + 1.0, [(float(i), 1)])
+        for i in range(1, 5_001)
+    ]
+    done = threading.Event()
+    torn = []
+
+    def read():
+        while not done.is_set():
+            snapshot = market_data.snapshot("NQU5")
+            if snapshot.seq and (
+                snapshot.seq & 1
+                or snapshot.ask != snapshot.bid + 1
+                or snapshot.trade_price != snapshot.bid
+                or snapshot.volume != snapshot.seq // 2
+            ):
+                torn.append(snapshot)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    for payload in payloads:
+        market_data.on_market_updates(payload)
+    done.set()
+    reader.join()
+    assert torn == []
+    assert market_data.snapshot("NQU5").bid == 5_000.0
+
+
+def test_clear_and_feed_updates_keep_seq_consistent():
+    market_data = MarketData({"NQU5": 1})
+    state = market_data.state("NQU5")
+    payload = market_updates("NQU5", 100.0, 101.0, [(100.5, 2)])
+    rounds = 2_000
+
+    def clear():
+        for _ in range(rounds):
+            market_data.clear(state)
+
+    clearer = threading.Thread(target=clear)
+    clearer.start()
+    for _ in range(rounds):
+        market_data.on_market_updates(payload)
+    clearer.join()
+    assert state.seq == 4 * rounds
+    assert state.volume == 2 * rounds
+    assert market_data.snapshot("NQU5").seq == state.seq
+
+
+def test_snapshot_is_bounded_when_seq_stays_odd():
+    state = MarketState("NQU5")
+    state.seq = 3  # a writer that died half way through an update
+    state.bid = 100.0
+    snapshot = state.snapshot()
+    assert snapshot.seq == 3
+    assert snapshot.bid == 100.0
+
+
+def test_timed_out_and_cancelled_async_waits_unregister():
+    market_data = MarketData({"NQU5": 1})
+
+    async def scenario():
+        for _ in range(5):
+            snapshot = await market_data.wait_for_update_async("NQU5", timeout=0.01)
+            assert snapshot.seq == 0
+        waiting = asyncio.create_task(market_data.wait_for_update_async("NQU5"))
+        await asyncio.sleep(0.01)
+        assert len(market_data.async_waiters) == 1
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(scenario())
+    assert market_data.async_waiters == []
+
+
+def test_async_wait_returns_the_next_update():
+    market_data = MarketData({"NQU5": 1})
+
+    async def scenario():
+        waiting = asyncio.create_task(market_data.wait_for_update_async("NQU5"))
+        await asyncio.sleep(0.01)
+        market_data.on_market_updates(market_updates("NQU5", 100.0, 101.0))
+        return await asyncio.wait_for(waiting, 1)
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot.seq == 2
+    assert (snapshot.bid, snapshot.ask) == (100.0, 101.0)
+    assert market_data.async_waiters == []
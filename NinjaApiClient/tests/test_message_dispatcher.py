@@ -0,0 +1,52 @@
+import NinjaApiMessages_pb2
+from ninja_api_client import MessageDispatcher
+
+MsgType = NinjaApiMessages_pb2.Header.MsgType
+
+
+def test_dispatch_routes_payloads_by_type():
+    dispatcher = MessageDispatcher()
+    seen = []
+    dispatcher.register_handler(
+        MsgType.HEARTBEAT, lambda payload: seen.append(("hb", bytes(payload)))
+    )
+    dispatcher.register_handler(
+        MsgType.ERROR, lambda payload: seen.append(("err", bytes(payload)))
+    )
+    for msg_type, payload in ((MsgType.ERROR, b"e"), (MsgType.HEARTBEAT, b"h")):
+        assert dispatcher.wants(msg_type)
+        dispatcher.dispatch(msg_type, memoryview(payload))
+    assert seen == [("err", b"e"), ("hb", b"h")]
+
+
+def test_register_handler_replaces_the_previous_one():
+    dispatcher = MessageDispatcher()
+    seen = []
+    dispatcher.register_handler(MsgType.HEARTBEAT, lambda payload: seen.append(1))
+    dispatcher.register_handler(MsgType.HEARTBEAT, lambda payload: seen.append(2))
+    dispatcher.dispatch(MsgType.HEARTBEAT, b"")
+    assert seen == [2]
+
+
+def test_wants_counts_every_frame_and_the_unhandled_ones():
+    dispatcher = MessageDispatcher()
+    dispatcher.register_handler(MsgType.HEARTBEAT, lambda payload: None)
+    assert dispatcher.wants(MsgType.HEARTBEAT)
+    assert dispatcher.wants(MsgType.HEARTBEAT)
+    assert not dispatcher.wants(MsgType.ERROR)
+    stats = dispatcher.stats
+    assert stats.received == 3
+    assert stats.unhandled == 1
+    assert stats.by_type == {MsgType.HEARTBEAT: 2, MsgType.ERROR: 1}
+
+
+def test_summary_names_the_top_types_and_starts_a_new_window():
+    dispatcher = MessageDispatcher()
+    for _ in range(3):
+        dispatcher.wants(MsgType.HEARTBEAT)
+    dispatcher.wants(MsgType.ERROR)
+    summary = dispatcher.stats.summary()
+    assert summary.startswith("Received 4 msgs (4 unhandled)")
+    assert summary.endswith("Top: HEARTBEAT: 3, ERROR: 1")
+    assert dispatcher.stats.window_received == 4
+    assert dispatcher.stats.rate() == 0.0
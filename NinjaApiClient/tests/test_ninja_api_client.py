@@ -0,0 +1,99 @@
+import socket
+import struct
+import time
+
+import pytest
+
+import NinjaApiMessages_pb2
+from ninja_api_client import NinjaApiClient
+
+
+class Client(NinjaApiClient):
+    def run(self):
+        pass
+
+
+@pytest.fixture
+def server():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    yield listener
+    listener.close()
+
+
+@pytest.fixture
+def client(server):
+    client = Client(*server.getsockname())
+    peer, _ = server.accept()
+    yield client, peer
+    client.disconnect()
+    peer.close()
+
+
+def heartbeat():
+    container = NinjaApiMessages_pb2.MsgContainer()
+    container.header.msgType = NinjaApiMessages_pb2.Header.HEARTBEAT
+    serialized = container.SerializeToString()
+    return struct.pack("i", len(serialized)) + serialized
+
+
+def test_wait_for_data_wakes_when_a_frame_arrives(client):
+    client, peer = client
+    client.register_handler(NinjaApiMessages_pb2.Header.HEARTBEAT, lambda payload: None)
+    peer.sendall(heartbeat())
+    assert client.wait_for_data(5)
+    msg = client.recv_msg()
+    assert msg.header.msgType == NinjaApiMessages_pb2.Header.HEARTBEAT
+
+
+def test_wait_for_data_blocks_until_timeout_when_idle(client):
+    client, _ = client
+    start = time.monotonic()
+    assert not client.wait_for_data(0.2)
+    assert time.monotonic() - start >= 0.15
+    assert client.recv_msg() is None
+
+
+def test_poll_dispatches_available_frames(client):
+    client, peer = client
+    received = []
+    client.register_handler(NinjaApiMessages_pb2.Header.HEARTBEAT, received.append)
+    peer.sendall(heartbeat() * 3)
+    deadline = time.monotonic() + 5
+    while len(received) < 3 and time.monotonic() < deadline:
+        client.poll(0.1)
+    assert len(received) == 3
+    assert client.stats.received == 3
+
+
+def test_poll_blocks_until_timeout_when_idle(client):
+    client, _ = client
+    start = time.monotonic()
+    assert client.poll(0.2) == 0
+    assert time.monotonic() - start >= 0.15
+
+
+def test_failed_reconnect_keeps_the_closed_socket(client, server):
+    client, _ = client
+    client.close_transport()
+    closed = client.sock
+    server.close()
+    assert client.connect() is False
+    assert client.sock is closed
+    assert not client.connected
+    listener = socket.create_server(("127.0.0.1", 0))
+    client.port = listener.getsockname()[1]
+    try:
+        assert client.connect() is True
+        assert client.sock is not closed and client.connected
+    finally:
+        listener.close()
+
+
+def test_first_connect_failure_does_not_raise(server):
+    address = server.getsockname()
+    server.close()
+    client = Client(*address)
+    assert not client.connected
+    assert not hasattr(client, "sock")
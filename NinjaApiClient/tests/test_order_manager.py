@@ -0,0 +1,382 @@
+import asyncio
+import random
+import threading
+import time
+
+import pytest
+
+import NinjaApiCommon_pb2
+import NinjaApiOrderHandling_pb2
+from order_manager import (
+    SHARDS,
+    Order,
+    OrderHandle,
+    OrderManager,
+    OrderView,
+    ShardedMap,
+)
+
+BUY = NinjaApiCommon_pb2.Side.BUY
+SELL = NinjaApiCommon_pb2.Side.SELL
+
+
+def order_msg(msg, orderNo, side, qty, price, product="NQU5", account="A", prefix="w"):
+    # Fills the fields OrderAddEvent, OrderChangeEvent and ActiveOrder share
+    msg.orderNo = orderNo
+    msg.contract.secDesc = product
+    msg.contract.exchange = 1
+    msg.side = side
+    msg.qty = qty
+    msg.price = price
+    msg.prefix = prefix
+    msg.account = account
+    return msg
+
+
+def add_event(*args, **kwargs):
+    return order_msg(NinjaApiOrderHandling_pb2.OrderAddEvent(), *args, **kwargs)
+
+
+def change_event(*args, **kwargs):
+    return order_msg(NinjaApiOrderHandling_pb2.OrderChangeEvent(), *args, **kwargs)
+
+
+def fill_notice(orderNo, qty, partial):
+    notice = NinjaApiOrderHandling_pb2.FillNotice()
+    notice.orderNo = orderNo
+    notice.qty = qty
+    notice.isPartialFill = partial
+    return notice
+
+
+def cancel_event(orderNo):
+    event = NinjaApiOrderHandling_pb2.OrderCancelEvent()
+    event.orderNo = orderNo
+    return event
+
+
+@pytest.fixture
+def orders():
+    return OrderManager()
+
+
+def test_sharded_map_copies_only_the_changed_shards():
+    base = ShardedMap.from_items((f"o{i}", i) for i in range(1_000))
+    changed = base.with_changes({"o1": -1, "new": 7, "o2": None, "missing": None})
+    assert len(base) == 1_000
+    assert base["o1"] == 1 and "new" not in base and "o2" in base
+    assert len(changed) == 1_000
+    assert changed["o1"] == -1 and changed["new"] == 7
+    assert "o2" not in changed and changed.get("o2") is None
+    assert dict(changed.items()) == {
+        **{f"o{i}": i for i in range(1_000) if i != 2},
+        "o1": -1,
+        "new": 7,
+    }
+    assert sorted(changed.values()) == sorted(dict(changed.items()).values())
+    touched = {hash(key) % SHARDS for key in ("o1", "new", "o2", "missing")}
+    for i, (old, new) in enumerate(zip(base.shards, changed.shards)):
+        assert (old is new) == (i not in touched)
+
+
+def test_empty_sharded_map():
+    empty = ShardedMap()
+    assert len(empty) == 0 and list(empty) == [] and empty.get("x") is None
+    assert len(empty.with_changes({"x": None})) == 0
+    with pytest.raises(KeyError):
+        empty["x"]
+
+
+def test_add_change_and_fills(orders):
+    orders.on_add(add_event("1", BUY, 3, 2_345_000.0))
+    assert orders.active["1"] == Order(
+        "1", "NQU5", 1, BUY, 3, 2_345_000.0, "w", "A", ""
+    )
+    orders.on_change(change_event("1", BUY, 3, 2_345_025.0))
+    assert orders.active["1"].price == 2_345_025.0
+    orders.on_fill(fill_notice("1", 1, partial=True))
+    assert (orders.active["1"].qty, orders.active["1"].filled) == (2, 1)
+    orders.on_change(change_event("1", BUY, 2, 2_345_050.0))
+    assert orders.active["1"].filled == 1  # kept across a change
+    orders.on_fill(fill_notice("1", 2, partial=False))
+    assert "1" not in orders.active
+    orders.on_fill(fill_notice("2", 1, partial=False))  # not a working order
+    assert orders.events == 6
+    assert orders.version == 5
+
+
+def test_cancel_and_mass_cancel(orders):
+    for orderNo in "1234":
+        orders.on_add(add_event(orderNo, SELL, 1, 2_345_000.0))
+    orders.on_cancel(cancel_event("1"))
+    mass_cancel = NinjaApiOrderHandling_pb2.MassCancelEvent()
+    mass_cancel.canceledOrders.extend([cancel_event("2"), cancel_event("3")])
+    orders.on_mass_cancel(mass_cancel)
+    assert list(orders.active) == ["4"]
+
+
+def test_a_held_map_is_not_changed_by_later_events(orders):
+    orders.on_add(add_event("1", BUY, 1, 2_345_000.0))
+    held = orders.active
+    orders.on_add(add_event("2", BUY, 1, 2_345_000.0))
+    orders.on_cancel(cancel_event("1"))
+    assert list(held) == ["1"]
+    assert list(orders.active) == ["2"]
+
+
+def test_reconcile_replaces_the_state_and_counts_corrections(orders):
+    orders.on_add(add_event("1", BUY, 3, 2_345_000.0))
+    orders.on_fill(fill_notice("1", 1, partial=True))
+    orders.on_add(add_event("2", BUY, 1, 2_345_000.0))
+    active = [
+        order_msg(NinjaApiOrderHandling_pb2.ActiveOrder(), "1", BUY, 2, 2_345_000.0),
+        order_msg(NinjaApiOrderHandling_pb2.ActiveOrder(), "3", SELL, 1, 2_346_000.0),
+        order_msg(NinjaApiOrderHandling_pb2.ActiveOrder(), "4", SELL, 0, 2_346_000.0),
+    ]
+    orders.reconcile(active)
+    assert sorted(orders.active) == ["1", "3"]
+    assert orders.active["1"].filled == 1  # the events' fills survive
+    assert orders.corrections == 2  # 2 dropped, 3 added
+    assert orders.reconciles == 1
+    orders.reconcile(active)
+    assert orders.corrections == 2
+
+
+def test_events_match_a_dict_of_the_same_events(orders):
+    expected = {}
+    for i in range(200):
+        orderNo = str(i % 50)
+        if i % 7 == 3:
+            orders.on_cancel(cancel_event(orderNo))
+            expected.pop(orderNo, None)
+        else:
+            orders.on_change(change_event(orderNo, BUY, i + 1, 2_345_000.0))
+            expected[orderNo] = Order(
+                orderNo, "NQU5", 1, BUY, i + 1, 2_345_000.0, "w", "A", ""
+            )
+        assert dict(orders.active.items()) == expected
+        assert len(orders.active) == len(expected)
+
+
+def test_a_held_view_is_not_changed_by_later_events(orders):
+    orders.on_add(add_event("1", BUY, 1, 2_345_000.0))
+    view = orders.view
+    orders.on_add(add_event("2", BUY, 1, 2_345_000.0))
+    orders.on_cancel(cancel_event("1"))
+    assert list(view.active) == ["1"]
+    assert list(orders.active) == ["2"]
+
+
+def test_apply_matches_a_rebuilt_view():
+    view = OrderView.build({})
+    active = {}
+    for i in range(200):
+        orderNo = str(i % 50)
+        if i % 7 == 3:
+            changes = {orderNo: None}
+        else:
+            changes = {
+                orderNo: Order(orderNo, "NQU5", 1, BUY, i + 1, 1.0, "w", "A", "")
+            }
+        view = view.apply(changes)
+        for key, order in changes.items():
+            if order is None:
+                active.pop(key, None)
+            else:
+                active[key] = order
+        assert dict(view.active.items()) == active
+
+
+def orderadd(side, qty, price, product="NQU5", account="A"):
+    add = NinjaApiOrderHandling_pb2.OrderAdd()
+    add.account = account
+    add.contract.secDesc = product
+    add.side = side
+    add.qty = qty
+    add.price = price
+    add.prefix = "w"
+    return add
+
+
+def test_add_event_resolves_the_oldest_matching_handle(orders):
+    first = orders.track(orderadd(BUY, 1, 2_345_000.0), tag="first")
+    other = orders.track(orderadd(SELL, 1, 2_345_000.0))
+    second = orders.track(orderadd(BUY, 1, 2_345_000.0), tag="second")
+    orders.on_add(add_event("1", BUY, 1, 2_345_000.0))
+    assert first.done() and first.wait(0) == "1"
+    assert first.status == OrderHandle.ACKED and first.latency() >= 0
+    assert not other.done() and not second.done()
+    assert orders.active["1"].tag == "first"
+    assert orders.pending_qty == {("A", "NQU5", BUY): 1, ("A", "NQU5", SELL): 1}
+    assert orders.acks == 1
+
+
+def test_a_triggered_add_does_not_resolve_a_handle(orders):
+    handle = orders.track(orderadd(BUY, 1, 2_345_000.0))
+    event = add_event("2", BUY, 1, 2_345_000.0)
+    event.triggerOrderNo = "1"
+    orders.on_add(event)
+    assert not handle.done()
+    assert "2" in orders.active
+
+
+def test_add_failure_fails_the_handle(orders):
+    handle = orders.track(orderadd(BUY, 1, 2_345_000.0))
+    failure = NinjaApiOrderHandling_pb2.OrderAddFailure()
+    failure.reason = "price out of range"
+    failure.orderNo = "9"
+    failure.contract.secDesc = "NQU5"
+    failure.account = "A"
+    failure.side = BUY
+    failure.qty = 1
+    failure.price = 2_345_000.0
+    orders.on_add_failure(failure)
+    assert handle.wait(0) is None
+    assert (handle.status, handle.reason) == (OrderHandle.FAILED, "price out of range")
+    assert handle.failed_orderNo == "9"
+    assert orders.pending_qty == {}
+
+
+def test_add_reject_fails_the_oldest_handle_on_the_contract(orders):
+    other = orders.track(orderadd(BUY, 1, 2_345_000.0, product="ESU5"))
+    handle = orders.track(orderadd(SELL, 2, 2_345_000.0))
+    reject = NinjaApiOrderHandling_pb2.OrderRejectEvent()
+    reject.action = NinjaApiOrderHandling_pb2.OrderRejectEvent.ADD
+    reject.contract.secDesc = "NQU5"
+    reject.account = "A"
+    reject.reason = "risk"
+    assert orders.on_reject(reject) is handle
+    assert handle.status == OrderHandle.FAILED and not other.done()
+
+
+def test_wait_times_out_while_pending(orders):
+    handle = orders.track(orderadd(BUY, 1, 2_345_000.0))
+    started = time.monotonic()
+    assert handle.wait(0.05) is None
+    assert time.monotonic() - started >= 0.05
+    assert handle.status == OrderHandle.PENDING
+
+
+def test_only_the_first_answer_counts(orders):
+    handle = orders.track(orderadd(BUY, 1, 2_345_000.0))
+    orders.fail(handle, "not connected")
+    handle.resolve(OrderHandle.ACKED, "1")
+    assert (handle.status, handle.orderNo) == (OrderHandle.FAILED, None)
+    assert handle.reason == "not connected"
+    assert not orders.pending
+
+
+def test_callbacks_run_once_resolved_or_at_once(orders):
+    handle = orders.track(orderadd(BUY, 1, 2_345_000.0))
+    seen = []
+    handle.add_done_callback(lambda done: 1 / 0)
+    handle.add_done_callback(lambda done: seen.append(done.orderNo))
+    orders.on_add(add_event("1", BUY, 1, 2_345_000.0))
+    handle.add_done_callback(lambda done: seen.append("late"))
+    assert seen == ["1", "late"]
+
+
+def test_await_resolves_from_another_thread(orders):
+    handle = orders.track(orderadd(BUY, 1, 2_345_000.0))
+
+    async def scenario():
+        answer = threading.Timer(
+            0.01, orders.on_add, [add_event("1", BUY, 1, 2_345_000.0)]
+        )
+        answer.start()
+        try:
+            return await asyncio.wait_for(handle, 1)
+        finally:
+            answer.join()
+
+    assert asyncio.run(scenario()) == "1"
+
+
+def test_fail_pending_gives_up_on_old_adds(orders):
+    old = orders.track(orderadd(BUY, 1, 2_345_000.0))
+    old.sent_at -= 20 * 10**9
+    recent = orders.track(orderadd(BUY, 1, 2_345_025.0))
+    orders.fail_pending("no answer", time.time_ns() - 10 * 10**9)
+    assert (old.status, old.reason) == (OrderHandle.FAILED, "no answer")
+    assert not recent.done()
+    orders.fail_pending("connection lost")
+    assert recent.reason == "connection lost"
+    assert orders.failures == 2 and orders.pending_qty == {}
+
+
+def rebuilt(view):
+    return OrderView.build(dict(view.active.items()))
+
+
+def assert_indexes_current(view):
+    expected = rebuilt(view)
+    for name in ("by_account", "by_contract", "by_prefix", "working_qty"):
+        assert dict(getattr(view, name).items()) == dict(
+            getattr(expected, name).items()
+        ), name
+
+
+def test_indexes_follow_the_events(orders):
+    orders.on_add(add_event("1", BUY, 2, 2_345_000.0, prefix="G"))
+    orders.on_add(add_event("2", BUY, 1, 2_344_000.0, prefix="H"))
+    orders.on_add(add_event("3", SELL, 1, 2_346_000.0, account="B", prefix="G"))
+    assert set(orders.for_account("A")) == {"1", "2"}
+    assert set(orders.for_contract("A", "NQU5", BUY)) == {"1", "2"}
+    assert set(orders.for_prefix("A", "G")) == {"1"}
+    assert orders.view.working_qty[("A", "NQU5", BUY)] == 3
+    orders.on_change(change_event("2", SELL, 1, 2_346_000.0, prefix="G"))
+    assert set(orders.for_contract("A", "NQU5", BUY)) == {"1"}
+    assert set(orders.for_prefix("A", "G")) == {"1", "2"}
+    assert orders.for_prefix("A", "H") == {}
+    orders.on_fill(fill_notice("1", 1, partial=True))
+    assert orders.for_account("A")["1"].qty == 1
+    assert orders.view.working_qty[("A", "NQU5", BUY)] == 1
+    orders.on_cancel(cancel_event("1"))
+    assert ("A", "NQU5", BUY) not in orders.view.working_qty
+    assert orders.for_contract("A", "NQU5", BUY) == {}
+    assert_indexes_current(orders.view)
+
+
+def test_an_index_held_by_a_reader_is_not_changed(orders):
+    orders.on_add(add_event("1", BUY, 1, 2_345_000.0))
+    held = orders.for_account("A")
+    orders.on_add(add_event("2", BUY, 1, 2_345_000.0))
+    orders.on_cancel(cancel_event("1"))
+    assert set(held) == {"1"}
+    assert set(orders.for_account("A")) == {"2"}
+
+
+def test_apply_keeps_the_indexes_of_random_changes_current():
+    rng = random.Random(5)
+    view = OrderView.build({})
+    for _ in range(300):
+        changes = {}
+        for _ in range(rng.randint(1, 4)):
+            orderNo = str(rng.randrange(40))
+            if rng.random() < 0.3:
+                changes[orderNo] = None
+            else:
+                changes[orderNo] = Order(
+                    orderNo,
+                    rng.choice(["NQU5", "ESU5"]),
+                    1,
+                    rng.choice([BUY, SELL]),
+                    rng.randint(1, 5),
+                    2_345_000.0,
+                    rng.choice("GH"),
+                    rng.choice("AB"),
+                    "",
+                )
+        view = view.apply(changes)
+        assert_indexes_current(view)
+
+
+def test_reconcile_rebuilds_the_indexes(orders):
+    orders.on_add(add_event("1", BUY, 1, 2_345_000.0))
+    active = [
+        order_msg(NinjaApiOrderHandling_pb2.ActiveOrder(), "2", SELL, 2, 2_346_000.0)
+    ]
+    orders.reconcile(active)
+    assert orders.for_contract("A", "NQU5", BUY) == {}
+    assert set(orders.for_contract("A", "NQU5", SELL)) == {"2"}
+    assert orders.view.working_qty == {("A", "NQU5", SELL): 2}
@@ -0,0 +1,167 @@
+import pytest
+
+import NinjaApiOrderHandling_pb2
+import NinjaApiSheets_pb2
+import order_throttle
+from order_throttle import RATE_LIMIT_RECOVERY, SheetRiskBudget, TokenBucket
+
+
+class Clock:
+    # Stands in for the time module of order_throttle, sleep() advances it
+    def __init__(self):
+        self.now = 1_000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(order_throttle, "time", clock)
+    return clock
+
+
+def test_reserve_takes_the_burst_then_reports_the_wait(clock):
+    bucket = TokenBucket(rate=10, burst=5, urgent_reserve=2)
+    assert [bucket.reserve() for _ in range(3)] == [0.0] * 3
+    assert bucket.reserve() == pytest.approx(0.1)
+    clock.now += 0.1
+    assert bucket.reserve() == 0.0
+    assert bucket.sent == 4
+
+
+def test_urgent_requests_may_use_the_reserve(clock):
+    bucket = TokenBucket(rate=10, burst=5, urgent_reserve=2)
+    for _ in range(3):
+        bucket.reserve()
+    assert bucket.reserve() > 0
+    assert bucket.reserve(urgent=True) == 0.0
+    assert bucket.reserve(urgent=True) == 0.0
+    assert bucket.reserve(urgent=True) == pytest.approx(0.1)
+
+
+def test_refill_is_capped_at_the_burst(clock):
+    bucket = TokenBucket(rate=10, burst=5, urgent_reserve=2)
+    bucket.reserve()
+    clock.now += 60
+    bucket.reserve()
+    assert bucket.tokens == 4
+    assert TokenBucket(rate=10, burst=1, urgent_reserve=2).burst == 3
+
+
+def test_refund_returns_the_token(clock):
+    bucket = TokenBucket(rate=10, burst=3, urgent_reserve=2)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() > 0
+    bucket.refund()
+    assert bucket.sent == 0
+    assert bucket.reserve() == 0.0
+    bucket.refund()
+    bucket.refund()
+    assert bucket.tokens == 3
+
+
+def test_acquire_sleeps_until_a_token_refills(clock):
+    bucket = TokenBucket(rate=4, burst=3, urgent_reserve=2)
+    bucket.acquire()
+    bucket.acquire()
+    assert sum(clock.slept) == pytest.approx(0.25)
+    assert (bucket.delayed, bucket.delay) == (1, pytest.approx(0.25))
+
+
+def test_rate_limit_errors_halve_the_rate_until_recovery(clock):
+    bucket = TokenBucket(rate=16, burst=5, urgent_reserve=2)
+    for rate in (8, 4, 2, 2):
+        bucket.on_rate_limited()
+        assert bucket.rate == rate
+    assert bucket.tokens == 0.0
+    clock.now += RATE_LIMIT_RECOVERY + 1
+    bucket.reserve()
+    assert bucket.rate == 16
+    assert bucket.rate_limited == 4
+
+
+@pytest.fixture
+def budget():
+    budget = SheetRiskBudget(reserve=2)
+    sheets = NinjaApiSheets_pb2.Sheets()
+    for name, products in (("S1", ["NQU5", "ESU5"]), ("S2", ["NQU5"])):
+        sheet = sheets.sheets.add()
+        sheet.name = name
+        for product in products:
+            sheet.contracts.add().secDesc = product
+    budget.update_sheets(sheets.sheets)
+    budget.update_risk(
+        [
+            NinjaApiSheets_pb2.SheetRisk(
+                sheet="S1", clipSize=5, ordersSent=0, maxOrders=10
+            ),
+            NinjaApiSheets_pb2.SheetRisk(sheet="S2", ordersSent=4, maxOrders=8),
+        ]
+    )
+    return budget
+
+
+def add_event(product, sheet, trigger=""):
+    event = NinjaApiOrderHandling_pb2.OrderAddEvent()
+    event.contract.secDesc = product
+    event.sheet = sheet
+    event.triggerOrderNo = trigger
+    return event
+
+
+def test_the_tightest_sheet_limits_a_product(budget):
+    assert budget.remaining("NQU5") == 4
+    assert budget.remaining("ESU5") == 10
+    assert budget.remaining("CLU5") is None
+    assert budget.check("CLU5", 100) is None
+
+
+def test_check_refuses_above_the_clip_size(budget):
+    assert budget.check("NQU5", -6) == "qty 6 above the clip size"
+    assert budget.check("NQU5", 5) is None
+    assert budget.refused == 1
+
+
+def test_in_flight_adds_count_until_answered(budget):
+    assert budget.check("NQU5", 1) is None
+    assert budget.check("NQU5", 1) is None
+    assert budget.remaining("NQU5") == 2
+    assert budget.check("NQU5", 1) == "2 order adds left on the sheet"
+    budget.on_add(add_event("NQU5", "S2"))
+    assert budget.remaining("NQU5") == 2  # one answered, one more sent
+    failure = NinjaApiOrderHandling_pb2.OrderAddFailure()
+    failure.contract.secDesc = "NQU5"
+    budget.on_add_failure(failure)
+    assert budget.remaining("NQU5") == 3
+
+
+def test_urgent_adds_may_use_the_reserve(budget):
+    for _ in range(2):
+        assert budget.check("NQU5", 1) is None
+    assert budget.check("NQU5", 1) is not None
+    assert budget.check("NQU5", 1, urgent=True) is None
+    assert budget.check("NQU5", 1, urgent=True) is None
+    assert budget.check("NQU5", 1, urgent=True) == "0 order adds left on the sheet"
+
+
+def test_other_adds_count_against_the_sheet_but_not_in_flight(budget):
+    budget.on_add(add_event("ESU5", "S1", trigger="7"))
+    budget.on_add(add_event("ESU5", "S1"))  # another client's add
+    assert budget.remaining("ESU5") == 8
+    assert budget.in_flight["ESU5"] == 0
+
+
+def test_a_risk_response_replaces_the_counts(budget):
+    budget.check("NQU5", 1)
+    budget.clear_in_flight()
+    risk = NinjaApiSheets_pb2.SheetRisk(sheet="S2", ordersSent=1, maxOrders=8)
+    budget.update_risk([risk])
+    assert budget.remaining("NQU5") == 7
+    assert "S2: 7 adds left" in budget.summary()
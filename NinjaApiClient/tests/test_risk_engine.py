@@ -0,0 +1,138 @@
+import threading
+
+import pytest
+
+import NinjaApiCommon_pb2
+import NinjaApiOrderHandling_pb2
+from contracts import ContractRegistry, ContractSpec
+from market_data import MarketData
+from order_manager import Order, OrderManager
+from risk_engine import RiskEngine, RiskLimits, merge_limits
+
+BUY = NinjaApiCommon_pb2.Side.BUY
+SELL = NinjaApiCommon_pb2.Side.SELL
+
+
+@pytest.fixture
+def risk():
+    contracts = ContractRegistry()
+    contracts.specs["NQU5"] = ContractSpec(
+        "NQU5", 1, 25.0, high_limit=2_500_000.0, low_limit=2_200_000.0
+    )
+    return RiskEngine(
+        OrderManager(),
+        contracts,
+        MarketData({"NQU5": 1}),
+        RiskLimits(max_position=3, max_order_qty=2, max_ticks_from_market=40),
+    )
+
+
+def working(orderNo, side, qty, price=2_345_000.0):
+    return Order(orderNo, "NQU5", 1, side, qty, price, "w", "A", "")
+
+
+def orderadd(side, qty, price=2_345_000.0):
+    add = NinjaApiOrderHandling_pb2.OrderAdd()
+    add.account = "A"
+    add.contract.secDesc = "NQU5"
+    add.side = side
+    add.qty = qty
+    add.price = price
+    return add
+
+
+def fill(side, qty):
+    notice = NinjaApiOrderHandling_pb2.FillNotice()
+    notice.account = "A"
+    notice.contract.secDesc = "NQU5"
+    notice.side = side
+    notice.qty = qty
+    return notice
+
+
+def test_merge_limits_takes_the_tightest_set_limit():
+    assert merge_limits(
+        RiskLimits(5, None, 10), RiskLimits(3, 4, None), RiskLimits()
+    ) == RiskLimits(3, 4, 10)
+
+
+def test_limits_per_account_and_product(risk):
+    risk.set_limits(account="A", max_order_qty=1)
+    risk.set_limits(product="NQU5", max_position=2)
+    assert risk.limits("A", "NQU5") == RiskLimits(2, 1, 40)
+    assert risk.limits("B", "NQU5") == RiskLimits(2, 2, 40)
+
+
+def test_order_qty(risk):
+    assert risk.check("A", "NQU5", BUY, 2, 2_345_000.0) is None
+    assert "qty 3 above 2" in risk.check("A", "NQU5", BUY, 3, 2_345_000.0)
+
+
+def test_limit_prices(risk):
+    assert "above the limit" in risk.check("A", "NQU5", BUY, 1, 2_600_000.0)
+    assert "below the limit" in risk.check("A", "NQU5", SELL, 1, 2_100_000.0)
+
+
+def test_distance_from_the_last_trade(risk):
+    assert risk.check("A", "NQU5", BUY, 1, 2_300_000.0) is None  # no trade yet
+    risk.market_data.state("NQU5").trade_price = 2_345_000.0
+    assert risk.check("A", "NQU5", BUY, 1, 2_344_000.0) is None  # 40 ticks
+    assert "41 ticks" in risk.check("A", "NQU5", BUY, 1, 2_343_975.0)
+
+
+def test_position_counts_working_and_pending_orders(risk):
+    risk.orders.put(working("1", BUY, 2))
+    assert risk.check("A", "NQU5", BUY, 1, 2_345_000.0) is None
+    risk.orders.track(orderadd(BUY, 1))
+    assert "would reach 4" in risk.check("A", "NQU5", BUY, 1, 2_345_000.0)
+    # the other side is held to the position it leaves
+    assert risk.check("A", "NQU5", SELL, 2, 2_345_000.0) is None
+
+
+def test_position_counts_fills_on_top_of_the_reported_position(risk):
+    risk.set_position("A", "NQU5", -2)
+    risk.on_fill(fill(SELL, 1))
+    assert risk.positions[("A", "NQU5")] == -3
+    assert "would reach 4" in risk.check("A", "NQU5", SELL, 1, 2_345_000.0)
+    risk.set_position("A", "NQU5", 0)
+    assert risk.check("A", "NQU5", SELL, 1, 2_345_000.0) is None
+
+
+def test_urgent_orders_are_held_to_the_position_they_leave(risk):
+    risk.set_position("A", "NQU5", 2)
+    risk.orders.put(working("1", BUY, 2))
+    assert risk.check_add(orderadd(SELL, 2), urgent=True) is None
+    assert risk.check_add(orderadd(BUY, 2), urgent=True) is not None
+
+
+def test_change_replaces_the_working_qty(risk):
+    order = working("1", BUY, 2)
+    risk.orders.put(order)
+    risk.orders.put(working("2", BUY, 1))
+    assert risk.check_change("1", order, 2_345_025.0, 2) is None
+    assert "would reach 4" in risk.check_change(
+        "2", working("2", BUY, 1), 2_345_000.0, 2
+    )
+
+
+def test_change_of_an_unknown_order_is_refused(risk):
+    assert "not working" in risk.check_change("9", None, 2_345_000.0, 1)
+    assert risk.unknown == 1
+    assert "1 changes of unknown orders refused" in risk.summary()
+
+
+def test_counters_are_consistent_across_threads(risk):
+    threads = [
+        threading.Thread(
+            target=lambda: [
+                risk.check("A", "NQU5", BUY, 3, 2_345_000.0) for _ in range(2_000)
+            ]
+        )
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert risk.counts["qty"] == 8_000
+    assert risk.refused["qty"] == 8_000
@@ -0,0 +1,95 @@
+import math
+
+import numpy as np
+import pytest
+
+from bar_builder import Bar, ohlc
+from volatility import (
+    RollingVolatility,
+    garman_klass_terms,
+    parkinson_terms,
+    realized_terms,
+)
+
+
+def random_bars(count, seed=3):
+    rng = np.random.default_rng(seed)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.002, count)))
+    open = np.r_[100.0, close[:-1]]
+    high = np.maximum(open, close) * (1 + rng.uniform(0, 0.002, count))
+    low = np.minimum(open, close) * (1 - rng.uniform(0, 0.002, count))
+    return open, high, low, close
+
+
+def window_vol(terms, window):
+    # Recomputes the volatility from the last window terms
+    terms = np.asarray(terms)[-window:]
+    return math.sqrt(terms.mean()) if len(terms) else None
+
+
+@pytest.mark.parametrize("window", [1, 5, 20])
+def test_rolling_values_match_a_window_recompute(window):
+    open, high, low, close = random_bars(200)
+    volatility = RollingVolatility(window)
+    for i in range(len(close)):
+        volatility.add(open[i], high[i], low[i], close[i])
+        end = i + 1
+        gk = garman_klass_terms(open[:end], high[:end], low[:end], close[:end])
+        assert volatility.garman_klass_vol == pytest.approx(window_vol(gk, window))
+        parkinson = parkinson_terms(high[:end], low[:end])
+        assert volatility.parkinson_vol == pytest.approx(window_vol(parkinson, window))
+        realized = realized_terms(close[:end])
+        if i == 0:
+            assert volatility.realized_vol is None
+        else:
+            assert volatility.realized_vol == pytest.approx(
+                window_vol(realized, window)
+            )
+    assert volatility.updates == len(close)
+
+
+def test_seed_then_add_matches_adding_every_bar():
+    open, high, low, close = random_bars(60)
+    added = RollingVolatility(10)
+    for bar in zip(open, high, low, close):
+        added.add(*bar)
+    seeded = RollingVolatility(10)
+    seeded.seed(open[:40], high[:40], low[:40], close[:40])
+    for bar in zip(open[40:], high[40:], low[40:], close[40:]):
+        seeded.add(*bar)
+    assert seeded.garman_klass_vol == pytest.approx(added.garman_klass_vol)
+    assert seeded.parkinson_vol == pytest.approx(added.parkinson_vol)
+    assert seeded.realized_vol == pytest.approx(added.realized_vol)
+
+
+def test_seed_bars_and_add_bar_take_bar_builder_bars():
+    open, high, low, close = random_bars(5)
+    bars = [
+        Bar("NQU5", 60, i * 60 * 10**9, *prices, 1, 1)
+        for i, prices in enumerate(zip(open, high, low, close))
+    ]
+    seeded = RollingVolatility(3)
+    seeded.seed_bars(bars)
+    added = RollingVolatility(3)
+    for bar in bars:
+        added.add_bar(bar)
+    assert seeded.garman_klass_vol == pytest.approx(added.garman_klass_vol)
+    assert seeded.realized_vol == pytest.approx(added.realized_vol)
+
+
+def test_from_trades_uses_the_trade_bars():
+    times = np.arange(0, 10 * 10**9, 10**8)
+    prices = 100.0 + np.sin(np.arange(len(times))) * 0.5
+    volatility = RollingVolatility.from_trades(times, prices, 1, window=4)
+    bars = ohlc(times, prices, 1)
+    expected = RollingVolatility(4)
+    expected.seed(bars.open, bars.high, bars.low, bars.close)
+    assert volatility.parkinson_vol == pytest.approx(expected.parkinson_vol)
+    assert RollingVolatility.from_trades([], [], 1).garman_klass_vol is None
+
+
+def test_bars_without_a_positive_price_are_skipped():
+    volatility = RollingVolatility(3)
+    volatility.add(0.0, 1.0, 0.0, 1.0)
+    assert volatility.updates == 0
+    assert volatility.garman_klass_vol is None